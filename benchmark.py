@@ -0,0 +1,372 @@
+"""
+benchmark.py
+
+Latency and throughput benchmarks for the main code paths:
+
+  collect_pipeline_input     data_pipeline, weather + speed limit for one tick
+  get_speed_limit_data       nvdb_speed, smart and naive (USE_SMART_LOGIC)
+  engineer_all_features      speed_features, one fix (and the batch API)
+  preprocess                 web_demo/app.py, one camera frame
+  predict_grouped            web_demo/app.py, preprocess + model + grouping
+
+Every benchmark reports p50/p95/p99/mean latency (ms) and throughput
+(items/s). Every call's result is checked (status "ok", no missing
+sources); a benchmark with failed calls reports their count and is marked
+as errored instead of being compared. The lookups that talk to NVDB/MET/Open-Meteo are measured "cold"
+(caches cleared before every call) and "warm" (repeated points served from
+the caches). Run them against a recorded archive (see http_client.record /
+replay) to get repeatable numbers without network.
+
+Usage:
+    # Once, with network: record the API responses the benchmarks need
+    python benchmark.py --record fixtures/bench.jsonl.gz
+
+    # Offline / CI: replay them, save the results, and compare to a baseline
+    python benchmark.py --replay fixtures/bench.jsonl.gz --output results.json
+    python benchmark.py --replay fixtures/bench.jsonl.gz --compare results.json --threshold 0.2
+
+    python benchmark.py --only engineer_all_features preprocess
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+import http_client
+
+ROOT = Path(__file__).resolve().parent
+# speed_limit/ modules import each other as top-level modules
+sys.path.insert(0, str(ROOT / "speed_limit"))
+
+# A short drive through two junctions (simulator.ROUTE) and points on
+# different road classes (nvdb_test_suite)
+POINTS = [
+    (59.835764, 10.423201),
+    (59.835746, 10.423010),
+    (59.835727, 10.422836),
+    (59.835735, 10.422685),
+    (59.835705, 10.422611),
+    (59.835671, 10.422493),
+    (59.835673, 10.422376),
+    (63.333542, 10.356348),
+    (59.834185, 10.428984),
+    (59.8336673, 10.4411366),
+    (63.435512, 10.275317),
+    (63.326244, 10.334259),
+]
+ALTITUDE = 20.0
+
+DEFAULT_ITERATIONS = 200
+DEFAULT_WARMUP = 5
+DEFAULT_THRESHOLD = 0.2
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def measure(
+    fn: Callable[[int], object],
+    iterations: int,
+    warmup: int = DEFAULT_WARMUP,
+    items_per_call: int = 1,
+    setup: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    Call fn(i) `iterations` times after `warmup` untimed calls. setup(i),
+    if given, runs before every call outside the timed region. fn raises
+    if a call did not produce a valid result; such calls are counted, not
+    propagated.
+
+    Returns:
+        {"iterations", "errors", "p50_ms", "p95_ms", "p99_ms", "mean_ms",
+         "max_ms", "throughput_per_s"} where throughput counts
+        items_per_call per call over the timed calls only. If any call
+        failed (warm-up included) there is also an "error" message, and the
+        benchmark is left out of compare().
+    """
+    errors = 0
+    first_error = None
+    latencies = np.empty(iterations, dtype=np.float64)
+    for i in range(warmup + iterations):
+        if setup is not None:
+            setup(i)
+        start = time.perf_counter()
+        try:
+            fn(i)
+        except Exception as e:
+            errors += 1
+            if first_error is None:
+                first_error = f"{type(e).__name__}: {e}"
+        if i >= warmup:
+            latencies[i - warmup] = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000.0
+    total = float(latencies.sum())
+    result = {
+        "iterations": iterations,
+        "errors": errors,
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "mean_ms": round(1000.0 * total / iterations, 4),
+        "max_ms": round(1000.0 * float(latencies.max()), 4),
+        "throughput_per_s": round(iterations * items_per_call / total, 2) if total > 0 else None,
+    }
+    if errors:
+        result["error"] = f"{errors} of {warmup + iterations} calls failed, first: {first_error}"
+    return result
+
+
+def _check_speed_limit(result: Optional[dict]) -> None:
+    if not result or result.get("status") != "ok":
+        status = result.get("status") if result else None
+        message = result.get("message") if result else None
+        raise RuntimeError(f"speed limit status {status!r}" + (f": {message}" if message else ""))
+
+
+def _check_pipeline_input(data: dict) -> None:
+    if data.get("missing"):
+        raise RuntimeError(f"missing sources: {data['missing']}")
+    if data.get("weather") is None:
+        raise RuntimeError("no weather")
+    _check_speed_limit(data.get("speed_limit"))
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks (each returns {name: measurement})
+# ---------------------------------------------------------------------------
+
+def bench_collect_pipeline_input(iterations: int, warmup: int) -> dict:
+    import data_pipeline
+
+    def call(i):
+        lat, lon = POINTS[i % len(POINTS)]
+        _check_pipeline_input(data_pipeline.collect_pipeline_input(lat=lat, lon=lon, altitude=ALTITUDE))
+
+    def clear(i):
+        data_pipeline.WEATHER_CACHE.clear()
+
+    return {
+        "collect_pipeline_input[cold]": measure(call, iterations, warmup, setup=clear),
+        "collect_pipeline_input[warm]": measure(call, iterations, warmup),
+    }
+
+
+def bench_get_speed_limit_data(iterations: int, warmup: int) -> dict:
+    import nvdb_speed
+
+    def call(i):
+        lat, lon = POINTS[i % len(POINTS)]
+        _check_speed_limit(nvdb_speed.get_speed_limit_data(lat, lon))
+
+    def clear(i):
+        nvdb_speed.clear_caches()
+
+    results = {}
+    original = nvdb_speed.USE_SMART_LOGIC
+    try:
+        for mode, smart in (("smart", True), ("naive", False)):
+            nvdb_speed.USE_SMART_LOGIC = smart
+            nvdb_speed.LAST_VEGLENKE_ID = None
+            results[f"get_speed_limit_data[{mode},cold]"] = measure(call, iterations, warmup, setup=clear)
+            nvdb_speed.LAST_VEGLENKE_ID = None
+            results[f"get_speed_limit_data[{mode},warm]"] = measure(call, iterations, warmup)
+    finally:
+        nvdb_speed.USE_SMART_LOGIC = original
+        nvdb_speed.LAST_VEGLENKE_ID = None
+    return results
+
+
+def bench_engineer_all_features(iterations: int, warmup: int) -> dict:
+    import speed_features
+
+    rng = np.random.default_rng(0)
+    limits = rng.choice([30, 40, 50, 60, 70, 80, 90, 100, 110], size=10_000)
+    roads = rng.choice(["EV6 S1D1", "RV4 S1D1", "FV715 S1D1", "KV1020 S1D1", "PV3 S1D1"], size=len(limits))
+    records = [{"status": "ok", "fartsgrense": int(f), "vei": str(v)} for f, v in zip(limits, roads)]
+
+    def scalar(i):
+        if speed_features.engineer_all_features(records[i % len(records)], previous_speed_limit=50) is None:
+            raise RuntimeError("no features")
+
+    previous = speed_features.previous_limits(limits)
+
+    def batch(i):
+        out = speed_features.engineer_features_batch(limits, roads, previous)
+        if len(out) != len(limits):
+            raise RuntimeError(f"{len(out)} feature rows for {len(limits)} records")
+
+    return {
+        "engineer_all_features": measure(scalar, iterations * 10, warmup),
+        "engineer_features_batch[10k]": measure(
+            batch, max(iterations // 10, 5), warmup, items_per_call=len(limits)
+        ),
+    }
+
+
+def _camera_frames(image_dir: Optional[str], n: int = 16) -> list:
+    from PIL import Image
+
+    if image_dir:
+        paths = sorted(p for p in Path(image_dir).rglob("*") if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        if paths:
+            return [Image.open(p).convert("RGB") for p in paths[:n]]
+    # Synthetic frames when no image directory is given
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 256, (240, 360, 3), dtype=np.uint8)) for _ in range(n)]
+
+
+def bench_web_demo(iterations: int, warmup: int, image_dir: Optional[str] = None) -> dict:
+    sys.path.insert(0, str(ROOT / "web_demo"))
+    import app
+
+    app.load_model()
+    frames = _camera_frames(image_dir)
+
+    def pre(i):
+        app.preprocess(frames[i % len(frames)])
+
+    def predict(i):
+        if not app.predict_grouped(frames[i % len(frames)]).get("friction"):
+            raise RuntimeError("no friction prediction")
+
+    return {
+        "preprocess": measure(pre, iterations, warmup),
+        "predict_grouped": measure(predict, iterations, warmup),
+    }
+
+
+BENCHMARKS = {
+    "collect_pipeline_input": bench_collect_pipeline_input,
+    "get_speed_limit_data": bench_get_speed_limit_data,
+    "engineer_all_features": bench_engineer_all_features,
+    "web_demo": bench_web_demo,
+}
+# --only also accepts the names of the web_demo functions
+ALIASES = {"preprocess": "web_demo", "predict_grouped": "web_demo"}
+
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Benchmarks whose p50 or p95 latency grew by more than `threshold`
+    (0.2 = 20 %) relative to the baseline results, and benchmarks that ran
+    cleanly in the baseline but errored now (metric "error", current_ms
+    None). Benchmarks that errored in the baseline are not compared.
+
+    Returns:
+        [(name, metric, baseline_ms, current_ms), ...]
+    """
+    regressions = []
+    for name, current in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or "error" in before:
+            continue
+        if "error" in current:
+            regressions.append((name, "error", before["p50_ms"], None))
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if before[metric] > 0 and current[metric] > before[metric] * (1.0 + threshold):
+                regressions.append((name, metric, before[metric], current[metric]))
+    return regressions
+
+
+def print_results(results: dict, baseline: Optional[dict] = None) -> None:
+    header = f"{'BENCHMARK':<38} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'items/s':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results["results"].items():
+        if "error" in r:
+            print(f"{name:<38} skipped: {r['error']}")
+            continue
+        line = f"{name:<38} {r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} {r['p99_ms']:>10.3f} {r['throughput_per_s'] or 0:>12.1f}"
+        before = (baseline or {}).get("results", {}).get(name)
+        if before and "error" not in before and before["p50_ms"] > 0:
+            line += f"   p50 {100.0 * (r['p50_ms'] / before['p50_ms'] - 1.0):+.1f} %"
+        print(line)
+
+
+def run(selected: list, iterations: int, warmup: int, image_dir: Optional[str], fixtures: str) -> dict:
+    results = {}
+    for key in selected:
+        fn = BENCHMARKS[key]
+        print(f"Running {key} ...", file=sys.stderr)
+        try:
+            if key == "web_demo":
+                results.update(fn(iterations, warmup, image_dir))
+            else:
+                results.update(fn(iterations, warmup))
+        except Exception as e:
+            results[key] = {"error": f"{type(e).__name__}: {e}"}
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fixtures": fixtures,
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Latency/throughput benchmarks")
+    parser.add_argument("--only", nargs="+", choices=sorted([*BENCHMARKS, *ALIASES]), help="Benchmarks to run")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser.add_argument("--images", help="Directory with camera frames (default: synthetic frames)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results JSON to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed p50/p95 slowdown before --compare fails (0.2 = 20 %%)")
+    http_client.add_fixture_arguments(parser)
+    args = parser.parse_args()
+    http_client.apply_fixture_arguments(args)
+
+    selected = list(BENCHMARKS)
+    if args.only:
+        selected = [key for key in BENCHMARKS if key in {ALIASES.get(o, o) for o in args.only}]
+    fixtures = f"replay:{args.replay}" if args.replay else (f"record:{args.record}" if args.record else "live")
+
+    results = run(selected, args.iterations, args.warmup, args.images, fixtures)
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_results(results, baseline)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, before, after in regressions:
+            if after is None:
+                print(f"REGRESSION {name}: errored ({results['results'][name]['error']})")
+            else:
+                print(f"REGRESSION {name} {metric}: {before:.3f} -> {after:.3f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,12 +13,32 @@ Usage:
 
     camera_output = { ... }   # output from the road surface ML model
     data = collect_pipeline_input(lat=63.4305, lon=10.3951, altitude=20, camera_output=camera_output)
+
+    # Weather and speed limit fetched at the same time, with per-source deadlines:
+    data = collect_pipeline_input_concurrent(lat=63.4305, lon=10.3951, deadlines={"weather": 2.0})
+    data = await collect_pipeline_input_async(lat=63.4305, lon=10.3951)
+
+    # Straight into a fixed-layout float32 record (see feature_record.py):
+    from feature_record import FeatureRing
+
+    ring = FeatureRing(capacity=1024)
+    collect_pipeline_record(ring, lat=63.4305, lon=10.3951, camera_output=camera_output)
+    model_input = ring.latest(32)
 """
 
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
 import requests
 from datetime import datetime, timezone
 from typing import Optional
 
+import http_client
+from weather_cache import DEFAULT_TTL_S, CachedForecast, WeatherCache
+
 try:
     from pyproj import Transformer
     _HAS_PYPROJ = True
@@ -46,10 +66,107 @@ except ImportError:
 # Weather
 # ---------------------------------------------------------------------------
 
+_OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+
+
+def _open_meteo_timeseries(hourly: dict) -> list:
+    """Open-Meteo hourly arrays as a MET Locationforecast-style timeseries."""
+    return [
+        {
+            "time": datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "data": {"instant": {"details": {"air_temperature": temp, "relative_humidity": humidity}}},
+        }
+        for t, temp, humidity in zip(
+            hourly.get("time", []),
+            hourly.get("temperature_2m", []),
+            hourly.get("relative_humidity_2m", []),
+        )
+        if temp is not None and humidity is not None
+    ]
+
+
+# Locations per Open-Meteo request (comma-separated coordinate lists)
+OPEN_METEO_MAX_LOCATIONS = 100
+
+
+def fetch_open_meteo_many(points: list) -> list:
+    """
+    Hourly forecasts (today and tomorrow) for many (lat, lon, altitude)
+    points, using Open-Meteo's multi-location requests.
+
+    Returns one CachedForecast per point, in input order. Points with an
+    altitude and points without one go in separate requests, because the
+    elevation list must cover every location of a request.
+    Open-Meteo sends no cache validators, so forecasts get DEFAULT_TTL_S.
+    """
+    forecasts = [None] * len(points)
+    with_alt = [i for i, p in enumerate(points) if p[2] is not None]
+    without_alt = [i for i, p in enumerate(points) if p[2] is None]
+
+    for group in (with_alt, without_alt):
+        for start in range(0, len(group), OPEN_METEO_MAX_LOCATIONS):
+            idx = group[start:start + OPEN_METEO_MAX_LOCATIONS]
+            params = {
+                "latitude": ",".join(str(points[i][0]) for i in idx),
+                "longitude": ",".join(str(points[i][1]) for i in idx),
+                "hourly": "temperature_2m,relative_humidity_2m",
+                "timeformat": "unixtime",
+                "forecast_days": 2,
+            }
+            if group is with_alt:
+                # Open-Meteo accepts elevation override for better accuracy
+                params["elevation"] = ",".join(str(points[i][2]) for i in idx)
+
+            resp = http_client.get(_OPEN_METEO_URL, params=params, timeout=10)
+            resp.raise_for_status()
+            body = resp.json()
+            # A single location is answered with an object, several with a list
+            bodies = body if isinstance(body, list) else [body]
+            if len(bodies) != len(idx):
+                raise RuntimeError(f"Open-Meteo returned {len(bodies)} locations for {len(idx)}")
+
+            expires = time.time() + DEFAULT_TTL_S
+            for i, location in zip(idx, bodies):
+                timeseries = _open_meteo_timeseries(location.get("hourly", {}))
+                if not timeseries:
+                    raise RuntimeError(f"Unexpected Open-Meteo response: {location}")
+                forecasts[i] = CachedForecast(timeseries, expires=expires)
+    return forecasts
+
+
+def _fetch_open_meteo(lat: float, lon: float, altitude: Optional[float], cached=None) -> CachedForecast:
+    return fetch_open_meteo_many([(lat, lon, altitude)])[0]
+
+
+# One forecast per ~2 km cell, shared by every caller in the process
+WEATHER_CACHE = WeatherCache(_fetch_open_meteo)
+
+# Set by use_fleet_weather(): coalesces concurrent get_weather calls
+WEATHER_SERVICE = None
+
+
+def use_fleet_weather(enabled: bool = True, **kwargs) -> None:
+    """
+    Route get_weather through a weather_service.FleetWeatherService, so
+    calls from many vehicles at once become one lookup per distinct cell.
+    kwargs are passed to FleetWeatherService.
+    """
+    global WEATHER_SERVICE
+    if not enabled:
+        WEATHER_SERVICE = None
+        return
+    from weather_service import FleetWeatherService
+    WEATHER_SERVICE = FleetWeatherService(**kwargs)
+
+
 def get_weather(lat: float, lon: float, altitude: Optional[float] = None) -> dict:
     """
     Fetch current temperature (°C) and relative humidity (%) for a location.
 
+    Values come from the hourly forecast of the surrounding grid cell, which
+    is cached (see weather_cache.py), so repeated calls from nearby positions
+    within the same forecast period make no request.
+
     Returns:
         {
             "temp": float,      # degrees Celsius
@@ -62,30 +179,11 @@ def get_weather(lat: float, lon: float, altitude: Optional[float] = None) -> dic
     if _USE_REPO_WEATHER:
         return _repo_get_weather(lat=lat, lon=lon, altitude=altitude)
 
-    # --- Open-Meteo (free, no API key required) ---
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current": "temperature_2m,relative_humidity_2m",
-        "timezone": "auto",
-    }
-    if altitude is not None:
-        # Open-Meteo accepts elevation override for better accuracy
-        params["elevation"] = altitude
-
-    resp = requests.get(url, params=params, timeout=10)
-    resp.raise_for_status()
-    body = resp.json()
-
-    current = body.get("current", {})
-    temp = current.get("temperature_2m")
-    humidity = current.get("relative_humidity_2m")
+    if WEATHER_SERVICE is not None:
+        return WEATHER_SERVICE.get(lat, lon, altitude)
 
-    if temp is None or humidity is None:
-        raise RuntimeError(f"Unexpected Open-Meteo response: {body}")
-
-    return {"temp": float(temp), "humidity": float(humidity)}
+    # --- Open-Meteo (free, no API key required) ---
+    return WEATHER_CACHE.get(lat, lon, altitude)
 
 
 # NVDB public REST API v4
@@ -134,7 +232,7 @@ def get_speed_limit(lat: float, lon: float, search_radius_m: int = 50) -> dict:
             "maks_avstand": max(150, search_radius_m),
             "maks_antall": 1,
         }
-        pos_resp = requests.get(_NVDB_POSISJON_URL, params=pos_params, headers=_NVDB_HEADERS, timeout=10)
+        pos_resp = http_client.get(_NVDB_POSISJON_URL, params=pos_params, headers=_NVDB_HEADERS, timeout=10)
         pos_resp.raise_for_status()
         pos_data = pos_resp.json()
 
@@ -163,7 +261,7 @@ def get_speed_limit(lat: float, lon: float, search_radius_m: int = 50) -> dict:
             "inkluder": "egenskaper,lokasjon",
             "antall": 20,
         }
-        obj_resp = requests.get(_NVDB_OBJEKT_URL, params=obj_params, headers=_NVDB_HEADERS, timeout=10)
+        obj_resp = http_client.get(_NVDB_OBJEKT_URL, params=obj_params, headers=_NVDB_HEADERS, timeout=10)
         obj_resp.raise_for_status()
         objekter = obj_resp.json().get("objekter", [])
 
@@ -305,6 +403,261 @@ def collect_pipeline_input(
     }
 
 
+# ---------------------------------------------------------------------------
+# Concurrent collection
+# ---------------------------------------------------------------------------
+
+# Per-source deadlines in seconds, measured from the start of the tick.
+# A source that is still running once its deadline has passed is reported as
+# missing and the rest of the tick is returned without it. None disables the
+# deadline.
+DEFAULT_SOURCE_DEADLINES = {
+    "weather": 3.0,
+    "speed_limit": 3.0,
+}
+
+# Worker threads shared by all concurrent collections. A source that misses
+# its deadline keeps its thread until the underlying HTTP timeout fires, so
+# the pool is sized for a few overlapping slow ticks.
+COLLECT_POOL_SIZE = 8
+
+_collect_executor: Optional[ThreadPoolExecutor] = None
+_collect_executor_lock = threading.Lock()
+
+
+def _get_collect_executor() -> ThreadPoolExecutor:
+    global _collect_executor
+    if _collect_executor is None:
+        with _collect_executor_lock:
+            if _collect_executor is None:
+                _collect_executor = ThreadPoolExecutor(
+                    max_workers=COLLECT_POOL_SIZE,
+                    thread_name_prefix="pipeline-collect",
+                )
+    return _collect_executor
+
+
+def _source_calls(lat: float, lon: float, altitude: float, speed_limit_radius_m: int) -> dict:
+    return {
+        "weather": functools.partial(get_weather, lat=lat, lon=lon, altitude=altitude),
+        "speed_limit": functools.partial(
+            get_speed_limit, lat=lat, lon=lon, search_radius_m=speed_limit_radius_m
+        ),
+    }
+
+
+def _resolve_deadlines(deadlines: Optional[dict]) -> dict:
+    resolved = dict(DEFAULT_SOURCE_DEADLINES)
+    if deadlines:
+        resolved.update(deadlines)
+    return resolved
+
+
+def _assemble_partial(
+    timestamp: str,
+    lat: float,
+    lon: float,
+    altitude: float,
+    camera_output: Optional[dict],
+    results: dict,
+    missing: dict,
+) -> dict:
+    speed_limit = results.get("speed_limit")
+    if speed_limit is None:
+        speed_limit = {
+            "fartsgrense": None,
+            "vei": None,
+            "avstand_meter": None,
+            "status": f"error: {missing.get('speed_limit', 'missing')}",
+        }
+
+    return {
+        "timestamp": timestamp,
+        "gps": {
+            "lat": lat,
+            "lon": lon,
+            "altitude": altitude,
+        },
+        "weather": results.get("weather"),
+        "speed_limit": speed_limit,
+        "camera": camera_output,
+        "missing": missing,
+    }
+
+
+def collect_pipeline_input_concurrent(
+    lat: float,
+    lon: float,
+    altitude: float = 0.0,
+    camera_output: Optional[dict] = None,
+    speed_limit_radius_m: int = 50,
+    deadlines: Optional[dict] = None,
+) -> dict:
+    """
+    Same as collect_pipeline_input, but runs the weather and speed-limit
+    lookups at the same time on a shared thread pool.
+
+    Args:
+        deadlines: Per-source deadlines in seconds, e.g.
+                   {"weather": 2.0, "speed_limit": 1.5}. Missing keys use
+                   DEFAULT_SOURCE_DEADLINES; None means wait indefinitely.
+
+    Returns the collect_pipeline_input dict with partial results allowed:
+        - "weather" is None if the weather source failed or missed its deadline
+        - "speed_limit" has status "error: ..." if that source did
+        - "missing" maps each failed source to a short reason
+          ({} when every source answered in time)
+    """
+    timestamp = datetime.now(timezone.utc).isoformat()
+    deadlines = _resolve_deadlines(deadlines)
+    executor = _get_collect_executor()
+
+    start = time.monotonic()
+    futures = {
+        name: executor.submit(call)
+        for name, call in _source_calls(lat, lon, altitude, speed_limit_radius_m).items()
+    }
+
+    results = {}
+    missing = {}
+    for name, future in futures.items():
+        deadline = deadlines.get(name)
+        timeout = None if deadline is None else max(0.0, start + deadline - time.monotonic())
+        try:
+            results[name] = future.result(timeout=timeout)
+        except FuturesTimeoutError:
+            future.cancel()
+            missing[name] = f"deadline exceeded ({deadline} s)"
+        except Exception as e:
+            missing[name] = str(e)
+
+    return _assemble_partial(timestamp, lat, lon, altitude, camera_output, results, missing)
+
+
+async def collect_pipeline_input_async(
+    lat: float,
+    lon: float,
+    altitude: float = 0.0,
+    camera_output: Optional[dict] = None,
+    speed_limit_radius_m: int = 50,
+    deadlines: Optional[dict] = None,
+) -> dict:
+    """
+    Async version of collect_pipeline_input_concurrent.
+
+    The blocking HTTP lookups run on the shared collection thread pool, so
+    the event loop stays free while a tick is in flight. Arguments and the
+    returned dict are the same as for collect_pipeline_input_concurrent.
+    """
+    timestamp = datetime.now(timezone.utc).isoformat()
+    deadlines = _resolve_deadlines(deadlines)
+    executor = _get_collect_executor()
+    loop = asyncio.get_running_loop()
+
+    calls = _source_calls(lat, lon, altitude, speed_limit_radius_m)
+    names = list(calls)
+    outcomes = await asyncio.gather(
+        *(
+            asyncio.wait_for(loop.run_in_executor(executor, calls[name]), timeout=deadlines.get(name))
+            for name in names
+        ),
+        return_exceptions=True,
+    )
+
+    results = {}
+    missing = {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            missing[name] = f"deadline exceeded ({deadlines.get(name)} s)"
+        elif isinstance(outcome, BaseException):
+            missing[name] = str(outcome)
+        else:
+            results[name] = outcome
+
+    return _assemble_partial(timestamp, lat, lon, altitude, camera_output, results, missing)
+
+
+# ---------------------------------------------------------------------------
+# Fixed-layout records
+# ---------------------------------------------------------------------------
+
+def collect_pipeline_record(
+    ring,
+    lat: float,
+    lon: float,
+    altitude: float = 0.0,
+    camera_output=None,
+    speed_limit_radius_m: int = 50,
+    deadlines: Optional[dict] = None,
+) -> int:
+    """
+    Collect one tick concurrently straight into the next record of a
+    feature_record.FeatureRing, without building the nested
+    collect_pipeline_input dict: each source writes its own columns of the
+    claimed row as soon as it answers. camera_output may also be the row of
+    camera group scores (probs @ AGGREGATION_MATRIX). Sources that fail or
+    miss their deadline (see collect_pipeline_input_concurrent) stay NaN.
+
+    Returns:
+        the sequence number of the record in the ring
+    """
+    from feature_record import write_camera, write_speed_limit, write_weather
+
+    deadlines = _resolve_deadlines(deadlines)
+    executor = _get_collect_executor()
+    row = ring.claim()
+    previous_speed_limit = ring.last_speed_limit
+    writers = {
+        "weather": lambda weather: write_weather(row, weather),
+        "speed_limit": lambda speed_limit: write_speed_limit(row, speed_limit, previous_speed_limit),
+    }
+    # A source that answers after its deadline must not write into the row
+    # once it is committed (or reused for the next tick)
+    lock = threading.Lock()
+    state = {"open": True, "fartsgrense": None}
+    written = {name: threading.Event() for name in writers}
+
+    def write(name, future):
+        try:
+            if future.cancelled() or future.exception() is not None:
+                return
+            result = future.result()
+            with lock:
+                if not state["open"]:
+                    return
+                writers[name](result)
+                if name == "speed_limit" and result:
+                    state["fartsgrense"] = result.get("fartsgrense")
+        finally:
+            written[name].set()
+
+    start = time.monotonic()
+    futures = {}
+    for name, call in _source_calls(lat, lon, altitude, speed_limit_radius_m).items():
+        futures[name] = executor.submit(call)
+        futures[name].add_done_callback(functools.partial(write, name))
+
+    for name, future in futures.items():
+        deadline = deadlines.get(name)
+        timeout = None if deadline is None else max(0.0, start + deadline - time.monotonic())
+        try:
+            future.result(timeout=timeout)
+        except FuturesTimeoutError:
+            future.cancel()
+            continue
+        except Exception:
+            continue
+        # result() returns before the done callbacks have run
+        written[name].wait()
+
+    with lock:
+        state["open"] = False
+    write_camera(row, camera_output)
+    if state["fartsgrense"] is not None:
+        ring.last_speed_limit = state["fartsgrense"]
+    return ring.commit()
+
+
 # ---------------------------------------------------------------------------
 # CLI quick-test
 # ---------------------------------------------------------------------------
@@ -0,0 +1,265 @@
+"""
+feature_record.py
+
+Fixed-layout model input record for one tick of the pipeline.
+
+A record is one row of float32 values whose columns are fixed by the schema
+below. The weather, speed-limit, speed-feature and camera stages each write
+their own column slice of the row in place. Nothing downstream has to
+flatten nested dicts again, and a batch of records is a plain (N, WIDTH)
+float32 array that can go straight into the model. Values a stage could not
+provide are NaN.
+
+FeatureRing keeps the most recent records in a preallocated buffer and
+hands them to the consumer as views (no copies).
+
+Usage:
+    from feature_record import FeatureRing, column
+
+    ring = FeatureRing(capacity=1024)
+    ring.append(collect_pipeline_input(lat=63.4305, lon=10.3951))
+
+    # Or stage by stage, writing into the claimed row:
+    row = ring.claim()
+    write_weather(row, weather)
+    write_speed_limit(row, speed_limit, previous_speed_limit=50)
+    write_camera(row, camera_output)
+    ring.commit()
+
+    window = ring.latest(32)              # (32, WIDTH) float32 view, oldest first,
+                                          # valid for capacity - 31 more commits
+    temps = window[:, column("temp")]
+"""
+
+import math
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from speed_limit.speed_features import FEATURE_NAMES as SPEED_FEATURE_NAMES
+from speed_limit.speed_features import engineer_all_features, feature_vector
+
+# ---------------------------------------------------------------------------
+# Schema
+# ---------------------------------------------------------------------------
+
+# Camera group labels in the order of web_demo/app.py GROUP_NAMES / GROUP_LABELS,
+# i.e. the columns of probs @ AGGREGATION_MATRIX
+CAMERA_GROUPS = {
+    "friction": ("dry", "wet", "water"),
+    "surface": ("asphalt", "concrete", "gravel", "mud"),
+    "uneven": ("smooth", "slight", "severe"),
+    "winter": ("fresh_snow", "melted_snow", "ice"),
+}
+
+# (stage, column names) in record order
+FIELDS = [
+    ("weather", ("temp", "humidity")),
+    ("speed_limit", ("fartsgrense", "avstand_meter")),
+    ("speed_features", tuple(SPEED_FEATURE_NAMES)),
+    ("camera", tuple(f"{group}_{label}" for group, labels in CAMERA_GROUPS.items() for label in labels)),
+]
+
+COLUMNS = [name for _, names in FIELDS for name in names]
+WIDTH = len(COLUMNS)
+DTYPE = np.float32
+
+SLICES = {}
+_start = 0
+for _stage, _names in FIELDS:
+    SLICES[_stage] = slice(_start, _start + len(_names))
+    _start += len(_names)
+
+_COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+
+def column(name: str) -> int:
+    """Index of a column, e.g. column("temp") or column("friction_wet")."""
+    return _COLUMN_INDEX[name]
+
+
+def new_records(n: int = 1) -> np.ndarray:
+    """An (n, WIDTH) float32 array of empty (NaN) records."""
+    return np.full((n, WIDTH), np.nan, dtype=DTYPE)
+
+
+def _value(v) -> float:
+    return math.nan if v is None else float(v)
+
+
+# ---------------------------------------------------------------------------
+# Stage writers (each fills its own slice of a record row in place)
+# ---------------------------------------------------------------------------
+
+def write_weather(row: np.ndarray, weather: Optional[dict]) -> None:
+    """{"temp", "humidity"} from get_weather(), or None if missing."""
+    out = row[SLICES["weather"]]
+    if weather is None:
+        out[:] = np.nan
+        return
+    out[0] = _value(weather.get("temp"))
+    out[1] = _value(weather.get("humidity"))
+
+
+def write_speed_limit(row: np.ndarray, speed_limit: Optional[dict], previous_speed_limit=None) -> None:
+    """
+    Speed-limit lookup result (data_pipeline.get_speed_limit or
+    nvdb_speed.get_speed_limit_data) plus the engineered speed features.
+    """
+    out = row[SLICES["speed_limit"]]
+    features = row[SLICES["speed_features"]]
+    if speed_limit is None:
+        out[:] = np.nan
+        features[:] = np.nan
+        return
+    out[0] = _value(speed_limit.get("fartsgrense"))
+    out[1] = _value(speed_limit.get("avstand_meter"))
+
+    engineered = None
+    if speed_limit.get("fartsgrense") is not None:
+        engineered = engineer_all_features(speed_limit, previous_speed_limit=previous_speed_limit)
+    if engineered is None:
+        features[:] = np.nan
+    else:
+        features[:] = feature_vector(engineered)
+
+
+def write_camera(row: np.ndarray, camera) -> None:
+    """
+    Camera group scores, either as a grouped result from the road surface
+    model ({"friction": [(label, score), ...], ...}) or as the row of group
+    scores from probs @ AGGREGATION_MATRIX. Labels below the top-k of a
+    grouped result are 0; a missing group is NaN.
+    """
+    out = row[SLICES["camera"]]
+    if camera is None:
+        out[:] = np.nan
+        return
+    if not isinstance(camera, dict):
+        out[:] = camera
+        return
+
+    col = 0
+    for group, labels in CAMERA_GROUPS.items():
+        block = out[col:col + len(labels)]
+        col += len(labels)
+        scores = camera.get(group)
+        if scores is None:
+            block[:] = np.nan
+            continue
+        block[:] = 0.0
+        for label, score in scores:
+            if label in labels:
+                block[labels.index(label)] = score
+
+
+def write_pipeline_input(row: np.ndarray, data: dict, previous_speed_limit=None) -> None:
+    """All stages from a collect_pipeline_input(_concurrent) dict."""
+    write_weather(row, data.get("weather"))
+    write_speed_limit(row, data.get("speed_limit"), previous_speed_limit)
+    write_camera(row, data.get("camera"))
+
+
+# ---------------------------------------------------------------------------
+# Ring buffer
+# ---------------------------------------------------------------------------
+
+class FeatureRing:
+    """
+    The last `capacity` records, for zero-copy handoff to the model.
+
+    claim() hands out a separate staging row; commit() copies it into the
+    ring, so a half-written record is never visible to readers. The ring has
+    capacity + 1 slots and every committed row is stored twice, at i and
+    i + slots, so any run of up to `capacity` consecutive records is one
+    contiguous slice of the buffer and latest()/since() can return views
+    even across the wrap-around. The extra slot means the next commit never
+    writes into a returned window: a view of n records stays valid for the
+    next capacity + 1 - n commits (a full latest() for exactly one).
+    Meant for one writer and any number of readers.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._slots = capacity + 1
+        self._buffer = np.full((2 * self._slots, WIDTH), np.nan, dtype=DTYPE)
+        self._timestamps = np.full(2 * self._slots, np.nan, dtype=np.float64)
+        self._staging = np.full(WIDTH, np.nan, dtype=DTYPE)
+        self._staging_timestamp = math.nan
+        self._count = 0
+        self._lock = threading.Lock()
+        # Previous speed limit for the speed_delta feature of the next append()
+        self.last_speed_limit = None
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def count(self) -> int:
+        """Records committed so far (the sequence number of the next one)."""
+        return self._count
+
+    def claim(self, timestamp: Optional[float] = None) -> np.ndarray:
+        """Empty (NaN) staging row for the next record, for the stages to write into."""
+        self._staging_timestamp = time.time() if timestamp is None else timestamp
+        self._staging[:] = np.nan
+        return self._staging
+
+    def commit(self) -> int:
+        """Copy the claimed row into the ring and publish it; returns its sequence number."""
+        i = self._count % self._slots
+        self._buffer[i] = self._staging
+        self._buffer[i + self._slots] = self._staging
+        self._timestamps[i] = self._timestamps[i + self._slots] = self._staging_timestamp
+        with self._lock:
+            self._count += 1
+            return self._count - 1
+
+    def append(self, data: dict, timestamp: Optional[float] = None) -> int:
+        """Write a collect_pipeline_input dict as the next record and commit it."""
+        row = self.claim(timestamp)
+        write_pipeline_input(row, data, self.last_speed_limit)
+        fartsgrense = (data.get("speed_limit") or {}).get("fartsgrense")
+        if fartsgrense is not None:
+            self.last_speed_limit = fartsgrense
+        return self.commit()
+
+    def get(self, seq: int) -> Optional[np.ndarray]:
+        """View of record `seq`, or None if it is not committed or already overwritten."""
+        with self._lock:
+            end = self._count
+        if not end - self.capacity <= seq < end:
+            return None
+        return self._buffer[seq % self._slots]
+
+    def _window(self, start: int, end: int):
+        n = end - start
+        if n <= 0:
+            return self._buffer[:0], self._timestamps[:0]
+        first = start % self._slots
+        return self._buffer[first:first + n], self._timestamps[first:first + n]
+
+    def latest(self, n: Optional[int] = None) -> np.ndarray:
+        """View of the newest n records (default: all kept), oldest first."""
+        return self.latest_with_timestamps(n)[0]
+
+    def latest_with_timestamps(self, n: Optional[int] = None):
+        """(records, timestamps) views of the newest n records, oldest first."""
+        with self._lock:
+            end = self._count
+        n = len(self) if n is None else min(n, len(self))
+        return self._window(end - n, end)
+
+    def since(self, seq: int):
+        """
+        Records committed from sequence number `seq` on, as
+        (records view, timestamps view, next seq). A reader that fell more
+        than `capacity` records behind gets only the ones still kept.
+        """
+        with self._lock:
+            end = self._count
+        start = max(seq, end - self.capacity)
+        records, timestamps = self._window(start, end)
+        return records, timestamps, end
@@ -0,0 +1,516 @@
+"""
+gps_stream.py
+
+Streaming version of the data pipeline for a continuous feed of GPS fixes.
+
+Fixes come from a generator, a file (NMEA sentences or CSV) or a UDP socket
+with NMEA sentences. Every stage runs as its own task, connected by small
+queues:
+
+  source -> speed limit -> weather -> camera join -> features -> consumer
+
+The queues are latest-wins: when a stage falls behind, the oldest waiting
+fix is dropped in favour of the newest one, so the pipeline always works on
+the current position instead of building up a backlog. Blocking lookups
+run on the shared collection thread pool of data_pipeline; async stage
+functions are awaited directly. Records come out as an async iterator, with
+the model input written in place into a feature_record.FeatureRing.
+
+Usage:
+    from gps_stream import GPSPipeline, file_source, iter_source, udp_source
+
+    pipeline = GPSPipeline(udp_source(port=10110))
+    async for rec in pipeline:
+        rec.fix.lat, rec.record         # record: float32 row (see feature_record.py)
+        pipeline.update_camera(camera_output)
+
+    # Replay a recorded drive at 5x real time:
+    pipeline = GPSPipeline(file_source("drive.nmea", speed=5.0))
+
+    python gps_stream.py --file drive.nmea
+    python gps_stream.py --udp 10110
+"""
+
+import argparse
+import asyncio
+import functools
+import inspect
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import data_pipeline
+from feature_record import FeatureRing
+
+NMEA_UDP_PORT = 10110
+KNOTS_TO_MS = 0.514444
+
+
+# ---------------------------------------------------------------------------
+# Fixes and NMEA
+# ---------------------------------------------------------------------------
+
+class GPSFix:
+    __slots__ = ("lat", "lon", "altitude", "timestamp", "speed", "heading")
+
+    def __init__(
+        self,
+        lat: float,
+        lon: float,
+        altitude: Optional[float] = None,
+        timestamp: Optional[float] = None,
+        speed: Optional[float] = None,
+        heading: Optional[float] = None,
+    ):
+        self.lat = lat
+        self.lon = lon
+        self.altitude = altitude
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.speed = speed          # m/s
+        self.heading = heading      # degrees from north
+
+    def __repr__(self):
+        return f"GPSFix(lat={self.lat}, lon={self.lon}, altitude={self.altitude}, timestamp={self.timestamp})"
+
+
+def _as_fix(item) -> GPSFix:
+    if isinstance(item, GPSFix):
+        return item
+    return GPSFix(*item)
+
+
+def _nmea_checksum_ok(sentence: str) -> bool:
+    if "*" not in sentence:
+        return True
+    body, checksum = sentence[1:].split("*", 1)
+    value = 0
+    for ch in body:
+        value ^= ord(ch)
+    try:
+        return value == int(checksum[:2], 16)
+    except ValueError:
+        return False
+
+
+def _nmea_degrees(value: str, hemisphere: str) -> Optional[float]:
+    if not value:
+        return None
+    dot = value.index(".") if "." in value else len(value)
+    degrees = float(value[:dot - 2]) + float(value[dot - 2:]) / 60.0
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+def _nmea_time(hhmmss: str, ddmmyy: Optional[str] = None) -> Optional[float]:
+    if not hhmmss:
+        return None
+    if ddmmyy:
+        day, month, yy = int(ddmmyy[:2]), int(ddmmyy[2:4]), int(ddmmyy[4:6])
+        # RMC has a two-digit year; GPS-era dates start in 1980
+        year = 1900 + yy if yy >= 80 else 2000 + yy
+    else:
+        today = datetime.now(timezone.utc)
+        day, month, year = today.day, today.month, today.year
+    seconds = float(hhmmss[4:])
+    stamp = datetime(year, month, day, int(hhmmss[:2]), int(hhmmss[2:4]), tzinfo=timezone.utc)
+    return stamp.timestamp() + seconds
+
+
+class NmeaDecoder:
+    """
+    Turns NMEA 0183 sentences into fixes. RMC gives position, time, speed
+    and course, GGA position and altitude. When a receiver sends both, a fix
+    is emitted per RMC with the altitude of the latest GGA.
+    """
+
+    def __init__(self):
+        self.altitude = None
+        self._seen_rmc = False
+
+    def feed(self, sentence: str) -> Optional[GPSFix]:
+        sentence = sentence.strip()
+        if not sentence.startswith("$") or not _nmea_checksum_ok(sentence):
+            return None
+        fields = sentence.split("*", 1)[0].split(",")
+        kind = fields[0][3:]
+        try:
+            if kind == "GGA" and len(fields) >= 10:
+                if fields[6] in ("", "0"):
+                    return None
+                self.altitude = float(fields[9]) if fields[9] else None
+                if self._seen_rmc:
+                    return None
+                return GPSFix(
+                    _nmea_degrees(fields[2], fields[3]),
+                    _nmea_degrees(fields[4], fields[5]),
+                    self.altitude,
+                    _nmea_time(fields[1]),
+                )
+            if kind == "RMC" and len(fields) >= 10:
+                self._seen_rmc = True
+                if fields[2] != "A":
+                    return None
+                return GPSFix(
+                    _nmea_degrees(fields[3], fields[4]),
+                    _nmea_degrees(fields[5], fields[6]),
+                    self.altitude,
+                    _nmea_time(fields[1], fields[9]),
+                    float(fields[7]) * KNOTS_TO_MS if fields[7] else None,
+                    float(fields[8]) if fields[8] else None,
+                )
+        except (ValueError, IndexError):
+            return None
+        return None
+
+
+def _parse_csv_line(line: str) -> Optional[GPSFix]:
+    parts = [p.strip() for p in line.split(",")]
+    try:
+        values = [float(p) if p else None for p in parts[:4]]
+    except ValueError:
+        return None  # header or comment
+    if len(values) < 2 or values[0] is None or values[1] is None:
+        return None
+    return GPSFix(*values)
+
+
+# ---------------------------------------------------------------------------
+# Sources (async iterators of GPSFix)
+# ---------------------------------------------------------------------------
+
+async def _paced(fixes, speed: Optional[float]):
+    """Yield fixes, sleeping between them according to their timestamps / speed."""
+    first_fix = first_wall = None
+    async for fix in fixes:
+        if speed:
+            if first_fix is None:
+                first_fix, first_wall = fix.timestamp, time.monotonic()
+            delay = first_wall + (fix.timestamp - first_fix) / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield fix
+
+
+async def iter_source(fixes, rate_hz: Optional[float] = None):
+    """
+    Fixes from a (sync or async) iterable of GPSFix or (lat, lon[, altitude[,
+    timestamp]]) tuples, optionally paced at rate_hz.
+    """
+    interval = 1.0 / rate_hz if rate_hz else 0.0
+    if hasattr(fixes, "__aiter__"):
+        async for item in fixes:
+            yield _as_fix(item)
+            if interval:
+                await asyncio.sleep(interval)
+        return
+    for item in fixes:
+        yield _as_fix(item)
+        # Yield to the event loop even when not pacing, so stages can run
+        await asyncio.sleep(interval)
+
+
+async def file_source(path, speed: Optional[float] = None):
+    """
+    Fixes from a file of NMEA sentences or CSV lines (lat,lon[,altitude[,
+    timestamp]]). speed replays at that multiple of the recorded time
+    (1.0 = real time); None reads as fast as possible, so fixes the
+    pipeline cannot keep up with are dropped.
+    """
+    async def read():
+        decoder = NmeaDecoder()
+        with open(path, encoding="ascii", errors="replace") as f:
+            for n, line in enumerate(f):
+                fix = decoder.feed(line) if line.startswith("$") else _parse_csv_line(line)
+                if fix is not None:
+                    yield fix
+                if n % 256 == 0:
+                    await asyncio.sleep(0)
+
+    async for fix in _paced(read(), speed):
+        yield fix
+
+
+class _NmeaDatagrams(asyncio.DatagramProtocol):
+    def __init__(self, queue: "LatestQueue"):
+        self.queue = queue
+        self.decoder = NmeaDecoder()
+
+    def datagram_received(self, data, addr):
+        for line in data.decode("ascii", errors="replace").splitlines():
+            fix = self.decoder.feed(line)
+            if fix is not None:
+                self.queue.put(fix)
+
+
+async def udp_source(host: str = "0.0.0.0", port: int = NMEA_UDP_PORT, backlog: int = 64):
+    """Fixes from NMEA sentences received on a UDP socket (one or more per datagram)."""
+    queue = LatestQueue(backlog)
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: _NmeaDatagrams(queue), local_addr=(host, port))
+    try:
+        while True:
+            fix = await queue.get()
+            if fix is None:
+                return
+            yield fix
+    finally:
+        transport.close()
+
+
+async def replay_udp(lines, host: str = "127.0.0.1", port: int = NMEA_UDP_PORT, rate_hz: Optional[float] = None) -> int:
+    """Send NMEA sentences to a UDP socket, e.g. to test udp_source locally. Returns the number sent."""
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(host, port))
+    sent = 0
+    try:
+        for line in lines:
+            transport.sendto(line.strip().encode("ascii"))
+            sent += 1
+            await asyncio.sleep(1.0 / rate_hz if rate_hz else 0)
+    finally:
+        transport.close()
+    return sent
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+class LatestQueue:
+    """
+    Bounded single-consumer queue where put() never blocks: when the queue
+    is full the oldest item is dropped. get() returns None once the queue is
+    closed and empty.
+    """
+
+    def __init__(self, maxsize: int = 1):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def put(self, item) -> None:
+        if len(self._items) >= self.maxsize:
+            self._items.popleft()
+            self.dropped += 1
+        self._items.append(item)
+        self._ready.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
+
+    async def get(self):
+        while not self._items:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StreamRecord:
+    """One processed fix: the collected data and its feature record."""
+
+    __slots__ = ("fix", "data", "seq", "record")
+
+    def __init__(self, fix: GPSFix, data: dict, seq: int, record):
+        self.fix = fix
+        self.data = data          # collect_pipeline_input-style dict (incl. "missing")
+        self.seq = seq            # sequence number in the pipeline's FeatureRing
+        self.record = record      # float32 row view in the ring
+
+
+def _default_speed_limit(fix: GPSFix) -> dict:
+    return data_pipeline.get_speed_limit(lat=fix.lat, lon=fix.lon)
+
+
+def _default_weather(fix: GPSFix) -> dict:
+    return data_pipeline.get_weather(lat=fix.lat, lon=fix.lon, altitude=fix.altitude)
+
+
+STAGES = ("speed_limit", "weather", "camera", "features")
+
+
+class GPSPipeline:
+    def __init__(
+        self,
+        source,
+        speed_limit: Optional[Callable] = None,
+        weather: Optional[Callable] = None,
+        ring: Optional[FeatureRing] = None,
+        queue_size: int = 1,
+        max_camera_age_s: float = 2.0,
+    ):
+        """
+        source:           async iterable of GPSFix (see the *_source functions),
+                          or any iterable of fixes / (lat, lon, ...) tuples
+        speed_limit:      fix -> speed-limit dict (data_pipeline.get_speed_limit
+                          format); plain or async function. E.g. a
+                          map_matcher.MapMatcher for road loyalty:
+                          lambda fix: matcher.update(fix.lat, fix.lon, fix.timestamp)
+        weather:          fix -> {"temp", "humidity"}; plain or async function
+        ring:             FeatureRing the records are written to
+        queue_size:       fixes waiting in front of each stage before the
+                          oldest is dropped
+        max_camera_age_s: camera output received more than this many seconds
+                          before or after a fix entered the pipeline is not
+                          joined to it
+        """
+        if not hasattr(source, "__aiter__"):
+            source = iter_source(source)
+        self.source = source
+        self.calls = {
+            "speed_limit": speed_limit or _default_speed_limit,
+            "weather": weather or _default_weather,
+        }
+        self.ring = ring if ring is not None else FeatureRing()
+        self.queue_size = queue_size
+        self.max_camera_age_s = max_camera_age_s
+
+        self._camera = None
+        self._camera_time = None
+        self._queues = None
+        self.received = 0
+        self.emitted = 0
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.stage_counts = dict.fromkeys(STAGES, 0)
+
+    def update_camera(self, camera_output, timestamp: Optional[float] = None) -> None:
+        """
+        Latest road-surface model output; joined to the fixes around it.
+
+        The join compares arrival times on the time.monotonic() clock, not
+        fix timestamps, which may be receiver or recording time. `timestamp`
+        is the time.monotonic() value the frame was captured at (default:
+        now).
+        """
+        self._camera = camera_output
+        self._camera_time = time.monotonic() if timestamp is None else timestamp
+
+    async def _call(self, name: str, fix: GPSFix):
+        fn = self.calls[name]
+        if inspect.iscoroutinefunction(fn) or inspect.iscoroutinefunction(getattr(fn, "__call__", None)):
+            return await fn(fix)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(data_pipeline._get_collect_executor(), functools.partial(fn, fix))
+        # Async callables that do not look like one (e.g. a lambda around an
+        # async method) hand back a coroutine from the thread; run it here
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _feed(self, out: LatestQueue):
+        try:
+            async for fix in self.source:
+                self.received += 1
+                # Arrival on the camera's clock, for the camera join
+                out.put((fix, {"missing": {}}, time.monotonic()))
+        finally:
+            out.close()
+
+    async def _stage(self, name: str, inbox: LatestQueue, out: LatestQueue):
+        try:
+            while True:
+                item = await inbox.get()
+                if item is None:
+                    return
+                fix, data, arrived = item
+                start = time.perf_counter()
+                try:
+                    if name == "camera":
+                        fresh = self._camera_time is not None and abs(arrived - self._camera_time) <= self.max_camera_age_s
+                        data["camera"] = self._camera if fresh else None
+                        if not fresh:
+                            data["missing"]["camera"] = "no recent camera output"
+                    elif name == "features":
+                        data["gps"] = {"lat": fix.lat, "lon": fix.lon, "altitude": fix.altitude}
+                        data["timestamp"] = datetime.fromtimestamp(fix.timestamp, timezone.utc).isoformat()
+                        seq = self.ring.append(data, timestamp=fix.timestamp)
+                        item = StreamRecord(fix, data, seq, self.ring.get(seq))
+                    else:
+                        data[name] = await self._call(name, fix)
+                except Exception as e:
+                    data["missing"][name] = str(e)
+                    if name == "features":
+                        continue
+                    data[name] = None
+                self.stage_seconds[name] += time.perf_counter() - start
+                self.stage_counts[name] += 1
+                out.put(item)
+        finally:
+            out.close()
+
+    async def records(self):
+        """Async iterator of StreamRecord, one per fix that made it through."""
+        self._queues = [LatestQueue(self.queue_size) for _ in range(len(STAGES) + 1)]
+        tasks = [asyncio.ensure_future(self._feed(self._queues[0]))]
+        for i, name in enumerate(STAGES):
+            tasks.append(asyncio.ensure_future(self._stage(name, self._queues[i], self._queues[i + 1])))
+        try:
+            while True:
+                rec = await self._queues[-1].get()
+                if rec is None:
+                    break
+                self.emitted += 1
+                yield rec
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __aiter__(self):
+        return self.records()
+
+    def metrics(self) -> dict:
+        """Fixes received / emitted, fixes dropped in front of each stage, and mean stage time."""
+        queues = self._queues or [None] * (len(STAGES) + 1)
+        return {
+            "received": self.received,
+            "emitted": self.emitted,
+            "dropped": {
+                name: q.dropped if q is not None else 0
+                for name, q in zip((*STAGES, "consumer"), queues)
+            },
+            "stage_ms": {
+                name: round(1000.0 * self.stage_seconds[name] / self.stage_counts[name], 3)
+                for name in STAGES if self.stage_counts[name]
+            },
+        }
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+async def _run(args):
+    if args.file:
+        source = file_source(args.file, speed=args.speed)
+    else:
+        source = udp_source(port=args.udp)
+    pipeline = GPSPipeline(source)
+    start = time.perf_counter()
+    async for rec in pipeline:
+        sl = rec.data.get("speed_limit") or {}
+        weather = rec.data.get("weather") or {}
+        print(f"{rec.fix.lat:.6f}, {rec.fix.lon:.6f}  {sl.get('fartsgrense')} km/h  {weather.get('temp')} °C")
+    elapsed = time.perf_counter() - start
+    metrics = pipeline.metrics()
+    print(metrics)
+    print(f"{metrics['emitted']} records in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming GPS pipeline")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--file", help="NMEA or CSV (lat,lon[,altitude[,timestamp]]) file to replay")
+    group.add_argument("--udp", type=int, nargs="?", const=NMEA_UDP_PORT, help="UDP port with NMEA sentences")
+    parser.add_argument("--speed", type=float, default=None, help="Replay speed for --file (1.0 = real time)")
+    try:
+        asyncio.run(_run(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
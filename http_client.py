@@ -0,0 +1,422 @@
+"""
+http_client.py
+
+Shared HTTP client layer for the NVDB, MET and Open-Meteo lookups.
+
+Every module goes through get() / get_session() instead of bare requests.get,
+so a steady stream of lookups reuses one keep-alive connection pool per host
+rather than paying a fresh TCP+TLS handshake on every call.
+
+Usage:
+    import http_client
+
+    resp = http_client.get(url, params=params, headers=headers, timeout=10)
+
+    # Optional tuning, e.g. at process start-up:
+    http_client.configure(pool_maxsize=32, max_retries=2)
+
+    # At most 20 requests/s to a host, from all threads together:
+    http_client.set_rate_limit("https://api.met.no", 20)
+
+    # Record every request/response to an archive, then serve them offline
+    # (optionally with extra latency and injected errors):
+    http_client.record("fixtures/nvdb.jsonl.gz")
+    http_client.replay("fixtures/nvdb.jsonl.gz", latency_ms=20, error_rate=0.05, seed=1)
+    http_client.live()
+"""
+
+import atexit
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+# Number of per-host connection pools each session keeps, and the number of
+# keep-alive connections in each pool. POOL_MAXSIZE should be at least the
+# number of threads that talk to the same host at the same time.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+# Retries for connection errors and transient server responses. The delay
+# before retry n is BACKOFF_FACTOR * 2 ** (n - 1) seconds.
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Response headers kept in a recording (the ones the callers look at)
+RECORDED_HEADERS = ("Content-Type", "Expires", "Last-Modified", "Date")
+
+_sessions: dict = {}
+_sessions_lock = threading.Lock()
+_rate_limits: dict = {}
+
+# FixtureArchive being recorded or ReplayAdapter being served, set by
+# record() / replay(); None means live requests
+_fixture = None
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average, with bursts of up to
+    `burst` requests. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take `tokens`, sleeping as needed. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def configure(
+    pool_connections: Optional[int] = None,
+    pool_maxsize: Optional[int] = None,
+    max_retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None,
+) -> None:
+    """
+    Change pool sizes / retry policy. Sessions created from now on use the
+    new settings; sessions already handed out stay open for the callers
+    still holding them (see _drop_sessions).
+    """
+    global POOL_CONNECTIONS, POOL_MAXSIZE, MAX_RETRIES, BACKOFF_FACTOR
+
+    if pool_connections is not None:
+        POOL_CONNECTIONS = pool_connections
+    if pool_maxsize is not None:
+        POOL_MAXSIZE = pool_maxsize
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+    if backoff_factor is not None:
+        BACKOFF_FACTOR = backoff_factor
+
+    _drop_sessions()
+
+
+def _build_session() -> requests.Session:
+    if isinstance(_fixture, ReplayAdapter):
+        session = requests.Session()
+        session.mount("https://", _fixture)
+        session.mount("http://", _fixture)
+        return session
+
+    retry = Retry(
+        total=MAX_RETRIES,
+        # A read timeout or a connection dropped mid-response is not retried:
+        # the server may already be working on the request, and retrying it
+        # would multiply the caller's timeout. Connect errors and
+        # RETRY_STATUSES are still retried.
+        read=0,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        # Hand the last response back to the caller instead of raising, so
+        # existing status-code checks (resp.ok / raise_for_status) still apply.
+        raise_on_status=False,
+    )
+    adapter_class = RecordingAdapter if _fixture is not None else HTTPAdapter
+    adapter = adapter_class(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def set_rate_limit(url: str, rate: Optional[float], burst: Optional[float] = None) -> None:
+    """
+    Limit requests made through get() to the host of `url` to `rate` per
+    second (token bucket shared by all threads). rate=None removes the limit.
+    """
+    key = _host_key(url)
+    with _sessions_lock:
+        if rate is None:
+            _rate_limits.pop(key, None)
+        else:
+            _rate_limits[key] = TokenBucket(rate, burst)
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the shared session for the host of `url`, creating it on first use."""
+    key = _host_key(url)
+
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session()
+                _sessions[key] = session
+    return session
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """Drop-in replacement for requests.get that uses the pooled session for the host."""
+    bucket = _rate_limits.get(_host_key(url))
+    # Rate limits protect the live APIs; a replay runs at full speed
+    if bucket is not None and not isinstance(_fixture, ReplayAdapter):
+        bucket.acquire()
+    return get_session(url).get(url, **kwargs)
+
+
+def _drop_sessions() -> None:
+    """
+    Forget the pooled sessions so get_session() builds new ones, without
+    closing them under threads that still use them; their connections are
+    closed once the last reference is gone.
+    """
+    with _sessions_lock:
+        _sessions.clear()
+
+
+def close_all() -> None:
+    """Close every pooled session (their connections are dropped)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+# ---------------------------------------------------------------------------
+# Record and replay
+# ---------------------------------------------------------------------------
+
+def request_key(method: str, url: str) -> str:
+    """Archive key of a request: method and URL with the query parameters sorted."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}?{query}"
+
+
+class FixtureArchive:
+    """
+    Recorded responses, stored as gzip-compressed JSON lines (one response
+    per line). A request recorded several times is replayed in the recorded
+    order, repeating the last response once they are used up.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._responses: dict = {}
+        self._served: dict = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> "FixtureArchive":
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self._responses.setdefault(entry["key"], []).append(entry)
+        return self
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            entries = [entry for responses in self._responses.values() for entry in responses]
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def add(self, key: str, response: requests.Response) -> None:
+        entry = {
+            "key": key,
+            "status": response.status_code,
+            "headers": {h: response.headers[h] for h in RECORDED_HEADERS if h in response.headers},
+        }
+        try:
+            entry["text"] = response.content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["base64"] = base64.b64encode(response.content).decode("ascii")
+        with self._lock:
+            self._responses.setdefault(key, []).append(entry)
+
+    def next(self, key: str) -> Optional[dict]:
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                return None
+            i = self._served.get(key, 0)
+            self._served[key] = i + 1
+            return responses[min(i, len(responses) - 1)]
+
+    def __len__(self):
+        return sum(len(r) for r in self._responses.values())
+
+
+class RecordingAdapter(HTTPAdapter):
+    """HTTPAdapter that also stores every response in the active archive."""
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if isinstance(_fixture, FixtureArchive):
+            _fixture.add(request_key(request.method, request.url), response)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Serves requests from a FixtureArchive without touching the network.
+
+    latency_ms / jitter_ms delay every response; error_rate is the share of
+    requests that fail, half as a connection error and half as 503. A request
+    that was never recorded raises requests.ConnectionError.
+    """
+
+    def __init__(
+        self,
+        archive: FixtureArchive,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        super().__init__()
+        self.archive = archive
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.errors = 0
+        self.misses = 0
+
+    def _build(self, request, status: int, headers: dict, content: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        return response
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(0.0, self.jitter_ms)
+            roll = self._random.random()
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        if roll < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            if roll < self.error_rate / 2:
+                raise requests.ConnectionError(f"Injected connection error for {request.url}", request=request)
+            return self._build(request, 503, {"Content-Type": "text/plain"}, b"Injected error")
+
+        entry = self.archive.next(request_key(request.method, request.url))
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            raise requests.ConnectionError(f"No recorded response for {request.url}", request=request)
+        with self._lock:
+            self.served += 1
+        if "base64" in entry:
+            content = base64.b64decode(entry["base64"])
+        else:
+            content = entry["text"].encode("utf-8")
+        return self._build(request, entry["status"], entry["headers"], content)
+
+    def close(self):
+        pass
+
+
+def _switch(adapter) -> None:
+    global _fixture
+    if isinstance(_fixture, FixtureArchive):
+        _fixture.save()
+    _fixture = adapter
+    _drop_sessions()
+
+
+def record(path) -> FixtureArchive:
+    """
+    Record every response from now on to the archive at `path` (an existing
+    archive is extended). Saved by live(), replay() and at exit.
+    """
+    archive = FixtureArchive(path)
+    if archive.path.exists():
+        archive.load()
+    _switch(archive)
+    return archive
+
+
+def replay(
+    path,
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    error_rate: float = 0.0,
+    seed: Optional[int] = None,
+) -> ReplayAdapter:
+    """Serve every request from the archive at `path` instead of the network."""
+    adapter = ReplayAdapter(FixtureArchive(path).load(), latency_ms, jitter_ms, error_rate, seed)
+    _switch(adapter)
+    return adapter
+
+
+def live() -> None:
+    """Back to live requests (saves an archive being recorded)."""
+    _switch(None)
+
+
+@atexit.register
+def _save_recording() -> None:
+    if isinstance(_fixture, FixtureArchive):
+        _fixture.save()
+
+
+def add_fixture_arguments(parser) -> None:
+    """--record / --replay options for scripts that talk to the APIs."""
+    group = parser.add_argument_group("HTTP fixtures")
+    group.add_argument("--record", metavar="ARCHIVE", help="Record all API responses to this archive")
+    group.add_argument("--replay", metavar="ARCHIVE", help="Serve all API requests from this archive (no network)")
+    group.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per replayed request")
+    group.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency per replayed request")
+    group.add_argument("--error-rate", type=float, default=0.0, help="Share of replayed requests that fail")
+    group.add_argument("--seed", type=int, default=None, help="Seed for replay jitter and errors")
+
+
+def apply_fixture_arguments(args) -> None:
+    """Switch to recording or replay according to add_fixture_arguments options."""
+    if args.record and args.replay:
+        raise SystemExit("--record and --replay cannot be used together")
+    if args.record:
+        record(args.record)
+    elif args.replay:
+        replay(args.replay, args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
@@ -0,0 +1,160 @@
+"""
+Speed-limit features for a whole fleet of vehicles in one process.
+
+nvdb_speed.get_speed_limit_data keeps its road-loyalty state in one global,
+and SpeedController holds the state of a single vehicle. FleetController
+keeps a small VehicleState per vehicle (last road link, last speed limit,
+last fix time) and processes a tick of GPS fixes for all vehicles
+concurrently with asyncio. Lookups go through nvdb_async.AsyncNvdbClient,
+which fetches all road candidates of a fix in parallel; without aiohttp they
+fall back to the blocking nvdb_speed lookup in a thread pool. Every vehicle
+shares nvdb_speed's caches and one connection pool, so vehicles on the same
+road reuse each other's lookups.
+
+Usage:
+    from fleet_controller import FleetController
+
+    fleet = FleetController()
+    features = fleet.run_tick([("bus-1", 63.4305, 10.3951), ("bus-2", 59.8358, 10.4232)])
+    features["bus-1"]   # engineered features dict, or None
+
+    fleet.close()
+
+    # Inside a running event loop:
+    features = await fleet.process_tick(fixes)
+    await fleet.aclose()
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import speed_features
+from nvdb_speed import get_speed_limit_data, http_client
+
+try:
+    from nvdb_async import AsyncNvdbClient
+except ImportError:  # aiohttp not installed
+    AsyncNvdbClient = None
+
+DEFAULT_CONCURRENCY = 64
+
+
+class VehicleState:
+    __slots__ = ("last_veglenke_id", "last_speed_limit", "last_timestamp")
+
+    def __init__(self):
+        self.last_veglenke_id = None
+        self.last_speed_limit = None
+        self.last_timestamp = None
+
+
+class FleetController:
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY, use_async_client=True):
+        """
+        max_concurrency:  NVDB requests in flight at once, across all vehicles.
+        use_async_client: use nvdb_async (needs aiohttp) instead of threads.
+        """
+        self.max_concurrency = max_concurrency
+        self.vehicles = {}
+        self._client = None
+        self._executor = None
+        # Event loop for run_tick, kept across ticks so the async client's
+        # connections stay open between them
+        self._loop = None
+        if use_async_client and AsyncNvdbClient is not None:
+            self._client = AsyncNvdbClient(maks_samtidige=max_concurrency)
+        else:
+            # One thread per concurrent lookup; the lookups themselves block on HTTP
+            self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="fleet-nvdb")
+            if http_client.POOL_MAXSIZE < max_concurrency:
+                http_client.configure(pool_maxsize=max_concurrency)
+
+    def state(self, vehicle_id):
+        state = self.vehicles.get(vehicle_id)
+        if state is None:
+            state = self.vehicles[vehicle_id] = VehicleState()
+        return state
+
+    def forget(self, vehicle_id):
+        self.vehicles.pop(vehicle_id, None)
+
+    async def _lookup(self, lat, lon, last_veglenke_id):
+        if self._client is not None:
+            return await self._client.get_speed_limit_data(lat, lon, last_veglenke_id)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, get_speed_limit_data, lat, lon, last_veglenke_id)
+
+    async def process_fix(self, vehicle_id, lat, lon, timestamp=None):
+        """
+        Engineered features for one fix of one vehicle, or None if no speed
+        limit was found. Fixes older than the vehicle's last fix are ignored.
+        """
+        state = self.state(vehicle_id)
+        timestamp = time.time() if timestamp is None else timestamp
+        if state.last_timestamp is not None and timestamp < state.last_timestamp:
+            return None
+
+        try:
+            raw_data = await self._lookup(lat, lon, state.last_veglenke_id)
+        except Exception as e:
+            # One vehicle's failed lookup must not fail the whole tick
+            raw_data = {"status": "error", "message": str(e)}
+        state.last_timestamp = timestamp
+        if not raw_data or raw_data["status"] != "ok":
+            return None
+
+        engineered = speed_features.engineer_all_features(raw_data, previous_speed_limit=state.last_speed_limit)
+        state.last_speed_limit = raw_data["fartsgrense"]
+        state.last_veglenke_id = raw_data.get("veglenke_id")
+        return engineered
+
+    async def _process_vehicle(self, vehicle_id, fixes, semaphore):
+        result = None
+        # A vehicle's own fixes run in order, since each depends on the last road
+        for fix in fixes:
+            async with semaphore:
+                result = await self.process_fix(vehicle_id, *fix)
+        return result
+
+    async def process_tick(self, fixes):
+        """
+        fixes: iterable of (vehicle_id, lat, lon) or (vehicle_id, lat, lon, timestamp).
+        Returns {vehicle_id: features or None} for the latest fix of each vehicle.
+        """
+        per_vehicle = {}
+        for vehicle_id, *fix in fixes:
+            per_vehicle.setdefault(vehicle_id, []).append(fix)
+
+        # Bounds the vehicles being processed at once; the async client has
+        # its own limit on requests in flight
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(
+            self._process_vehicle(vehicle_id, vehicle_fixes, semaphore)
+            for vehicle_id, vehicle_fixes in per_vehicle.items()
+        ))
+        return dict(zip(per_vehicle, results))
+
+    def run_tick(self, fixes):
+        """
+        process_tick for callers without an event loop. Every call runs on
+        the same private loop, so connections are reused from tick to tick;
+        close() releases them.
+        """
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self.process_tick(fixes))
+
+    async def aclose(self):
+        """Close the async client's connections (for callers that use process_tick)."""
+        if self._client is not None:
+            await self._client.close()
+
+    def close(self):
+        if self._loop is not None and not self._loop.is_closed():
+            # The client's connections belong to run_tick's loop
+            self._loop.run_until_complete(self.aclose())
+            self._loop.close()
+        self._loop = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
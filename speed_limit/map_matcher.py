@@ -0,0 +1,301 @@
+"""
+Incremental HMM map matching on cached NVDB road geometry.
+
+The road loyalty in nvdb_speed.get_speed_limit_data remembers a single
+veglenkesekvensid and keeps to it while it is within 30 m, which still jumps
+roads at junctions. MapMatcher instead decodes the most likely road links
+for a sliding window of fixes with an online Viterbi (hidden Markov model,
+after Newson & Krumm):
+
+  emission   - distance from the fix to the road (Gaussian, GPS_SIGMA_M),
+               and the angle between the vehicle heading and the road
+  transition - how well the distance driven along the road network matches
+               the straight-line distance between consecutive fixes, so
+               switching to a road that is not connected is expensive
+
+Candidates and geometry come from nvdb_tiles tiles, so every fix is matched
+locally; NVDB is only queried when a fix falls in a tile that is not cached
+yet (or is stale).
+
+Usage:
+    from map_matcher import MapMatcher
+
+    matcher = MapMatcher()                    # or MapMatcher(store="tiles/")
+    for lat, lon, t in fixes:
+        res = matcher.update(lat, lon, timestamp=t)
+        res["fartsgrense"], res["veglenke_id"], res["relativ_posisjon"]
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+import nvdb_speed
+from nvdb_speed import _lag_resultat
+from nvdb_tiles import DEFAULT_MAX_AGE_S, MAKS_ANTALL, MAKS_AVSTAND, Tile, TileStore, fetch_tile_arrays, tile_key
+
+# Standard deviation of the GPS position error
+GPS_SIGMA_M = 5.0
+# Scale of the allowed difference between driven and straight-line distance
+TRANSITION_BETA_M = 5.0
+# Standard deviation of the heading relative to the road direction
+HEADING_SIGMA_DEG = 30.0
+# Below this speed (m/s) or movement the heading is too noisy to use
+MIN_HEADING_SPEED = 2.0
+MIN_HEADING_MOVE_M = 3.0
+# The derived heading spans this many recent fixes, to average out GPS noise
+HEADING_FIXES = 3
+
+# Link ends closer than this are treated as connected (junctions, link splits)
+JOIN_M = 2.0
+# Extra driven distance assumed for a switch between links that do not touch
+JUMP_PENALTY_M = 50.0
+
+# Fixes kept for decoding, and when to start over instead of connecting
+WINDOW = 10
+RESET_GAP_S = 30.0
+RESET_DISTANCE_M = 500.0
+
+MAX_TILES_IN_MEMORY = 16
+
+
+class MemoryTiles:
+    """Tiles fetched from NVDB into memory only, with the TileStore interface."""
+
+    def __init__(self, max_tiles=MAX_TILES_IN_MEMORY, max_age_s=DEFAULT_MAX_AGE_S):
+        self.max_tiles = max_tiles
+        self.max_age_s = max_age_s
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tile(self, key):
+        """The tile for the key, or None if it is missing or stale."""
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                return None
+            self._tiles.move_to_end(key)
+        if time.time() - tile.fetched_at > self.max_age_s:
+            return None
+        return tile
+
+    def fetch(self, key):
+        tile = Tile(fetch_tile_arrays(key))
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+
+# Shared by all matchers without a tile store, so vehicles reuse each other's tiles
+MEMORY_TILES = MemoryTiles()
+
+
+class Candidate:
+    """One road position a fix may belong to."""
+
+    __slots__ = ("tile", "s", "key", "avstand", "langs", "bearing")
+
+    def __init__(self, tile, s, avstand, langs, bearing):
+        self.tile = tile
+        self.s = s
+        # The same segment appears in neighbouring tiles (margin), so it is
+        # identified by its link and interval rather than by tile index
+        self.key = (tile.seg_vls[s], tile.seg_start[s], tile.seg_slutt[s])
+        self.avstand = avstand
+        self.langs = langs
+        self.bearing = bearing
+
+    def ends(self):
+        x0, y0, x1, y1 = self.tile.seg_ender[self.s]
+        return ((x0, y0, 0.0), (x1, y1, self.tile.seg_lengde[self.s]))
+
+    @property
+    def veglenke_id(self):
+        return self.tile.seg_vls[self.s]
+
+    @property
+    def rel_posisjon(self):
+        return self.tile.rel_posisjon(self.s, self.langs)
+
+    def result(self):
+        """Result dict in the format of nvdb_speed.get_speed_limit_data."""
+        rel_pos = self.rel_posisjon
+        fart = self.tile.fartsgrense(self.veglenke_id, rel_pos)
+        if fart is None:
+            return {"status": "error", "message": "Ingen fartsgrense funnet på veien", "veglenke_id": self.veglenke_id}
+        match = {
+            "veglenkesekvens": {"veglenkesekvensid": self.veglenke_id, "relativPosisjon": rel_pos},
+            "vegsystemreferanse": {"kortform": self.tile.seg_vei[self.s]},
+            "avstand": self.avstand,
+        }
+        result = _lag_resultat(match, fart)
+        result["relativ_posisjon"] = rel_pos
+        return result
+
+
+def _bearing(dx, dy):
+    """Compass bearing in degrees (0 = north) of a move dx east, dy north."""
+    return math.degrees(math.atan2(dx, dy)) % 360.0
+
+
+def _route_distance(a, b):
+    """Distance driven from candidate a to b, or inf if their links do not touch."""
+    if a.key == b.key:
+        return abs(b.langs - a.langs)
+    best = math.inf
+    for ax, ay, a_langs in a.ends():
+        for bx, by, b_langs in b.ends():
+            if abs(ax - bx) <= JOIN_M and abs(ay - by) <= JOIN_M:
+                best = min(best, abs(a.langs - a_langs) + abs(b.langs - b_langs))
+    return best
+
+
+class MapMatcher:
+    def __init__(self, store=None, window=WINDOW, gps_sigma_m=GPS_SIGMA_M):
+        """
+        store:  TileStore or tile directory; missing or stale tiles are
+                downloaded into it. Defaults to nvdb_speed.OFFLINE_STORE, and
+                without one tiles are fetched into the shared MEMORY_TILES.
+        window: number of recent fixes kept for decoding (see matched_path).
+        """
+        if isinstance(store, (str, bytes)) or hasattr(store, "__fspath__"):
+            store = TileStore(store)
+        self.store = store or nvdb_speed.OFFLINE_STORE or MEMORY_TILES
+        self.gps_sigma_m = gps_sigma_m
+        self._columns = deque(maxlen=window)
+        self._last_fix = None
+        self._recent = deque(maxlen=HEADING_FIXES)
+        self._tile_key = None
+        self._tile = None
+
+    def reset(self):
+        self._columns.clear()
+        self._last_fix = None
+        self._recent.clear()
+
+    def _tile_for(self, ost, nord):
+        key = tile_key(ost, nord)
+        # A vehicle can stay in one tile for longer than the tile lives
+        if key != self._tile_key or time.time() - self._tile.fetched_at > self.store.max_age_s:
+            tile = self.store.tile(key)
+            if tile is None:
+                tile = self.store.fetch(key)
+            self._tile_key, self._tile = key, tile
+        return self._tile
+
+    def _candidates(self, ost, nord):
+        tile = self._tile_for(ost, nord)
+        candidates = []
+        for s, avstand, langs, pid in tile.snap(ost, nord, MAKS_AVSTAND, MAKS_ANTALL):
+            x0, y0, x1, y1 = tile.pieces[pid][:4]
+            candidates.append(Candidate(tile, s, avstand, langs, _bearing(x1 - x0, y1 - y0) % 180.0))
+        return candidates
+
+    def _emission(self, cand, heading):
+        logp = -0.5 * (cand.avstand / self.gps_sigma_m) ** 2
+        if heading is not None:
+            # Roads are matched without direction, so compare modulo 180°
+            diff = abs(heading - cand.bearing) % 180.0
+            diff = min(diff, 180.0 - diff)
+            logp -= 0.5 * (diff / HEADING_SIGMA_DEG) ** 2
+        return logp
+
+    @staticmethod
+    def _transition(a, b, straight, max_travel):
+        route = _route_distance(a, b)
+        if route == math.inf:
+            route = straight + JUMP_PENALTY_M
+        logp = -abs(route - straight) / TRANSITION_BETA_M
+        if max_travel is not None and route > max_travel:
+            logp -= (route - max_travel) / TRANSITION_BETA_M
+        return logp
+
+    def update(self, lat, lon, timestamp=None, heading=None, speed=None):
+        """
+        Add a fix and return the match for it, in the format of
+        nvdb_speed.get_speed_limit_data plus "relativ_posisjon".
+
+        heading: compass degrees, speed: m/s (both optional). Without a
+        heading it is derived from the movement since the previous fix.
+        """
+        ost, nord = nvdb_speed.transformer.transform(lon, lat)
+        return self.update_utm(ost, nord, timestamp, heading, speed)
+
+    def update_utm(self, ost, nord, timestamp=None, heading=None, speed=None):
+        """update() for a fix already in EPSG:5973."""
+        timestamp = time.time() if timestamp is None else timestamp
+
+        straight = dt = None
+        if self._last_fix is not None:
+            last_ost, last_nord, last_t = self._last_fix
+            straight = math.hypot(ost - last_ost, nord - last_nord)
+            dt = timestamp - last_t
+            if dt > RESET_GAP_S or straight > RESET_DISTANCE_M:
+                self._columns.clear()
+                self._recent.clear()
+        if heading is None and self._recent:
+            first_ost, first_nord = self._recent[0]
+            if math.hypot(ost - first_ost, nord - first_nord) >= MIN_HEADING_MOVE_M:
+                heading = _bearing(ost - first_ost, nord - first_nord)
+        if speed is not None and speed < MIN_HEADING_SPEED:
+            heading = None
+        self._last_fix = (ost, nord, timestamp)
+        self._recent.append((ost, nord))
+
+        candidates = self._candidates(ost, nord)
+        if not candidates:
+            self._columns.clear()
+            return {"status": "error", "message": "Ingen vei funnet"}
+
+        max_travel = None
+        if speed is not None and dt is not None and dt > 0:
+            max_travel = 1.5 * speed * dt + 2 * self.gps_sigma_m
+
+        prev = self._columns[-1] if self._columns else None
+        column = []
+        for cand in candidates:
+            logp, back = self._emission(cand, heading), -1
+            if prev is not None:
+                best, back = max(
+                    (prev_logp + self._transition(prev_cand, cand, straight, max_travel), i)
+                    for i, (prev_cand, prev_logp, _) in enumerate(prev)
+                )
+                logp += best
+            column.append((cand, logp, back))
+
+        # Keep the numbers small over long drives
+        top = max(logp for _, logp, _ in column)
+        column = [(cand, logp - top, back) for cand, logp, back in column]
+        self._columns.append(column)
+
+        return max(column, key=lambda c: c[1])[0].result()
+
+    get_speed_limit_data = update
+
+    @property
+    def current(self):
+        """The most likely Candidate for the latest fix, or None."""
+        if not self._columns:
+            return None
+        return max(self._columns[-1], key=lambda c: c[1])[0]
+
+    def matched_path(self):
+        """
+        The most likely links for the fixes in the window, oldest first, as
+        (veglenke_id, relativ_posisjon). Unlike update(), earlier fixes are
+        revised in the light of the later ones.
+        """
+        if not self._columns:
+            return []
+        i = max(range(len(self._columns[-1])), key=lambda k: self._columns[-1][k][1])
+        path = []
+        for column in reversed(self._columns):
+            cand, _, back = column[i]
+            path.append((cand.veglenke_id, cand.rel_posisjon))
+            i = back
+            if i < 0:
+                break
+        return path[::-1]
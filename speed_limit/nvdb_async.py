@@ -0,0 +1,154 @@
+"""
+Asynkron NVDB-klient (aiohttp) for fartsgrense-oppslag.
+
+Samme resultat som nvdb_speed.get_speed_limit_data, men fartsgrense-objektene
+for alle vei-kandidatene fra /posisjon hentes samtidig i stedet for én etter
+én. Et oppslag koster dermed høyst to runder mot NVDB (/posisjon, så alle
+kandidatene parallelt), også når de nærmeste kandidatene mangler fartsgrense.
+Valget mellom kandidatene følger de samme reglene: forrige vei hvis den er
+innenfor LOJALITET_AVSTAND, ellers nærmeste kandidat med fartsgrense.
+
+Cachene i nvdb_speed (POSISJON_CACHE, FARTSGRENSE_CACHE) og offline-lageret
+deles med den synkrone koden. Én semafor begrenser antall samtidige kall mot
+NVDB for alle som bruker samme klient.
+
+Bruk:
+    async with AsyncNvdbClient() as klient:
+        res = await klient.get_speed_limit_data(59.835764, 10.423201, last_veglenke_id=None)
+"""
+
+import asyncio
+
+import aiohttp
+
+import nvdb_speed
+from nvdb_speed import (
+    NVDB_HEADERS,
+    NVDB_OBJEKT_URL,
+    NVDB_POSISJON_URL,
+    POSISJON_CACHE,
+    _cache_stedfestinger,
+    _fra_cache,
+    _lag_resultat,
+    _les_fartsgrense,
+    _objekt_params,
+    _posisjon_params,
+    _snap_celle,
+    transformer,
+)
+
+# Samme grense som den synkrone smarte logikken
+LOJALITET_AVSTAND = 30
+
+# Kall mot NVDB som kan være underveis samtidig, for alle kjøretøy til sammen
+MAKS_SAMTIDIGE = 16
+
+
+def _params(params):
+    # aiohttp godtar bare str/int/float i query-parametre
+    return {k: str(v) for k, v in params.items()}
+
+
+class AsyncNvdbClient:
+    def __init__(self, maks_samtidige=MAKS_SAMTIDIGE, timeout_s=10):
+        self.maks_samtidige = maks_samtidige
+        self.timeout = aiohttp.ClientTimeout(total=timeout_s)
+        self._semafor = asyncio.Semaphore(maks_samtidige)
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _hent_session(self):
+        # Lages i løkka som bruker den; close() nullstiller for neste løkke
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.maks_samtidige)
+            self._session = aiohttp.ClientSession(headers=NVDB_HEADERS, timeout=self.timeout, connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        # Semaforen kan være bundet til løkka som nå avsluttes
+        self._semafor = asyncio.Semaphore(self.maks_samtidige)
+
+    async def _get_json(self, url, params):
+        async with self._semafor:
+            async with self._hent_session().get(url, params=_params(params)) as resp:
+                return resp.status, await resp.json(content_type=None)
+
+    async def hent_posisjon(self, ost, nord):
+        """Snapper til vegnettet via /posisjon, med samme cache som nvdb_speed."""
+        celle = _snap_celle(ost, nord)
+        pos_data = POSISJON_CACHE.get(celle)
+        if pos_data is not None:
+            return pos_data
+
+        status, pos_data = await self._get_json(NVDB_POSISJON_URL, _posisjon_params(ost, nord))
+        if status == 200 and isinstance(pos_data, list):
+            POSISJON_CACHE.put(celle, pos_data)
+        return pos_data
+
+    async def fartsgrense_for_match(self, match):
+        resultat = _fra_cache(match)
+        if resultat is not None:
+            return resultat
+
+        try:
+            status, data = await self._get_json(NVDB_OBJEKT_URL, _objekt_params(match))
+            if status == 200:
+                obj_list = data.get("objekter", [])
+                if obj_list:
+                    fart = _les_fartsgrense(obj_list[0])
+                    if fart:
+                        _cache_stedfestinger(obj_list[0], fart)
+                        return _lag_resultat(match, fart)
+        except Exception:
+            # En kandidat som feiler (nett, uventet svar) skal ikke felle de andre
+            pass
+        return None
+
+    async def finn_fartsgrense(self, ost, nord, last_veglenke_id=None):
+        """Som nvdb_speed.finn_fartsgrense, med alle kandidatene hentet parallelt."""
+        if not nvdb_speed.USE_SMART_LOGIC:
+            last_veglenke_id = None
+
+        # --- OFFLINE: bruk lokalt lager hvis ruta finnes og er fersk ---
+        if nvdb_speed.OFFLINE_STORE is not None:
+            resultat = nvdb_speed.OFFLINE_STORE.lookup(ost, nord, last_veglenke_id)
+            if resultat is not None:
+                return resultat
+
+        try:
+            pos_data = await self.hent_posisjon(ost, nord)
+            if not pos_data:
+                return {"status": "error", "message": "Ingen vei funnet"}
+
+            resultater = await asyncio.gather(*(self.fartsgrense_for_match(m) for m in pos_data))
+
+            # --- SMART LOGIKK: forrige vei hvis den fortsatt er nær nok ---
+            if last_veglenke_id is not None:
+                for match, resultat in zip(pos_data, resultater):
+                    if match.get('veglenkesekvens', {}).get('veglenkesekvensid') == last_veglenke_id:
+                        if match.get('avstand', 100) < LOJALITET_AVSTAND and resultat:
+                            return resultat
+                        break
+
+            # --- STANDARD: nærmeste kandidat som har fartsgrense ---
+            for resultat in resultater:
+                if resultat:
+                    return resultat
+
+            return {"status": "error", "message": "Ingen fartsgrense funnet i nærheten"}
+
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    async def get_speed_limit_data(self, lat, lon, last_veglenke_id=None):
+        """Fartsgrense for en GPS-posisjon. Tilstanden (last_veglenke_id) holdes av kalleren."""
+        ost, nord = transformer.transform(lon, lat)
+        return await self.finn_fartsgrense(ost, nord, last_veglenke_id)
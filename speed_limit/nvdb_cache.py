@@ -0,0 +1,109 @@
+"""
+Small in-process caches for NVDB lookups.
+
+TTLCache      - LRU cache with a time-to-live per entry, used for /posisjon
+                snapping results keyed by a quantized (ost, nord) cell.
+IntervalCache - speed-limit values per veglenkesekvens, stored as the
+                relative-position intervals the speed-limit objects cover,
+                so any later fix that snaps into a cached interval is
+                answered without a request.
+
+Both are bounded in size (least recently used entries are evicted first)
+and safe to share between threads.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU cache where every entry also expires `ttl` seconds after it was stored."""
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class IntervalCache:
+    """
+    Values per veglenkesekvensid, each valid for a [start, end] interval of
+    relative position (0.0 - 1.0) along the link.
+
+    Eviction is per link: when more than `max_links` links are cached, the
+    least recently used link and all of its intervals are dropped.
+    """
+
+    def __init__(self, max_links=2048, ttl=600.0):
+        self.max_links = max_links
+        self.ttl = ttl
+        self._links = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, veglenkesekvensid, rel_pos):
+        """Return the cached value covering `rel_pos` on the link, or None."""
+        if veglenkesekvensid is None or rel_pos is None:
+            return None
+        with self._lock:
+            intervals = self._links.get(veglenkesekvensid)
+            if not intervals:
+                return None
+            now = time.monotonic()
+            intervals[:] = [iv for iv in intervals if iv[3] >= now]
+            if not intervals:
+                del self._links[veglenkesekvensid]
+                return None
+            self._links.move_to_end(veglenkesekvensid)
+            for start, end, value, _expires in intervals:
+                if start <= rel_pos <= end:
+                    return value
+            return None
+
+    def add(self, veglenkesekvensid, start, end, value):
+        if veglenkesekvensid is None or start is None or end is None:
+            return
+        start, end = min(start, end), max(start, end)
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            intervals = self._links.setdefault(veglenkesekvensid, [])
+            # Replace an identical extent instead of stacking duplicates
+            intervals[:] = [iv for iv in intervals if (iv[0], iv[1]) != (start, end)]
+            intervals.append((start, end, value, expires))
+            self._links.move_to_end(veglenkesekvensid)
+            while len(self._links) > self.max_links:
+                self._links.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._links.clear()
+
+    def __len__(self):
+        return len(self._links)
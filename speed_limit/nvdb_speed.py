@@ -1,6 +1,19 @@
-import requests
+import sys
+from pathlib import Path
+
 from pyproj import Transformer
 
+# Skriptene i speed_limit/ henter http_client herfra (from nvdb_speed import
+# http_client), så denne reserveløsningen for sys.path finnes bare ett sted
+try:
+    import http_client
+except ImportError:
+    # Kjøres skriptene direkte fra speed_limit/, ligger http_client.py i mappen over
+    sys.path.append(str(Path(__file__).resolve().parent.parent))
+    import http_client
+
+from nvdb_cache import IntervalCache, TTLCache
+
 # --- Konfigurasjon ---
 NVDB_BASE_URL = "https://nvdbapiles.atlas.vegvesen.no"
 NVDB_POSISJON_URL = f"{NVDB_BASE_URL}/vegnett/api/v4/posisjon"
@@ -22,68 +35,165 @@ LAST_VEGLENKE_ID = None
 # Transformator fra GPS (WGS84) til NVDB (UTM33)
 transformer = Transformer.from_crs("EPSG:4326", "EPSG:5973", always_xy=True)
 
-def _fetch_fartsgrense_for_match(match):
-    """Hjelpefunksjon for å hente fartsgrense-objektet fra NVDB for en spesifikk vei-match."""
-    vls = match.get('veglenkesekvens', {})
-    vls_id = vls.get('veglenkesekvensid')
-    rel_pos = vls.get('relativPosisjon')
-    vsys = match.get('vegsystemreferanse', {})
-    veg_navn = vsys.get('kortform', 'Ukjent vei')
+# --- CACHE ---
+# Fartsgrenser per veglenkesekvens og relativ posisjon. Intervallet hentes fra
+# stedfestingen til fartsgrense-objektet, så alle punkter langs samme strekning
+# besvares uten nytt kall.
+FARTSGRENSE_CACHE = IntervalCache(max_links=4096, ttl=30 * 60)
+
+# /posisjon-svar per rute på SNAP_CELL_M x SNAP_CELL_M meter (UTM33)
+SNAP_CELL_M = 5.0
+POSISJON_CACHE = TTLCache(maxsize=4096, ttl=30 * 60)
+
+
+# --- OFFLINE-LAGER ---
+# Settes med bruk_offline_lager(). Når lageret har en fersk rute for punktet,
+# besvares oppslaget lokalt; ellers brukes NVDB-API-et som før.
+OFFLINE_STORE = None
+
+
+def bruk_offline_lager(lager_dir, max_age_s=None):
+    """Slår på offline-oppslag fra rutene i lager_dir (se nvdb_tiles.py). None slår av."""
+    global OFFLINE_STORE
+    if lager_dir is None:
+        OFFLINE_STORE = None
+        return None
+    # Importeres her fordi nvdb_tiles selv importerer denne modulen
+    from nvdb_tiles import DEFAULT_MAX_AGE_S, TileStore
+    OFFLINE_STORE = TileStore(lager_dir, max_age_s=max_age_s or DEFAULT_MAX_AGE_S)
+    return OFFLINE_STORE
+
+
+def clear_caches():
+    """Tømmer begge cachene (f.eks. før en ny simulering)."""
+    FARTSGRENSE_CACHE.clear()
+    POSISJON_CACHE.clear()
+
+
+def _lag_resultat(match, fart):
+    vls_id = match.get('veglenkesekvens', {}).get('veglenkesekvensid')
+    veg_navn = match.get('vegsystemreferanse', {}).get('kortform', 'Ukjent vei')
     distanse = match.get('avstand', 0)
+    return {
+        "status": "ok",
+        "fartsgrense": int(fart),
+        "vei": veg_navn,
+        "veglenke_id": vls_id, # Lagrer denne for å huske veien
+        "avstand_meter": round(distanse, 1),
+        "full_info": f"{fart} km/t på {veg_navn}"
+    }
 
-    obj_params = {
-        "veglenkesekvens": f"{rel_pos}@{vls_id}",
-        "inkluder": "egenskaper",
+
+def _cache_stedfestinger(objekt, fart):
+    """Legger alle strekningene fartsgrense-objektet dekker inn i FARTSGRENSE_CACHE."""
+    for sted in objekt.get("lokasjon", {}).get("stedfestinger", []):
+        FARTSGRENSE_CACHE.add(
+            sted.get("veglenkesekvensid"),
+            sted.get("startposisjon"),
+            sted.get("sluttposisjon"),
+            int(fart),
+        )
+
+
+def _les_fartsgrense(objekt):
+    """Fartsgrense-verdien (egenskap 2021) i et vegobjekt, eller None."""
+    for e in objekt.get("egenskaper", []):
+        if e["id"] == 2021:
+            return e["verdi"]
+    return None
+
+
+def _objekt_params(match):
+    vls = match.get('veglenkesekvens', {})
+    return {
+        "veglenkesekvens": f"{vls.get('relativPosisjon')}@{vls.get('veglenkesekvensid')}",
+        "inkluder": "egenskaper,lokasjon",
         "srid": 5973
     }
-    
+
+
+def _fra_cache(match):
+    """Resultat for matchen fra FARTSGRENSE_CACHE, eller None."""
+    vls = match.get('veglenkesekvens', {})
+    fart = FARTSGRENSE_CACHE.lookup(vls.get('veglenkesekvensid'), vls.get('relativPosisjon'))
+    if fart is not None:
+        return _lag_resultat(match, fart)
+    return None
+
+
+def _fetch_fartsgrense_for_match(match):
+    """Hjelpefunksjon for å hente fartsgrense-objektet fra NVDB for en spesifikk vei-match."""
+    resultat = _fra_cache(match)
+    if resultat is not None:
+        return resultat
+
     try:
-        obj_resp = requests.get(NVDB_OBJEKT_URL, params=obj_params, headers=NVDB_HEADERS, timeout=5)
+        obj_resp = http_client.get(NVDB_OBJEKT_URL, params=_objekt_params(match), headers=NVDB_HEADERS, timeout=5)
         if obj_resp.status_code == 200:
             obj_list = obj_resp.json().get("objekter", [])
             if obj_list:
-                fart = None
-                for e in obj_list[0].get("egenskaper", []):
-                    if e["id"] == 2021:
-                        fart = e["verdi"]
-                        break
+                fart = _les_fartsgrense(obj_list[0])
                 if fart:
-                    return {
-                        "status": "ok",
-                        "fartsgrense": int(fart),
-                        "vei": veg_navn,
-                        "veglenke_id": vls_id, # Lagrer denne for å huske veien
-                        "avstand_meter": round(distanse, 1),
-                        "full_info": f"{fart} km/t på {veg_navn}"
-                    }
+                    _cache_stedfestinger(obj_list[0], fart)
+                    return _lag_resultat(match, fart)
     except Exception:
         pass
     return None
 
-def get_speed_limit_data(lat, lon):
-    """
-    Hovedfunksjon for å hente fartsgrense.
-    Velger metode basert på konfigurasjon (Naive vs Smart).
-    """
-    global LAST_VEGLENKE_ID
-    
-    ost, nord = transformer.transform(lon, lat)
-    pos_params = {
+
+def _snap_celle(ost, nord):
+    return (int(ost // SNAP_CELL_M), int(nord // SNAP_CELL_M))
+
+
+def _posisjon_params(ost, nord):
+    return {
         "nord": nord, "ost": ost, "srid": 5973, 
         "maks_avstand": 40, "maks_antall": 5, "trafikantgruppe": "K"
     }
-    
+
+
+def _hent_posisjon(ost, nord, pos_params):
+    """Snapper til vegnettet via /posisjon, med cache per rute."""
+    celle = _snap_celle(ost, nord)
+    pos_data = POSISJON_CACHE.get(celle)
+    if pos_data is not None:
+        return pos_data
+
+    pos_resp = http_client.get(NVDB_POSISJON_URL, params=pos_params, headers=NVDB_HEADERS, timeout=10)
+    pos_data = pos_resp.json()
+    if pos_resp.status_code == 200 and isinstance(pos_data, list):
+        POSISJON_CACHE.put(celle, pos_data)
+    return pos_data
+
+# Standardverdi for last_veglenke_id: bruk (og oppdater) den globale LAST_VEGLENKE_ID
+_GLOBAL_TILSTAND = object()
+
+
+def finn_fartsgrense(ost, nord, last_veglenke_id=None):
+    """
+    Fartsgrense for et punkt i UTM33, uten global tilstand.
+    last_veglenke_id er veien kjøretøyet sist var på (smart logikk), eller None.
+    Resultatet har "veglenke_id", som sendes inn som last_veglenke_id neste gang.
+    """
+    if not USE_SMART_LOGIC:
+        last_veglenke_id = None
+
+    # --- OFFLINE: bruk lokalt lager hvis ruta finnes og er fersk ---
+    if OFFLINE_STORE is not None:
+        resultat = OFFLINE_STORE.lookup(ost, nord, last_veglenke_id)
+        if resultat is not None:
+            return resultat
+
     try:
-        pos_resp = requests.get(NVDB_POSISJON_URL, params=pos_params, headers=NVDB_HEADERS, timeout=10)
-        pos_data = pos_resp.json()
+        pos_data = _hent_posisjon(ost, nord, _posisjon_params(ost, nord))
         
         if not pos_data:
             return {"status":"error", "message": "Ingen vei funnet"}
 
         # --- METODE 1: SMART LOGIKK (Vei-lojalitet) ---
-        if USE_SMART_LOGIC and LAST_VEGLENKE_ID is not None:
+        if last_veglenke_id is not None:
             # Sjekk om veien vi var på sist fortsatt er i topp 5 lista
-            prioritert_match = next((m for m in pos_data if m.get('veglenkesekvens', {}).get('veglenkesekvensid') == LAST_VEGLENKE_ID), None)
+            prioritert_match = next((m for m in pos_data if m.get('veglenkesekvens', {}).get('veglenkesekvensid') == last_veglenke_id), None)
             
             # Hvis vi fant den gamle veien, og den er innenfor rimelig avstand (f.eks 30m)
             if prioritert_match and prioritert_match.get('avstand', 100) < 30:
@@ -95,11 +205,33 @@ def get_speed_limit_data(lat, lon):
         for match in pos_data:
             resultat = _fetch_fartsgrense_for_match(match)
             if resultat:
-                # Oppdater hvilken vei vi er på nå slik at neste kall husker det
-                LAST_VEGLENKE_ID = resultat.get("veglenke_id")
                 return resultat
 
         return {"status":"error", "message": "Ingen fartsgrense funnet i nærheten"}
         
     except Exception as e:
-        return {"status":"error", "message": str(e)}
\ No newline at end of file
+        return {"status":"error", "message": str(e)}
+
+
+def get_speed_limit_data(lat, lon, last_veglenke_id=_GLOBAL_TILSTAND):
+    """
+    Hovedfunksjon for å hente fartsgrense.
+    Velger metode basert på konfigurasjon (Naive vs Smart).
+
+    Uten last_veglenke_id brukes og oppdateres den globale LAST_VEGLENKE_ID
+    (én vei for hele prosessen). Med last_veglenke_id (også None) holder
+    kalleren selv på tilstanden, f.eks. én per kjøretøy, og ingenting
+    globalt endres.
+    """
+    global LAST_VEGLENKE_ID
+
+    ost, nord = transformer.transform(lon, lat)
+
+    if last_veglenke_id is not _GLOBAL_TILSTAND:
+        return finn_fartsgrense(ost, nord, last_veglenke_id)
+
+    resultat = finn_fartsgrense(ost, nord, LAST_VEGLENKE_ID)
+    if resultat["status"] == "ok":
+        # Oppdater hvilken vei vi er på nå slik at neste kall husker det
+        LAST_VEGLENKE_ID = resultat.get("veglenke_id")
+    return resultat
@@ -1,4 +1,7 @@
-from nvdb_speed import get_speed_limit_data
+import argparse
+import time
+
+from nvdb_speed import get_speed_limit_data, http_client
 
 def run_tests():
     test_cases = [
@@ -21,6 +24,7 @@ def run_tests():
     print(header)
     print("-" * len(header))
 
+    start = time.perf_counter()
     for case in test_cases:
         res = get_speed_limit_data(case["lat"], case["lon"])
         
@@ -37,5 +41,10 @@ def run_tests():
         # 3. Print raden med samme dynamiske bredde
         print(f"{case['navn']:<{col_width}} | {status:<10} | {display_fart:<15} | {case['forventet_fart']}")
 
+    print(f"\nTid: {(time.perf_counter() - start) * 1000:.0f} ms for {len(test_cases)} oppslag")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test fartsgrense-oppslag mot kjente punkter")
+    http_client.add_fixture_arguments(parser)
+    http_client.apply_fixture_arguments(parser.parse_args())
     run_tests()
\ No newline at end of file
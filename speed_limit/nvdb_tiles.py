@@ -0,0 +1,404 @@
+"""
+Offline lager for fartsgrenser (NVDB vegobjekttype 105) og vegnett-geometri.
+
+Et område (kartutsnitt i EPSG:5973) lastes ned én gang og deles i ruter
+(tiles) på TILE_SIZE_M x TILE_SIZE_M meter. Hver rute lagres som en kompakt
+.npz-fil med vegsegmentene (geometri, veglenkesekvensid, start-/sluttposisjon,
+vegreferanse) og fartsgrense-intervallene per veglenkesekvens.
+
+Ved oppslag bygges et rutenett-indeks (grid index) over segmentbitene i ruta,
+slik at et punkt snappes lokalt uten nettverk. get_speed_limit_data() i
+nvdb_speed.py bruker dette lageret først og faller tilbake til NVDB-API-et
+når ruta mangler eller er for gammel.
+
+Bruk:
+    python nvdb_tiles.py download --kartutsnitt 261000,6647000,265000,6651000 --lager tiles/
+    python nvdb_tiles.py lookup 59.835764 10.423201 --lager tiles/
+"""
+
+import argparse
+import math
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from nvdb_speed import NVDB_BASE_URL, NVDB_HEADERS, NVDB_OBJEKT_URL, _lag_resultat, http_client, transformer
+
+NVDB_SEGMENTERT_URL = f"{NVDB_BASE_URL}/vegnett/api/v4/veglenkesekvenser/segmentert"
+
+# Størrelse på hver rute, og hvor mye ekstra vegnett som tas med rundt den
+# (slik at punkter nær kanten også finner veier i naboruta)
+TILE_SIZE_M = 2000
+TILE_MARGIN_M = 100
+
+# Cellestørrelse for den lokale rutenett-indeksen
+INDEX_CELL_M = 50.0
+
+# Ruter eldre enn dette regnes som utdaterte (online-oppslag brukes i stedet)
+DEFAULT_MAX_AGE_S = 7 * 24 * 3600
+
+# Samme grenser som online-oppslaget i nvdb_speed.get_speed_limit_data
+MAKS_AVSTAND = 40
+MAKS_ANTALL = 5
+LOJALITET_AVSTAND = 30
+
+PAGE_SIZE = 1000
+
+
+# ---------------------------------------------------------------------------
+# Nedlasting
+# ---------------------------------------------------------------------------
+
+def tile_key(ost, nord):
+    return int(ost // TILE_SIZE_M), int(nord // TILE_SIZE_M)
+
+
+def tile_bounds(key, margin=0.0):
+    tx, ty = key
+    return (
+        tx * TILE_SIZE_M - margin,
+        ty * TILE_SIZE_M - margin,
+        (tx + 1) * TILE_SIZE_M + margin,
+        (ty + 1) * TILE_SIZE_M + margin,
+    )
+
+
+def tiles_for_kartutsnitt(kartutsnitt):
+    """Alle rute-nøkler som dekker et kartutsnitt 'minx,miny,maxx,maxy' (eller tuple)."""
+    if isinstance(kartutsnitt, str):
+        kartutsnitt = [float(v) for v in kartutsnitt.split(",")]
+    minx, miny, maxx, maxy = kartutsnitt
+    tx0, ty0 = tile_key(minx, miny)
+    tx1, ty1 = tile_key(maxx, maxy)
+    return [(tx, ty) for tx in range(tx0, tx1 + 1) for ty in range(ty0, ty1 + 1)]
+
+
+def _hent_alle_sider(url, params):
+    """Henter alle sider fra et NVDB v4 liste-endepunkt (følger metadata.neste)."""
+    objekter = []
+    params = dict(params, antall=PAGE_SIZE)
+    while True:
+        resp = http_client.get(url, params=params, headers=NVDB_HEADERS, timeout=30)
+        resp.raise_for_status()
+        body = resp.json()
+        side = body.get("objekter", [])
+        objekter.extend(side)
+
+        neste = body.get("metadata", {}).get("neste")
+        if not side or not neste or not neste.get("start"):
+            return objekter
+        params = dict(params, start=neste["start"])
+
+
+def _parse_wkt_linestring(wkt):
+    """Koordinatene (ost, nord) fra en (MULTI)LINESTRING [Z] WKT-streng."""
+    if not wkt or "(" not in wkt:
+        return []
+    body = wkt[wkt.index("("):].replace("(", " ").replace(")", " ")
+    coords = []
+    for punkt in body.split(","):
+        verdier = punkt.split()
+        if len(verdier) >= 2:
+            coords.append((float(verdier[0]), float(verdier[1])))
+    return coords
+
+
+def fetch_tile_arrays(key):
+    """Henter vegnett og fartsgrenser for én rute fra NVDB, som numpy-arrays."""
+    kartutsnitt = ",".join(f"{v:.0f}" for v in tile_bounds(key, TILE_MARGIN_M))
+
+    segmenter = _hent_alle_sider(NVDB_SEGMENTERT_URL, {
+        "kartutsnitt": kartutsnitt, "srid": 5973, "trafikantgruppe": "K",
+    })
+    fartsgrenser = _hent_alle_sider(NVDB_OBJEKT_URL, {
+        "kartutsnitt": kartutsnitt, "srid": 5973, "inkluder": "egenskaper,lokasjon",
+    })
+
+    seg_xy, seg_offsets = [], [0]
+    seg_vls, seg_start, seg_slutt, seg_vei = [], [], [], []
+    for seg in segmenter:
+        coords = _parse_wkt_linestring(seg.get("geometri", {}).get("wkt"))
+        if len(coords) < 2:
+            continue
+        seg_xy.extend(coords)
+        seg_offsets.append(len(seg_xy))
+        seg_vls.append(seg.get("veglenkesekvensid"))
+        seg_start.append(seg.get("startposisjon", 0.0))
+        seg_slutt.append(seg.get("sluttposisjon", 1.0))
+        seg_vei.append(seg.get("vegsystemreferanse", {}).get("kortform", "Ukjent vei"))
+
+    lim_vls, lim_start, lim_slutt, lim_fart = [], [], [], []
+    for obj in fartsgrenser:
+        fart = next((e.get("verdi") for e in obj.get("egenskaper", []) if e.get("id") == 2021), None)
+        if not fart:
+            continue
+        for sted in obj.get("lokasjon", {}).get("stedfestinger", []):
+            if sted.get("veglenkesekvensid") is None:
+                continue
+            lim_vls.append(sted["veglenkesekvensid"])
+            lim_start.append(sted.get("startposisjon", 0.0))
+            lim_slutt.append(sted.get("sluttposisjon", 1.0))
+            lim_fart.append(int(fart))
+
+    return {
+        "fetched_at": np.float64(time.time()),
+        "seg_xy": np.asarray(seg_xy, dtype=np.float64).reshape(-1, 2),
+        "seg_offsets": np.asarray(seg_offsets, dtype=np.int64),
+        "seg_vls": np.asarray(seg_vls, dtype=np.int64),
+        "seg_start": np.asarray(seg_start, dtype=np.float64),
+        "seg_slutt": np.asarray(seg_slutt, dtype=np.float64),
+        "seg_vei": np.asarray(seg_vei, dtype=np.str_),
+        "lim_vls": np.asarray(lim_vls, dtype=np.int64),
+        "lim_start": np.asarray(lim_start, dtype=np.float64),
+        "lim_slutt": np.asarray(lim_slutt, dtype=np.float64),
+        "lim_fart": np.asarray(lim_fart, dtype=np.int16),
+    }
+
+
+def download_tile(key, lager_dir):
+    """Laster ned vegnett og fartsgrenser for én rute og lagrer den som .npz."""
+    lager_dir = Path(lager_dir)
+    lager_dir.mkdir(parents=True, exist_ok=True)
+    path = lager_dir / f"tile_{key[0]}_{key[1]}.npz"
+    np.savez_compressed(path, **fetch_tile_arrays(key))
+    return path
+
+
+def download_region(kartutsnitt, lager_dir, skip_fresh=True, max_age_s=DEFAULT_MAX_AGE_S):
+    """Laster ned alle rutene som dekker kartutsnittet. Returnerer listen med filer."""
+    store = TileStore(lager_dir, max_age_s=max_age_s)
+    paths = []
+    for key in tiles_for_kartutsnitt(kartutsnitt):
+        if skip_fresh and store.is_fresh(key):
+            continue
+        print(f"Laster ned rute {key} ...")
+        paths.append(download_tile(key, lager_dir))
+    return paths
+
+
+# ---------------------------------------------------------------------------
+# Lokalt oppslag
+# ---------------------------------------------------------------------------
+
+class Tile:
+    """Én rute lastet i minnet, med rutenett-indeks over segmentbitene."""
+
+    def __init__(self, data):
+        self.fetched_at = float(data["fetched_at"])
+
+        xy = data["seg_xy"].tolist()
+        offsets = data["seg_offsets"].tolist()
+        self.seg_vls = data["seg_vls"].tolist()
+        self.seg_start = data["seg_start"].tolist()
+        self.seg_slutt = data["seg_slutt"].tolist()
+        self.seg_vei = data["seg_vei"].tolist()
+
+        # Segmentbiter: (x0, y0, x1, y1, segment-indeks, lengde før biten)
+        self.pieces = []
+        self.seg_lengde = []
+        self.seg_ender = []
+        self.index = {}
+        for s in range(len(self.seg_vls)):
+            lengde = 0.0
+            self.seg_ender.append((*xy[offsets[s]], *xy[offsets[s + 1] - 1]))
+            for i in range(offsets[s], offsets[s + 1] - 1):
+                x0, y0 = xy[i]
+                x1, y1 = xy[i + 1]
+                piece_id = len(self.pieces)
+                self.pieces.append((x0, y0, x1, y1, s, lengde))
+                lengde += math.hypot(x1 - x0, y1 - y0)
+                for cell in self._cells(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)):
+                    self.index.setdefault(cell, []).append(piece_id)
+            self.seg_lengde.append(lengde)
+
+        self.limits = {}
+        for vls, start, slutt, fart in zip(
+            data["lim_vls"].tolist(), data["lim_start"].tolist(),
+            data["lim_slutt"].tolist(), data["lim_fart"].tolist(),
+        ):
+            self.limits.setdefault(vls, []).append((min(start, slutt), max(start, slutt), fart))
+
+    @staticmethod
+    def _cells(minx, miny, maxx, maxy):
+        for cx in range(int(minx // INDEX_CELL_M), int(maxx // INDEX_CELL_M) + 1):
+            for cy in range(int(miny // INDEX_CELL_M), int(maxy // INDEX_CELL_M) + 1):
+                yield cx, cy
+
+    def snap(self, ost, nord, maks_avstand=MAKS_AVSTAND, maks_antall=MAKS_ANTALL):
+        """
+        Nærmeste vegsegmenter innenfor maks_avstand, sortert på avstand, som
+        (segment-indeks, avstand, meter langs segmentet, biten punktet snappet til).
+        """
+        piece_ids = set()
+        for cell in self._cells(ost - maks_avstand, nord - maks_avstand, ost + maks_avstand, nord + maks_avstand):
+            piece_ids.update(self.index.get(cell, ()))
+
+        best = {}
+        for pid in piece_ids:
+            x0, y0, x1, y1, s, lengde_for = self.pieces[pid]
+            dx, dy = x1 - x0, y1 - y0
+            len2 = dx * dx + dy * dy
+            t = 0.0 if len2 == 0 else max(0.0, min(1.0, ((ost - x0) * dx + (nord - y0) * dy) / len2))
+            avstand = math.hypot(x0 + t * dx - ost, y0 + t * dy - nord)
+            if avstand > maks_avstand:
+                continue
+            if s not in best or avstand < best[s][0]:
+                best[s] = (avstand, lengde_for + t * math.sqrt(len2), pid)
+
+        treff = sorted(best.items(), key=lambda kv: kv[1][0])[:maks_antall]
+        return [(s, avstand, langs, pid) for s, (avstand, langs, pid) in treff]
+
+    def rel_posisjon(self, s, langs):
+        """Relativ posisjon på veglenkesekvensen for et punkt langs meter inn i segment s."""
+        total = self.seg_lengde[s]
+        andel = langs / total if total > 0 else 0.0
+        return self.seg_start[s] + (self.seg_slutt[s] - self.seg_start[s]) * andel
+
+    def candidates(self, ost, nord, maks_avstand=MAKS_AVSTAND, maks_antall=MAKS_ANTALL):
+        """
+        Nærmeste vegsegmenter innenfor maks_avstand, sortert på avstand.
+        Samme format som svarene fra /posisjon, så de kan brukes om hverandre.
+        """
+        matches = []
+        for s, avstand, langs, _ in self.snap(ost, nord, maks_avstand, maks_antall):
+            matches.append({
+                "veglenkesekvens": {"veglenkesekvensid": self.seg_vls[s], "relativPosisjon": self.rel_posisjon(s, langs)},
+                "vegsystemreferanse": {"kortform": self.seg_vei[s]},
+                "avstand": avstand,
+            })
+        return matches
+
+    def fartsgrense(self, vls_id, rel_pos):
+        for start, slutt, fart in self.limits.get(vls_id, ()):
+            if start <= rel_pos <= slutt:
+                return fart
+        return None
+
+    def resolve(self, ost, nord, last_veglenke_id=None):
+        """Snapper punktet og finner fartsgrensen, med vei-lojalitet som i nvdb_speed."""
+        matches = self.candidates(ost, nord)
+        if not matches:
+            return {"status": "error", "message": "Ingen vei funnet"}
+
+        # Vei-lojalitet: bli på forrige veglenke hvis den fortsatt er nær nok
+        if last_veglenke_id is not None:
+            for m in matches:
+                vls = m["veglenkesekvens"]
+                if vls["veglenkesekvensid"] == last_veglenke_id and m["avstand"] < LOJALITET_AVSTAND:
+                    fart = self.fartsgrense(vls["veglenkesekvensid"], vls["relativPosisjon"])
+                    if fart is not None:
+                        return _lag_resultat(m, fart)
+                    break
+
+        for m in matches:
+            vls = m["veglenkesekvens"]
+            fart = self.fartsgrense(vls["veglenkesekvensid"], vls["relativPosisjon"])
+            if fart is not None:
+                return _lag_resultat(m, fart)
+
+        return {"status": "error", "message": "Ingen fartsgrense funnet i nærheten"}
+
+
+class TileStore:
+    """Rutene i en lager-mappe. Lastes inn ved første oppslag og holdes i minnet (LRU)."""
+
+    def __init__(self, lager_dir, max_age_s=DEFAULT_MAX_AGE_S, max_tiles_in_memory=64):
+        self.lager_dir = Path(lager_dir)
+        self.max_age_s = max_age_s
+        self.max_tiles_in_memory = max_tiles_in_memory
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.lager_dir / f"tile_{key[0]}_{key[1]}.npz"
+
+    def is_fresh(self, key):
+        path = self._path(key)
+        if not path.exists():
+            return False
+        with np.load(path) as data:
+            return time.time() - float(data["fetched_at"]) <= self.max_age_s
+
+    def tile(self, key):
+        """Ruta for nøkkelen, eller None hvis den mangler eller er utdatert."""
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+        if tile is None:
+            path = self._path(key)
+            if not path.exists():
+                return None
+            with np.load(path) as data:
+                tile = self._remember(key, Tile(data))
+
+        if time.time() - tile.fetched_at > self.max_age_s:
+            return None
+        return tile
+
+    def fetch(self, key):
+        """Laster ned ruta fra NVDB, lagrer den i mappa og returnerer den."""
+        download_tile(key, self.lager_dir)
+        with self._lock:
+            self._tiles.pop(key, None)
+        return self.tile(key)
+
+    def _remember(self, key, tile):
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self.max_tiles_in_memory:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def get_speed_limit_data(self, lat, lon, last_veglenke_id=None):
+        """
+        Samme resultat som nvdb_speed.get_speed_limit_data, men helt lokalt.
+        Returnerer None når ruta mangler eller er utdatert (kalleren bør da
+        falle tilbake til online-oppslag).
+        """
+        ost, nord = transformer.transform(lon, lat)
+        return self.lookup(ost, nord, last_veglenke_id)
+
+    def lookup(self, ost, nord, last_veglenke_id=None):
+        tile = self.tile(tile_key(ost, nord))
+        if tile is None:
+            return None
+
+        return tile.resolve(ost, nord, last_veglenke_id)
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline lager for NVDB-fartsgrenser")
+    sub = parser.add_subparsers(dest="kommando", required=True)
+
+    dl = sub.add_parser("download", help="Last ned ruter for et kartutsnitt (EPSG:5973)")
+    dl.add_argument("--kartutsnitt", required=True, help="minx,miny,maxx,maxy i EPSG:5973")
+    dl.add_argument("--lager", default="tiles", help="Mappe for .npz-rutene")
+    dl.add_argument("--force", action="store_true", help="Last ned også ferske ruter på nytt")
+
+    lk = sub.add_parser("lookup", help="Slå opp fartsgrense lokalt")
+    lk.add_argument("lat", type=float)
+    lk.add_argument("lon", type=float)
+    lk.add_argument("--lager", default="tiles")
+
+    args = parser.parse_args()
+    if args.kommando == "download":
+        paths = download_region(args.kartutsnitt, args.lager, skip_fresh=not args.force)
+        print(f"{len(paths)} ruter lagret i {args.lager}")
+    else:
+        store = TileStore(args.lager)
+        start = time.perf_counter()
+        res = store.get_speed_limit_data(args.lat, args.lon)
+        print(res if res is not None else "Ruta mangler eller er utdatert")
+        print(f"Oppslag: {(time.perf_counter() - start) * 1e6:.0f} µs (inkl. innlasting av rute)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Batch speed-limit resolution for whole GPS traces.
+
+resolve_route() transforms every point to EPSG:5973 in one vectorized call,
+fetches road geometry and speed limits once per tile the trace passes
+through (see nvdb_tiles.py), and then map-matches every point locally with
+the same road-loyalty rule as nvdb_speed.get_speed_limit_data.
+
+Usage:
+    from route_resolver import resolve_route
+
+    result = resolve_route([(59.835764, 10.423201), (59.835746, 10.423010)])
+    result["fartsgrense"]   # numpy array, one entry per point
+"""
+
+import numpy as np
+
+import nvdb_speed
+from nvdb_tiles import TILE_SIZE_M, Tile, TileStore, fetch_tile_arrays
+
+
+def _load_corridor(tile_keys, store):
+    tiles = {}
+    for key in tile_keys:
+        tile = store.tile(key) if store is not None else None
+        if tile is None:
+            if store is not None:
+                tile = store.fetch(key)
+            else:
+                tile = Tile(fetch_tile_arrays(key))
+        tiles[key] = tile
+    return tiles
+
+
+def resolve_route(points, store=None, use_smart_logic=None, as_dataframe=False):
+    """
+    Resolve the speed limit for every point of a GPS trace.
+
+    Args:
+        points:          (N, 2) array-like of (lat, lon) in trace order.
+        store:           TileStore or tile directory. Fresh tiles are read from
+                         it and missing/stale ones are downloaded into it.
+                         Defaults to nvdb_speed.OFFLINE_STORE; without any
+                         store, tiles are fetched into memory for this call.
+        use_smart_logic: Keep to the previous road link between consecutive
+                         points. Defaults to nvdb_speed.USE_SMART_LOGIC.
+        as_dataframe:    Return a pandas DataFrame instead of a dict.
+
+    Returns a dict of equally long arrays (or a DataFrame with these columns):
+        "lat", "lon":      input coordinates (float64)
+        "fartsgrense":     km/h, NaN where no speed limit was found (float64)
+        "vei":             road reference, None where no road was found (object)
+        "veglenke_id":     veglenkesekvensid, -1 where no road was found (int64)
+        "avstand_meter":   distance from the point to the road, NaN if none (float64)
+    """
+    coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    lat, lon = coords[:, 0], coords[:, 1]
+    n = len(coords)
+
+    if isinstance(store, (str, bytes)) or hasattr(store, "__fspath__"):
+        store = TileStore(store)
+    elif store is None:
+        store = nvdb_speed.OFFLINE_STORE
+    if use_smart_logic is None:
+        use_smart_logic = nvdb_speed.USE_SMART_LOGIC
+
+    ost, nord = nvdb_speed.transformer.transform(lon, lat)
+    ost = np.asarray(ost, dtype=np.float64)
+    nord = np.asarray(nord, dtype=np.float64)
+
+    tx = np.floor_divide(ost, TILE_SIZE_M).astype(np.int64)
+    ty = np.floor_divide(nord, TILE_SIZE_M).astype(np.int64)
+    tile_keys = sorted(set(zip(tx.tolist(), ty.tolist())))
+    tiles = _load_corridor(tile_keys, store)
+
+    fartsgrense = np.full(n, np.nan)
+    vei = np.full(n, None, dtype=object)
+    veglenke_id = np.full(n, -1, dtype=np.int64)
+    avstand = np.full(n, np.nan)
+
+    last_id = None
+    for i, (x, y, key) in enumerate(zip(ost.tolist(), nord.tolist(), zip(tx.tolist(), ty.tolist()))):
+        res = tiles[key].resolve(x, y, last_id if use_smart_logic else None)
+        if res["status"] != "ok":
+            continue
+        fartsgrense[i] = res["fartsgrense"]
+        vei[i] = res["vei"]
+        veglenke_id[i] = res["veglenke_id"]
+        avstand[i] = res["avstand_meter"]
+        last_id = res["veglenke_id"]
+
+    result = {
+        "lat": lat.copy(),
+        "lon": lon.copy(),
+        "fartsgrense": fartsgrense,
+        "vei": vei,
+        "veglenke_id": veglenke_id,
+        "avstand_meter": avstand,
+    }
+    if as_dataframe:
+        import pandas as pd
+        return pd.DataFrame(result)
+    return result
@@ -1,25 +1,31 @@
+import argparse
 import time
 import nvdb_speed
+from nvdb_speed import http_client
+from map_matcher import MapMatcher
+from route_resolver import resolve_route
 
-def simulate_drive():
+#* En liste med koordinater som simulerer en kjøretur (eksempel: fra en vei til en annen)
+#* Her kan du legge inn punkter fra Google Maps e.l.
+
+#* Dette er del av Gamle Drammensvei i Asker med to kryss. Hoveddelen av veien er 40 km/t,
+#* mens to veier som krysser den har fartsgrense 30 km/t og 50 km/t henholdsvis.
+#* Dette vil teste om smart logikken klarer å holde seg på samme vei i kryss og ikke "hoppe" til den nærmeste veien som kan ha en annen fartsgrense.
+ROUTE = [
+    (59.835764, 10.423201),
+    (59.835746, 10.423010),
+    (59.835727, 10.422836),
+    (59.835735, 10.422685), # Kryss 1
+    (59.835705, 10.422611),
+    (59.835671, 10.422493), # Kryss 2
+    (59.835673, 10.422376),
+]
+
+def simulate_drive(pause_s=2.0):
     #! Nullstill global variabel før turen starter
     nvdb_speed.LAST_VEGLENKE_ID = None 
 
-    #* En liste med koordinater som simulerer en kjøretur (eksempel: fra en vei til en annen)
-    #* Her kan du legge inn punkter fra Google Maps e.l.
-
-    #* Dette er del av Gamle Drammensvei i Asker med to kryss. Hoveddelen av veien er 40 km/t,
-    #* mens to veier som krysser den har fartsgrense 30 km/t og 50 km/t henholdsvis.
-    #* Dette vil teste om smart logikken klarer å holde seg på samme vei i kryss og ikke "hoppe" til den nærmeste veien som kan ha en annen fartsgrense.
-    route = [
-        (59.835764, 10.423201),
-        (59.835746, 10.423010),
-        (59.835727, 10.422836),
-        (59.835735, 10.422685), # Kryss 1
-        (59.835705, 10.422611),
-        (59.835671, 10.422493), # Kryss 2
-        (59.835673, 10.422376),
-    ]
+    route = ROUTE
 
     current_road = None
     current_speed_limit = None  
@@ -31,7 +37,7 @@ def simulate_drive():
         
         data = nvdb_speed.get_speed_limit_data(lat, lon)
         
-        if data:
+        if data and data.get("status") == "ok":
             # Sjekk om vi har byttet vei eller fartsgrense
             if data['vei'] != current_road or data['fartsgrense'] != current_speed_limit:
                 print(f"🔔 ENDRING OPPDAGET!")
@@ -46,9 +52,72 @@ def simulate_drive():
             print("   ⚠️  Kunne ikke finne veidata for dette punktet.")
 
         print("-" * 40)
-        time.sleep(2) # Vent 2 sekunder mellom hvert "API-kall" for å simulere kjøring
+        time.sleep(pause_s) # Vent mellom hvert "API-kall" for å simulere kjøring
+
+    print("\n🏁 Simulering avsluttet.")
+
+def simulate_drive_batch():
+    """Samme tur, men hele ruta slås opp på én gang med resolve_route (ingen pauser)."""
+    print("🚀 Starter batch-simulering...\n")
+
+    route = resolve_route(ROUTE)
+    current_road = None
+    current_speed_limit = None
+
+    for i, (lat, lon, vei, fart) in enumerate(zip(route["lat"], route["lon"], route["vei"], route["fartsgrense"])):
+        print(f"📍 Posisjon {i+1}: ({lat}, {lon})")
+        if vei is None:
+            print("   ⚠️  Kunne ikke finne veidata for dette punktet.")
+        elif vei != current_road or fart != current_speed_limit:
+            print("🔔 ENDRING OPPDAGET!")
+            print(f"   🛣️  Vei: {vei}")
+            print(f"   🚦 Fartsgrense: {fart:.0f} km/t")
+            current_road = vei
+            current_speed_limit = fart
+        else:
+            print(f"   --- Fortsetter på {vei} ({fart:.0f} km/t) ---")
+
+    print("\n🏁 Simulering avsluttet.")
+
+def simulate_drive_matched():
+    """Samme tur med lokal kartmatching (HMM) i stedet for vei-lojalitet."""
+    print("🚀 Starter simulering med kartmatching...\n")
+
+    matcher = MapMatcher()
+    current_road = None
+    current_speed_limit = None
+
+    for i, (lat, lon) in enumerate(ROUTE):
+        print(f"📍 Posisjon {i+1}: ({lat}, {lon})")
+        start = time.perf_counter()
+        data = matcher.update(lat, lon, timestamp=2.0 * i)
+        ms = (time.perf_counter() - start) * 1000
+
+        if data["status"] != "ok":
+            print("   ⚠️  Kunne ikke finne veidata for dette punktet.")
+        elif data['vei'] != current_road or data['fartsgrense'] != current_speed_limit:
+            print(f"🔔 ENDRING OPPDAGET! ({ms:.2f} ms)")
+            print(f"   🛣️  Vei: {data['vei']}")
+            print(f"   🚦 Fartsgrense: {data['fartsgrense']} km/t")
+            current_road = data['vei']
+            current_speed_limit = data['fartsgrense']
+        else:
+            print(f"   --- Fortsetter på {data['vei']} ({data['fartsgrense']} km/t) --- ({ms:.2f} ms)")
 
     print("\n🏁 Simulering avsluttet.")
 
 if __name__ == "__main__":
-    simulate_drive()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Kjøresimulering langs ROUTE")
+    parser.add_argument("--batch", action="store_true", help="Slå opp hele ruta på én gang")
+    parser.add_argument("--mapmatch", action="store_true", help="Bruk lokal kartmatching")
+    parser.add_argument("--pause", type=float, default=None, help="Sekunder mellom posisjonene (standard 2, 0 ved --replay)")
+    http_client.add_fixture_arguments(parser)
+    args = parser.parse_args()
+    http_client.apply_fixture_arguments(args)
+
+    if args.batch:
+        simulate_drive_batch()
+    elif args.mapmatch:
+        simulate_drive_matched()
+    else:
+        simulate_drive(pause_s=args.pause if args.pause is not None else (0.0 if args.replay else 2.0))
\ No newline at end of file
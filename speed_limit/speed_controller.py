@@ -1,5 +1,7 @@
 import time
+import numpy as np
 from nvdb_speed import get_speed_limit_data
+from route_resolver import resolve_route
 import speed_features # Our new file
 
 class SpeedController:
@@ -8,8 +10,8 @@ class SpeedController:
         self.last_road_id = None
 
     def get_ml_input_vector(self, lat, lon):
-        # 1. Fetch raw data from API
-        raw_data = get_speed_limit_data(lat, lon)
+        # 1. Fetch raw data from API (road loyalty uses this controller's own last road)
+        raw_data = get_speed_limit_data(lat, lon, last_veglenke_id=self.last_road_id)
         
         if raw_data and raw_data["status"] == "ok":
             # 2. Engineer features
@@ -20,15 +22,53 @@ class SpeedController:
             
             # 3. Update state for next delta calculation
             self.last_speed_limit = raw_data["fartsgrense"]
+            self.last_road_id = raw_data.get("veglenke_id")
             
             # This 'engineered' dict can now be converted to a list/tensor for your ML model
             return engineered
         
         return None
 
+    def get_ml_input_vectors(self, points):
+        """
+        Batch version of get_ml_input_vector for a whole trace of (lat, lon)
+        points, resolved in one go with route_resolver.resolve_route.
+        Returns one engineered dict (or None) per point.
+        """
+        route = resolve_route(points)
+        vectors = []
+        for fart, vei in zip(route["fartsgrense"].tolist(), route["vei"].tolist()):
+            if vei is None or fart != fart:  # NaN: no speed limit found
+                vectors.append(None)
+                continue
+            raw_data = {"status": "ok", "fartsgrense": int(fart), "vei": vei}
+            vectors.append(speed_features.engineer_all_features(
+                raw_data,
+                previous_speed_limit=self.last_speed_limit
+            ))
+            self.last_speed_limit = int(fart)
+        return vectors
+
+    def get_ml_input_matrix(self, points):
+        """
+        Like get_ml_input_vectors, but as one float32 matrix (columns:
+        speed_features.FEATURE_NAMES, NaN rows where no speed limit was found).
+        """
+        route = resolve_route(points)
+        fart = route["fartsgrense"]
+        previous = speed_features.previous_limits(fart)
+        if self.last_speed_limit is not None:
+            # Points up to the first limit of this trace continue from the last call
+            previous[np.isnan(previous)] = self.last_speed_limit
+        known = fart[~np.isnan(fart)]
+        if len(known):
+            self.last_speed_limit = int(known[-1])
+        return speed_features.engineer_features_batch(fart, route["vei"], previous)
+
 # Example usage
-controller = SpeedController()
-features2 = controller.get_ml_input_vector(63.326244, 10.334259)
-features1 = controller.get_ml_input_vector(59.833322, 10.410803)
-print(f"E6 features: {features2}")
-print(f"Gamle Drammensvei features: {features1}")
\ No newline at end of file
+if __name__ == "__main__":
+    controller = SpeedController()
+    features2 = controller.get_ml_input_vector(63.326244, 10.334259)
+    features1 = controller.get_ml_input_vector(59.833322, 10.410803)
+    print(f"E6 features: {features2}")
+    print(f"Gamle Drammensvei features: {features1}")
\ No newline at end of file
@@ -1,5 +1,7 @@
 # speed_features.py
 
+import numpy as np
+
 def get_road_class(vei_string):
     """Extracts the road category from strings like 'EV6 S1D1'"""
     if not vei_string or len(vei_string) < 2:
@@ -79,4 +81,96 @@ def engineer_all_features(api_data, previous_speed_limit=None):
         "speed_delta": round((fart - previous_speed_limit)/110, 3) if previous_speed_limit is not None else 0
     }
     
-    return features
\ No newline at end of file
+    return features
+
+
+# --- Batch API (columnar) ---
+# Column order of the matrix from engineer_features_batch. The road_type_*
+# columns are the road_type_vec one-hot vector.
+FEATURE_NAMES = [
+    "norm_speed_limit",
+    "road_type_EV", "road_type_RV", "road_type_FV", "road_type_KV", "road_type_Other",
+    "urbanization_idx",
+    "speed_delta",
+]
+
+ROAD_CLASSES = ["Europavei", "Riksvei", "Fylkesvei", "Kommunal vei", "Privat vei", "Other", "Unknown"]
+
+# One-hot row per road class code (Privat vei and Unknown have no column)
+ROAD_TYPE_TABLE = np.array([one_hot_encode_road(c) for c in ROAD_CLASSES], dtype=np.float32)
+
+# Every speed limit where calculate_urbanization changes value. Bin i holds
+# the limits in (thresholds[i-1], thresholds[i]], the last bin those above.
+URBANIZATION_THRESHOLDS = np.array([40, 50, 60, 70, 80], dtype=np.float64)
+URBANIZATION_TABLE = np.array(
+    [[calculate_urbanization(c, limit) for limit in [*URBANIZATION_THRESHOLDS, np.inf]] for c in ROAD_CLASSES],
+    dtype=np.float32,
+)
+
+
+def feature_vector(features):
+    """A dict from engineer_all_features as a list in FEATURE_NAMES order."""
+    return [features["norm_speed_limit"], *features["road_type_vec"], features["urbanization_idx"], features["speed_delta"]]
+
+
+def road_class_codes(vei):
+    """Index into ROAD_CLASSES for every road reference (None counts as unknown)."""
+    # Few distinct references in practice, so each is classified only once
+    codes = {}
+    for v in set(vei):
+        codes[v] = ROAD_CLASSES.index(get_road_class(v))
+    return np.fromiter((codes[v] for v in vei), dtype=np.int8, count=len(vei))
+
+
+def _rounded_over_110(values):
+    """round(v / 110, 3) like the scalar code (Python rounding), once per distinct value."""
+    unique, inverse = np.unique(values, return_inverse=True)
+    table = np.array([round(float(v) / 110, 3) for v in unique], dtype=np.float64)
+    return table[inverse.reshape(-1)]
+
+
+def previous_limits(fartsgrense):
+    """
+    The previous_speed_limit every point of a trace would get from
+    SpeedController: the last known limit before it (NaN if none yet).
+    """
+    fart = np.asarray(fartsgrense, dtype=np.float64)
+    idx = np.where(np.isnan(fart), -1, np.arange(len(fart)))
+    idx = np.maximum.accumulate(idx)
+    previous = np.full(len(fart), np.nan)
+    previous[1:] = np.where(idx[:-1] >= 0, fart[np.maximum(idx[:-1], 0)], np.nan)
+    return previous
+
+
+def engineer_features_batch(fartsgrense, vei, previous_speed_limit=None):
+    """
+    engineer_all_features for many points at once.
+
+    fartsgrense:          speed limits (NaN where none was found)
+    vei:                  road references, e.g. 'EV6 S1D1' (None if unknown)
+    previous_speed_limit: previous limit per point (NaN for none), or None
+                          for no history at all
+
+    Returns a contiguous (N, len(FEATURE_NAMES)) float32 matrix whose rows
+    equal feature_vector(engineer_all_features(...)) cast to float32. Rows
+    without a speed limit are NaN.
+    """
+    fart = np.asarray(fartsgrense, dtype=np.float64).reshape(-1)
+    n = len(fart)
+    valid = ~np.isnan(fart)
+
+    out = np.full((n, len(FEATURE_NAMES)), np.nan, dtype=np.float32)
+    f = fart[valid]
+    codes = road_class_codes(vei)[valid]
+
+    out[valid, 0] = _rounded_over_110(f)
+    out[valid, 1:6] = ROAD_TYPE_TABLE[codes]
+    out[valid, 6] = URBANIZATION_TABLE[codes, np.searchsorted(URBANIZATION_THRESHOLDS, f, side="left")]
+
+    delta = np.zeros(len(f))
+    if previous_speed_limit is not None:
+        prev = np.asarray(previous_speed_limit, dtype=np.float64).reshape(-1)[valid]
+        has_prev = ~np.isnan(prev)
+        delta[has_prev] = _rounded_over_110(f[has_prev] - prev[has_prev])
+    out[valid, 7] = delta
+    return out
@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The root modules import each other as top-level modules, and so do the
+# speed_limit/ modules
+for path in (ROOT, ROOT / "speed_limit"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
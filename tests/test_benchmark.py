@@ -0,0 +1,94 @@
+import pytest
+
+import benchmark
+from benchmark import compare, measure
+
+
+def _result(p50, p95, error=None):
+    r = {"iterations": 10, "errors": 0, "p50_ms": p50, "p95_ms": p95, "p99_ms": p95, "mean_ms": p50, "max_ms": p95}
+    if error:
+        r["errors"] = 10
+        r["error"] = error
+    return r
+
+
+def _results(**benchmarks):
+    return {"results": benchmarks}
+
+
+# ---------------------------------------------------------------------------
+# compare
+# ---------------------------------------------------------------------------
+
+def test_compare_flags_p50_and_p95_beyond_threshold():
+    baseline = _results(a=_result(10.0, 20.0))
+    current = _results(a=_result(12.5, 25.0))
+    assert compare(current, baseline, threshold=0.2) == [("a", "p50_ms", 10.0, 12.5), ("a", "p95_ms", 20.0, 25.0)]
+
+
+def test_compare_allows_slowdown_within_threshold():
+    baseline = _results(a=_result(10.0, 20.0))
+    assert compare(_results(a=_result(11.9, 24.0)), baseline, threshold=0.2) == []
+    # Faster is never a regression
+    assert compare(_results(a=_result(1.0, 2.0)), baseline, threshold=0.2) == []
+
+
+def test_compare_ignores_benchmarks_missing_or_errored_in_baseline():
+    baseline = _results(old=_result(0.0, 0.0), broken=_result(1.0, 1.0, error="x"))
+    current = _results(old=_result(5.0, 5.0), broken=_result(9.0, 9.0), new=_result(9.0, 9.0))
+    assert compare(current, baseline) == []
+
+
+def test_compare_reports_benchmark_that_errors_now():
+    baseline = _results(a=_result(10.0, 20.0))
+    current = _results(a={"error": "ConnectionError: no route"})
+    assert compare(current, baseline) == [("a", "error", 10.0, None)]
+
+
+# ---------------------------------------------------------------------------
+# measure
+# ---------------------------------------------------------------------------
+
+def test_measure_reports_latency_and_throughput():
+    calls = []
+    result = measure(calls.append, iterations=20, warmup=3, items_per_call=4)
+    assert calls == list(range(23))
+    assert result["iterations"] == 20
+    assert result["errors"] == 0
+    assert "error" not in result
+    assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"] <= result["max_ms"]
+    assert result["throughput_per_s"] > 0
+
+
+def test_measure_counts_failed_calls_and_marks_the_result():
+    def flaky(i):
+        if i % 5 == 0:
+            raise RuntimeError(f"speed limit status 'error' at {i}")
+
+    result = measure(flaky, iterations=20, warmup=5)
+    # Calls 0, 5, ..., 20 of the 25 fail
+    assert result["errors"] == 5
+    assert result["error"] == "5 of 25 calls failed, first: RuntimeError: speed limit status 'error' at 0"
+
+
+def test_result_checks():
+    benchmark._check_speed_limit({"status": "ok", "fartsgrense": 50})
+    with pytest.raises(RuntimeError, match="not_found"):
+        benchmark._check_speed_limit({"status": "not_found"})
+    with pytest.raises(RuntimeError):
+        benchmark._check_speed_limit(None)
+    ok = {"weather": {"temp": 1.0}, "speed_limit": {"status": "ok"}}
+    benchmark._check_pipeline_input(ok)
+    with pytest.raises(RuntimeError, match="missing"):
+        benchmark._check_pipeline_input({**ok, "missing": {"weather": "deadline exceeded"}})
+    with pytest.raises(RuntimeError, match="no weather"):
+        benchmark._check_pipeline_input({**ok, "weather": None})
+
+
+def test_run_records_a_benchmark_that_raises(monkeypatch):
+    def broken(iterations, warmup):
+        raise ImportError("no model")
+
+    monkeypatch.setitem(benchmark.BENCHMARKS, "broken", broken)
+    results = benchmark.run(["broken"], 5, 1, None, "live")
+    assert results["results"] == {"broken": {"error": "ImportError: no model"}}
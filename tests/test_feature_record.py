@@ -0,0 +1,130 @@
+import time
+
+import numpy as np
+import pytest
+
+from feature_record import WIDTH, FeatureRing, column, new_records, write_camera, write_speed_limit, write_weather
+
+
+def _commit(ring, value):
+    row = ring.claim(timestamp=float(value))
+    row[:] = value
+    return ring.commit()
+
+
+def _values(view):
+    return view[:, 0].tolist()
+
+
+def test_latest_wraps_around_as_one_view():
+    ring = FeatureRing(4)
+    for v in range(6):
+        _commit(ring, v)
+    records, timestamps = ring.latest_with_timestamps()
+    assert _values(records) == [2, 3, 4, 5]
+    assert timestamps.tolist() == [2, 3, 4, 5]
+    assert np.shares_memory(records, ring._buffer)
+    assert _values(ring.latest(2)) == [4, 5]
+
+
+def test_claimed_row_is_not_visible_until_commit():
+    ring = FeatureRing(4)
+    for v in range(5):
+        _commit(ring, v)
+    view = ring.latest()
+    row = ring.claim()
+    row[:] = 99
+    assert _values(view) == [1, 2, 3, 4]
+    assert _values(ring.latest()) == [1, 2, 3, 4]
+    ring.commit()
+    assert _values(ring.latest()) == [2, 3, 4, 99]
+
+
+@pytest.mark.parametrize("n", [1, 2, 4])
+def test_window_of_n_survives_capacity_plus_one_minus_n_commits(n):
+    capacity = 4
+    ring = FeatureRing(capacity)
+    for v in range(7):
+        _commit(ring, v)
+    view = ring.latest(n)
+    expected = _values(view)
+    for v in range(capacity + 1 - n):
+        _commit(ring, 100 + v)
+        assert _values(view) == expected
+    # The next commit laps the oldest record of the window
+    _commit(ring, 200)
+    assert _values(view) != expected
+
+
+def test_since_and_get():
+    ring = FeatureRing(4)
+    for v in range(3):
+        _commit(ring, v)
+    records, _, nxt = ring.since(1)
+    assert (_values(records), nxt) == ([1, 2], 3)
+    for v in range(3, 10):
+        _commit(ring, v)
+    # A reader that fell behind only gets what is still kept
+    records, _, nxt = ring.since(nxt)
+    assert (_values(records), nxt) == ([6, 7, 8, 9], 10)
+    assert ring.get(9)[0] == 9
+    assert ring.get(5) is None
+    assert ring.get(10) is None
+
+
+def test_stage_writers_fill_their_columns():
+    row = new_records(1)[0]
+    write_weather(row, {"temp": -3.5, "humidity": 80})
+    write_speed_limit(row, {"fartsgrense": 80, "vei": "EV6 S1D1", "avstand_meter": 2.0, "status": "ok"}, 60)
+    write_camera(row, {"friction": [("wet", 0.7), ("dry", 0.2)]})
+    assert row.shape == (WIDTH,)
+    assert row[column("temp")] == -3.5
+    assert row[column("fartsgrense")] == 80
+    assert row[column("friction_wet")] == pytest.approx(0.7)
+    assert row[column("friction_water")] == 0.0
+    assert np.isnan(row[column("winter_ice")])
+
+
+# ---------------------------------------------------------------------------
+# data_pipeline.collect_pipeline_record
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def sources(monkeypatch):
+    import data_pipeline
+
+    state = {"weather_delay": 0.0}
+
+    def weather(lat, lon, altitude=None):
+        time.sleep(state["weather_delay"])
+        return {"temp": 2.0, "humidity": 70.0}
+
+    def speed_limit(lat, lon, search_radius_m=50):
+        return {"fartsgrense": 60, "vei": "RV4 S1D1", "avstand_meter": 3.0, "status": "ok"}
+
+    monkeypatch.setattr(data_pipeline, "get_weather", weather)
+    monkeypatch.setattr(data_pipeline, "get_speed_limit", speed_limit)
+    return state
+
+
+def test_collect_pipeline_record_writes_every_source(sources):
+    from data_pipeline import collect_pipeline_record
+
+    ring = FeatureRing(4)
+    seq = collect_pipeline_record(ring, 63.4, 10.4, camera_output={"winter": [("ice", 0.6)]})
+    row = ring.get(seq)
+    assert row[column("temp")] == 2.0
+    assert row[column("fartsgrense")] == 60
+    assert row[column("winter_ice")] == pytest.approx(0.6)
+    assert ring.last_speed_limit == 60
+
+
+def test_late_source_does_not_write_into_a_committed_record(sources):
+    from data_pipeline import collect_pipeline_record
+
+    sources["weather_delay"] = 0.2
+    ring = FeatureRing(4)
+    seq = collect_pipeline_record(ring, 63.4, 10.4, deadlines={"weather": 0.02})
+    time.sleep(0.3)
+    assert np.isnan(ring.get(seq)[column("temp")])
+    assert ring.get(seq)[column("fartsgrense")] == 60
@@ -0,0 +1,167 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import gps_stream
+from gps_stream import GPSPipeline, LatestQueue, NmeaDecoder, iter_source
+
+RMC = "$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A"
+GGA = "$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47"
+
+
+def _speed_limit(fix):
+    return {"fartsgrense": 50, "vei": "KV1 S1D1", "avstand_meter": 1.0, "status": "ok"}
+
+
+async def _async_speed_limit(fix):
+    return _speed_limit(fix)
+
+
+def _weather(fix):
+    return {"temp": 1.0, "humidity": 90.0}
+
+
+async def _collect(pipeline):
+    return [rec async for rec in pipeline]
+
+
+# ---------------------------------------------------------------------------
+# NMEA
+# ---------------------------------------------------------------------------
+
+def test_rmc_decodes_position_speed_and_time():
+    fix = NmeaDecoder().feed(RMC)
+    assert fix.lat == pytest.approx(48 + 7.038 / 60)
+    assert fix.lon == pytest.approx(11 + 31.0 / 60)
+    assert fix.speed == pytest.approx(22.4 * gps_stream.KNOTS_TO_MS)
+    assert fix.heading == pytest.approx(84.4)
+    assert fix.timestamp == datetime(1994, 3, 23, 12, 35, 19, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize("ddmmyy, year", [("230394", 1994), ("010180", 1980), ("311279", 2079), ("170526", 2026)])
+def test_rmc_two_digit_year_pivot(ddmmyy, year):
+    assert datetime.fromtimestamp(gps_stream._nmea_time("000000", ddmmyy), timezone.utc).year == year
+
+
+def test_rmc_takes_altitude_from_latest_gga():
+    decoder = NmeaDecoder()
+    # Before any RMC a GGA gives a fix of its own
+    assert decoder.feed(GGA).altitude == pytest.approx(545.4)
+    fix = decoder.feed(RMC)
+    assert fix.altitude == pytest.approx(545.4)
+    # Once the receiver is known to send RMC, GGA only updates the altitude
+    assert decoder.feed(GGA) is None
+
+
+def test_bad_checksum_and_void_fix_are_ignored():
+    decoder = NmeaDecoder()
+    assert decoder.feed(RMC[:-2] + "00") is None
+    void = RMC.replace(",A,", ",V,").split("*")[0]
+    assert decoder.feed(void) is None
+    assert decoder.feed("not nmea") is None
+
+
+# ---------------------------------------------------------------------------
+# Latest-wins queues
+# ---------------------------------------------------------------------------
+
+def test_latest_queue_drops_oldest():
+    async def run():
+        queue = LatestQueue(maxsize=2)
+        for i in range(5):
+            queue.put(i)
+        queue.close()
+        return [await queue.get() for _ in range(3)], queue.dropped
+
+    items, dropped = asyncio.run(run())
+    assert items == [3, 4, None]
+    assert dropped == 3
+
+
+def test_slow_stage_drops_fixes_but_keeps_the_latest():
+    def slow_weather(fix):
+        time.sleep(0.02)
+        return _weather(fix)
+
+    fixes = [(63.0 + i * 1e-5, 10.4, 20.0, 1e9 + i) for i in range(100)]
+    pipeline = GPSPipeline(iter_source(fixes, rate_hz=500), speed_limit=_async_speed_limit, weather=slow_weather)
+    records = asyncio.run(_collect(pipeline))
+    metrics = pipeline.metrics()
+
+    assert metrics["received"] == len(fixes)
+    assert 0 < len(records) < len(fixes)
+    assert metrics["emitted"] + sum(metrics["dropped"].values()) == len(fixes)
+    # The newest fix always makes it through
+    assert records[-1].fix.timestamp == fixes[-1][3]
+    assert [r.fix.timestamp for r in records] == sorted(r.fix.timestamp for r in records)
+
+
+def test_every_fix_passes_when_the_stages_keep_up():
+    fixes = [(63.0, 10.4, 20.0, 1e9 + i) for i in range(20)]
+    pipeline = GPSPipeline(fixes, speed_limit=_async_speed_limit, weather=_weather, queue_size=len(fixes))
+    records = asyncio.run(_collect(pipeline))
+    assert len(records) == len(fixes)
+    assert records[-1].data["speed_limit"]["fartsgrense"] == 50
+    assert records[-1].data["weather"] == _weather(None)
+
+
+def test_failed_stage_is_reported_as_missing():
+    def broken_weather(fix):
+        raise RuntimeError("MET down")
+
+    pipeline = GPSPipeline([(63.0, 10.4)], speed_limit=_async_speed_limit, weather=broken_weather)
+    (record,) = asyncio.run(_collect(pipeline))
+    assert record.data["weather"] is None
+    assert record.data["missing"]["weather"] == "MET down"
+
+
+# ---------------------------------------------------------------------------
+# Camera join
+# ---------------------------------------------------------------------------
+
+CAMERA = {"friction": [("wet", 0.9)]}
+
+
+def test_camera_joined_regardless_of_fix_time_base():
+    # Fixes from a recording made long ago: the join uses arrival time
+    fixes = [(63.0, 10.4, 20.0, 7.6e8 + i) for i in range(3)]
+    pipeline = GPSPipeline(fixes, speed_limit=_async_speed_limit, weather=_weather, queue_size=len(fixes))
+    pipeline.update_camera(CAMERA)
+    records = asyncio.run(_collect(pipeline))
+    assert all(r.data["camera"] == CAMERA for r in records)
+    assert all("camera" not in r.data["missing"] for r in records)
+
+
+@pytest.mark.parametrize("offset_s", [-10.0, 10.0])
+def test_camera_output_too_old_or_too_new_is_not_joined(offset_s):
+    pipeline = GPSPipeline([(63.0, 10.4)], speed_limit=_async_speed_limit, weather=_weather, max_camera_age_s=2.0)
+    pipeline.update_camera(CAMERA, timestamp=time.monotonic() + offset_s)
+    (record,) = asyncio.run(_collect(pipeline))
+    assert record.data["camera"] is None
+    assert record.data["missing"]["camera"] == "no recent camera output"
+
+
+# ---------------------------------------------------------------------------
+# Stage functions
+# ---------------------------------------------------------------------------
+
+class _AsyncCallable:
+    async def __call__(self, fix):
+        return _speed_limit(fix)
+
+
+class _AsyncLookup:
+    async def weather(self, fix):
+        return _weather(fix)
+
+
+@pytest.mark.parametrize("speed_limit", [_AsyncCallable(), lambda fix: _async_speed_limit(fix)])
+def test_async_callables_are_awaited(speed_limit):
+    lookup = _AsyncLookup()
+    pipeline = GPSPipeline([(63.0, 10.4)], speed_limit=speed_limit, weather=lambda fix: lookup.weather(fix))
+    (record,) = asyncio.run(_collect(pipeline))
+    assert record.data["speed_limit"] == _speed_limit(None)
+    assert record.data["weather"] == _weather(None)
+    assert "speed_limit" not in record.data["missing"] and "weather" not in record.data["missing"]
@@ -0,0 +1,145 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+from http_client import FixtureArchive, ReplayAdapter, request_key
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    """Answers every GET with its path and a running count."""
+
+    count = 0
+
+    def do_GET(self):
+        type(self).count += 1
+        body = json.dumps({"path": self.path, "n": self.count}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _CountingHandler.count = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _CountingHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def live_afterwards():
+    yield
+    http_client.live()
+
+
+def _archive(tmp_path, responses):
+    """Archive with the given (key, body) responses, in order."""
+    archive = FixtureArchive(tmp_path / "fixtures.jsonl.gz")
+    for key, body in responses:
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(body).encode("utf-8")
+        archive.add(key, response)
+    archive.save()
+    return archive.path
+
+
+def test_request_key_ignores_parameter_order_and_method_case():
+    a = request_key("get", "https://api.example.no/v1/forecast?lon=10.4&lat=63.4")
+    b = request_key("GET", "https://api.example.no/v1/forecast?lat=63.4&lon=10.4")
+    assert a == b == "GET https://api.example.no/v1/forecast?lat=63.4&lon=10.4"
+
+
+def test_request_key_keeps_repeated_and_blank_parameters():
+    key = request_key("GET", "https://h/p?b=&a=2&a=1")
+    assert key == "GET https://h/p?a=1&a=2&b="
+    assert request_key("GET", "https://h/p?a=1") != request_key("GET", "https://h/q?a=1")
+
+
+def test_record_then_replay(server, tmp_path):
+    path = tmp_path / "drive.jsonl.gz"
+    http_client.record(path)
+    first = http_client.get(f"{server}/pos", params={"b": 2, "a": 1}, timeout=5).json()
+    second = http_client.get(f"{server}/pos?a=1&b=2", timeout=5).json()
+    http_client.live()
+    assert (first["n"], second["n"]) == (1, 2)
+    assert len(FixtureArchive(path).load()) == 2
+
+    adapter = http_client.replay(path)
+    replayed = [http_client.get(f"{server}/pos", params={"a": 1, "b": 2}, timeout=5).json() for _ in range(3)]
+    # Recorded order, then the last response again; the server is not asked
+    assert [r["n"] for r in replayed] == [1, 2, 2]
+    assert _CountingHandler.count == 2
+    assert adapter.served == 3
+
+
+def test_replay_of_unrecorded_request_is_a_connection_error(tmp_path):
+    path = _archive(tmp_path, [(request_key("GET", "https://h/known"), {"ok": True})])
+    adapter = http_client.replay(path)
+    assert http_client.get("https://h/known", timeout=5).json() == {"ok": True}
+    with pytest.raises(requests.ConnectionError):
+        http_client.get("https://h/unknown", timeout=5)
+    assert (adapter.served, adapter.misses) == (1, 1)
+
+
+def test_replay_error_injection(tmp_path):
+    path = _archive(tmp_path, [(request_key("GET", "https://h/p"), {"ok": True})])
+    adapter = http_client.replay(path, error_rate=1.0, seed=1)
+    outcomes = []
+    for _ in range(40):
+        try:
+            outcomes.append(http_client.get("https://h/p", timeout=5).status_code)
+        except requests.ConnectionError:
+            outcomes.append("connection error")
+    # Half connection errors, half 503, and nothing served from the archive
+    assert set(outcomes) == {503, "connection error"}
+    assert adapter.errors == 40
+    assert adapter.served == 0
+
+
+def test_replay_error_injection_is_repeatable_with_a_seed(tmp_path):
+    path = _archive(tmp_path, [(request_key("GET", "https://h/p"), {"ok": True})])
+
+    def run():
+        http_client.replay(path, error_rate=0.5, seed=7)
+        statuses = []
+        for _ in range(30):
+            try:
+                statuses.append(http_client.get("https://h/p", timeout=5).status_code)
+            except requests.ConnectionError:
+                statuses.append(None)
+        return statuses
+
+    first = run()
+    assert first == run()
+    assert 200 in first and first.count(200) < len(first)
+
+
+def test_replay_counters_are_thread_safe(tmp_path):
+    key = request_key("GET", "https://h/p")
+    adapter = ReplayAdapter(FixtureArchive(_archive(tmp_path, [(key, {"ok": True})])).load())
+    request = requests.Request("GET", "https://h/p").prepare()
+
+    def worker():
+        for _ in range(500):
+            adapter.send(request)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert adapter.served == 8 * 500
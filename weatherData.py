@@ -1,67 +1,85 @@
-import requests
-from datetime import datetime, timezone
+import time
+
+import http_client
+from weather_cache import DEFAULT_TTL_S, CachedForecast, Timeseries, WeatherCache, parse_http_date, slot_at
 
 MET_BASE_URL = "https://api.met.no/weatherapi/locationforecast/"
 MET_COMPACT_URL = "2.0/compact"
+MET_HEADERS = {
+    "User-Agent": "EiT-TDT4861-G6/1.0 (student project)"
+}
+# MET's terms of service allow at most 20 requests/s per application
+MET_MAX_REQUESTS_PER_S = 20
 
-def parse_iso8601_utc(timestamp):
-    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-
-
-def get_current_weather(timeseries):
-    now_utc = datetime.now(timezone.utc)
-    parsed = []
-
-    for item in timeseries:
-        item_time = parse_iso8601_utc(item["time"])
-        parsed.append((item_time, item))
+http_client.set_rate_limit(MET_BASE_URL, MET_MAX_REQUESTS_PER_S)
 
-    parsed.sort(key=lambda x: x[0])
-    past_or_now = [entry for entry in parsed if entry[0] <= now_utc]
-    if past_or_now:
-        return past_or_now[-1][1]
 
-    return parsed[0][1]
+def get_current_weather(timeseries, at=None):
+    if isinstance(timeseries, Timeseries):
+        return timeseries.slot(at)
+    return slot_at(timeseries, at)
 
 
-def fetchCompact(lat, lon, altitude):
+def fetch_met_forecast(lat, lon, altitude, cached=None):
+    """
+    Download the compact forecast for a point as a CachedForecast. With an
+    expired `cached` forecast the request is conditional (If-Modified-Since),
+    and on 304 Not Modified `cached` is returned with its new expiry.
+    """
     MET_PARAMS = {
         "lat": lat,
         "lon": lon,
-        "altitude": altitude
-    }
-    MET_HEADERS = {
-        "User-Agent": "EiT-TDT4861-G6/1.0 (student project)"
     }
+    if altitude is not None:
+        MET_PARAMS["altitude"] = altitude
+    headers = dict(MET_HEADERS)
+    if cached is not None and cached.last_modified:
+        headers["If-Modified-Since"] = cached.last_modified
 
-    req = requests.get(
+    req = http_client.get(
         MET_BASE_URL + MET_COMPACT_URL,
         params=MET_PARAMS,
-        headers=MET_HEADERS,
+        headers=headers,
         timeout=10
     )
 
+    expires = parse_http_date(req.headers.get("Expires")) or time.time() + DEFAULT_TTL_S
+    if req.status_code == 304 and cached is not None:
+        cached.expires = expires
+        return cached
     if not req.ok:
-        print(f"[ERROR] Error retrieving request: {req.status_code}")
-        return None
+        raise RuntimeError(f"MET request failed: {req.status_code}")
 
     payload = req.json()
-    timeseries = payload["properties"]["timeseries"]
-    current = get_current_weather(timeseries)
+    return CachedForecast(
+        payload["properties"]["timeseries"],
+        expires=expires,
+        last_modified=req.headers.get("Last-Modified"),
+    )
+
+
+MET_CACHE = WeatherCache(fetch_met_forecast)
+
+
+def fetchCompact(lat, lon, altitude, at=None):
+    try:
+        forecast = MET_CACHE.forecast(lat, lon, altitude)
+    except Exception as e:
+        print(f"[ERROR] Error retrieving request: {e}")
+        return None
+
+    current = get_current_weather(forecast.series, at)
 
     print("Current weather timeslot:", current["time"])
     print("Details:", current["data"]["instant"]["details"])
     return current
 
-def getTempHumid(lat,lon,altitude):
-    res = fetchCompact(lat,lon,altitude)
-    data = res["data"]["instant"]["details"]
-    temp = data["air_temperature"]
-    humidity = data["relative_humidity"]
-    return {"temp": temp, "humidity": humidity}
-
-getTempHumid(
-    63.417833,
-    10.407466,
-    100
-)
+def getTempHumid(lat,lon,altitude,at=None,interpolate=False):
+    return MET_CACHE.get(lat, lon, altitude, at=at, interpolate=interpolate)
+
+if __name__ == "__main__":
+    print(getTempHumid(
+        63.417833,
+        10.407466,
+        100
+    ))
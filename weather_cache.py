@@ -0,0 +1,268 @@
+"""
+weather_cache.py
+
+Forecast cache shared by the MET Locationforecast (weatherData.py) and
+Open-Meteo (data_pipeline.py) lookups.
+
+Forecasts are hourly and cover km-scale grids, so positions are quantized to
+a lat/lon/altitude cell and the full forecast timeseries of a cell is kept:
+later hours, and every vehicle in the same cell, are answered from memory.
+A cell's forecast is refetched only when it expires (MET: the `Expires`
+header; the refetch is a conditional `If-Modified-Since` request, so an
+unchanged forecast costs a 304 without a body).
+
+Usage:
+    from weather_cache import WeatherCache
+
+    cache = WeatherCache(fetch)      # fetch(lat, lon, altitude, cached) -> CachedForecast
+    cache.get(63.43, 10.39, 20)      # -> {"temp": ..., "humidity": ...}
+    cache.get(63.43, 10.39, 20, at=datetime(...), interpolate=True)
+"""
+
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+# Cell size: 0.02° is ~2.2 km north-south and ~1 km east-west at 63°N, on
+# the order of the 2.5 km MET Nordic / MEPS grid.
+CELL_DEG = 0.02
+ALTITUDE_STEP_M = 50
+
+# Lifetime of a forecast when the response carries no usable Expires header
+DEFAULT_TTL_S = 1800
+# Cells kept in memory (least recently used are dropped first)
+MAX_CELLS = 4096
+
+
+def parse_iso8601_utc(timestamp):
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+def parse_http_date(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds for an HTTP date header (Expires, Last-Modified), or None."""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _epoch(at) -> float:
+    if at is None:
+        return time.time()
+    if isinstance(at, datetime):
+        return at.timestamp()
+    return float(at)
+
+
+class Timeseries:
+    """
+    Forecast slots parsed once into sorted epoch-second arrays, so looking up
+    the slot for a time is a bisect (O(log n)) that allocates nothing.
+    """
+
+    __slots__ = ("times", "temps", "humidities", "items")
+
+    def __init__(self, items: list):
+        parsed = sorted(
+            ((parse_iso8601_utc(item["time"]).timestamp(), item) for item in items),
+            key=lambda x: x[0],
+        )
+        self.items = [item for _, item in parsed]
+        self.times = array("d", (t for t, _ in parsed))
+        details = [item["data"]["instant"]["details"] for item in self.items]
+        self.temps = array("d", (d.get("air_temperature", math.nan) for d in details))
+        self.humidities = array("d", (d.get("relative_humidity", math.nan) for d in details))
+
+    def index(self, at=None) -> int:
+        """
+        Index of the latest slot at or before `at` (datetime or epoch
+        seconds, default now), or 0 if all slots lie in the future.
+
+        Raises:
+            RuntimeError if the timeseries is empty.
+        """
+        if not self.times:
+            raise RuntimeError("Forecast has no timeseries")
+        return max(bisect_right(self.times, _epoch(at)) - 1, 0)
+
+    def slot(self, at=None) -> dict:
+        return self.items[self.index(at)]
+
+    def temp_humid(self, at=None, interpolate: bool = False) -> dict:
+        """
+        {"temp", "humidity"} at `at`. By default the values of the slot in
+        effect; with interpolate=True linearly interpolated between the
+        surrounding slots.
+
+        Raises:
+            RuntimeError if the timeseries is empty.
+        """
+        t = _epoch(at)
+        i = self.index(t)
+        temp = self.temps[i]
+        humidity = self.humidities[i]
+        if interpolate and i + 1 < len(self.times) and self.times[i] <= t:
+            frac = (t - self.times[i]) / (self.times[i + 1] - self.times[i])
+            temp += frac * (self.temps[i + 1] - temp)
+            humidity += frac * (self.humidities[i + 1] - humidity)
+        return {"temp": temp, "humidity": humidity}
+
+    def __len__(self):
+        return len(self.times)
+
+
+def slot_at(timeseries: list, at: Optional[datetime] = None) -> dict:
+    """
+    The latest timeseries entry at or before `at` (default: now), or the
+    first entry if all of them lie in the future.
+
+    Parses the whole timeseries; for repeated lookups build a Timeseries once.
+    """
+    return Timeseries(timeseries).slot(at)
+
+
+class CachedForecast:
+    """Full forecast timeseries for one cell, in MET Locationforecast format."""
+
+    __slots__ = ("timeseries", "series", "expires", "last_modified", "fetched")
+
+    def __init__(self, timeseries: list, expires: float, last_modified: Optional[str] = None):
+        # Rejected here so an empty response is treated as a failed fetch
+        # (the cache keeps serving an expired forecast) rather than cached
+        if not timeseries:
+            raise RuntimeError("Forecast has no timeseries")
+        self.timeseries = timeseries
+        self.series = Timeseries(timeseries)
+        self.expires = expires
+        self.last_modified = last_modified
+        self.fetched = time.time()
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) < self.expires
+
+    def slot(self, at=None) -> dict:
+        return self.series.slot(at)
+
+    def temp_humid(self, at=None, interpolate: bool = False) -> dict:
+        """{"temp", "humidity"} at `at` (default: now); see Timeseries.temp_humid."""
+        return self.series.temp_humid(at, interpolate)
+
+
+class WeatherCache:
+    def __init__(
+        self,
+        fetch: Callable,
+        max_cells: int = MAX_CELLS,
+        cell_deg: float = CELL_DEG,
+        altitude_step_m: float = ALTITUDE_STEP_M,
+    ):
+        """
+        fetch: callable(lat, lon, altitude, cached) -> CachedForecast, called
+               with the cell centre. `cached` is the expired forecast of the
+               cell (or None); fetch may revalidate and return it with a new
+               expiry instead of downloading it again.
+        """
+        self.fetch = fetch
+        self.max_cells = max_cells
+        self.cell_deg = cell_deg
+        self.altitude_step_m = altitude_step_m
+
+        self._cells = OrderedDict()
+        self._cell_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fetches = 0
+
+    def cell_key(self, lat: float, lon: float, altitude: Optional[float] = None) -> tuple:
+        alt = None if altitude is None else round(altitude / self.altitude_step_m)
+        return (round(lat / self.cell_deg), round(lon / self.cell_deg), alt)
+
+    def cell_center(self, key: tuple) -> tuple:
+        lat = round(key[0] * self.cell_deg, 4)
+        lon = round(key[1] * self.cell_deg, 4)
+        altitude = None if key[2] is None else int(key[2] * self.altitude_step_m)
+        return lat, lon, altitude
+
+    def _lookup(self, key):
+        with self._lock:
+            forecast = self._cells.get(key)
+            if forecast is not None:
+                self._cells.move_to_end(key)
+            return forecast
+
+    def _store(self, key, forecast):
+        with self._lock:
+            self._cells[key] = forecast
+            self._cells.move_to_end(key)
+            while len(self._cells) > self.max_cells:
+                old_key, _ = self._cells.popitem(last=False)
+                self._cell_locks.pop(old_key, None)
+
+    def peek(self, key: tuple, fresh_only: bool = True) -> Optional[CachedForecast]:
+        """The cached forecast of a cell (see cell_key), without fetching."""
+        forecast = self._lookup(key)
+        if forecast is None or (fresh_only and not forecast.is_fresh()):
+            return None
+        return forecast
+
+    def put(self, key: tuple, forecast: CachedForecast) -> None:
+        """Store a forecast fetched elsewhere, e.g. by a multi-location request."""
+        self._store(key, forecast)
+
+    def forecast(self, lat: float, lon: float, altitude: Optional[float] = None) -> CachedForecast:
+        """The up-to-date forecast of the cell containing (lat, lon, altitude)."""
+        key = self.cell_key(lat, lon, altitude)
+        forecast = self._lookup(key)
+        if forecast is not None and forecast.is_fresh():
+            self.hits += 1
+            return forecast
+
+        # One fetch per cell at a time; other callers wait for its result
+        with self._lock:
+            cell_lock = self._cell_locks.setdefault(key, threading.Lock())
+        with cell_lock:
+            forecast = self._lookup(key)
+            if forecast is not None and forecast.is_fresh():
+                self.hits += 1
+                return forecast
+            try:
+                fresh = self.fetch(*self.cell_center(key), forecast)
+            except Exception:
+                if forecast is None:
+                    raise
+                # Keep serving the expired forecast rather than failing
+                return forecast
+            self.fetches += 1
+            self._store(key, fresh)
+            return fresh
+
+    def get(
+        self,
+        lat: float,
+        lon: float,
+        altitude: Optional[float] = None,
+        at=None,
+        interpolate: bool = False,
+    ) -> dict:
+        """
+        {"temp": °C, "humidity": %} for a position, at `at` (datetime or
+        epoch seconds, default now). interpolate=True blends the two
+        forecast slots around `at` instead of taking the one in effect.
+        """
+        return self.forecast(lat, lon, altitude).temp_humid(at, interpolate)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._cell_locks.clear()
+
+    def __len__(self):
+        return len(self._cells)
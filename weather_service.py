@@ -0,0 +1,214 @@
+"""
+weather_service.py
+
+Fleet-level weather lookups.
+
+The server asks for the weather once per vehicle per tick, and vehicles in
+the same area ask for nearly the same point. FleetWeatherService gathers the
+positions requested at about the same time, reduces them to distinct
+forecast cells (see weather_cache.py), fetches only the cells that are not
+cached and fans the results back out, so the number of weather requests
+follows the number of distinct cells rather than the number of vehicles:
+
+  open-meteo  all missing cells in multi-location requests (comma-separated
+              latitude/longitude lists, OPEN_METEO_MAX_LOCATIONS per request)
+  met         one request per missing cell (MET has no multi-location API),
+              paced by http_client's token bucket for api.met.no
+
+Usage:
+    from weather_service import FleetWeatherService
+
+    service = FleetWeatherService()
+
+    # Once per tick, for the whole fleet:
+    service.get_many([(63.4305, 10.3951, 20), (63.4310, 10.3960, 25)])
+
+    # Or per vehicle, from many threads; calls made within max_wait_ms of
+    # each other are served by one get_many:
+    service.get(63.4305, 10.3951, 20)
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import requests
+
+
+def _location_specific(error: Exception) -> bool:
+    """Whether a failed multi-location request may succeed for part of its locations."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return False
+    response = getattr(error, "response", None)
+    return response is None or response.status_code < 500
+
+
+class FleetWeatherService:
+    def __init__(self, source: str = "open-meteo", max_wait_ms: float = 20.0, met_concurrency: int = 4):
+        """
+        source:          "open-meteo" (data_pipeline's cache) or "met" (weatherData's cache).
+        max_wait_ms:     how long get() gathers concurrent calls before looking them up.
+        met_concurrency: parallel MET requests; the token bucket still caps the rate.
+        """
+        if source == "open-meteo":
+            import data_pipeline
+            self.cache = data_pipeline.WEATHER_CACHE
+            self._fetch_many = data_pipeline.fetch_open_meteo_many
+        elif source == "met":
+            import weatherData
+            self.cache = weatherData.MET_CACHE
+            self._fetch_many = None
+            self._met_pool = ThreadPoolExecutor(max_workers=met_concurrency, thread_name_prefix="met-weather")
+        else:
+            raise ValueError(f"Unknown weather source: {source}")
+        self.source = source
+        self.max_wait_s = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.positions = 0
+        self.cells = 0
+        self.fetched_cells = 0
+
+    # ------------------------------------------------------------------
+    # Batch lookup
+    # ------------------------------------------------------------------
+
+    def _fetch_missing(self, keys: list) -> dict:
+        """
+        Forecasts for cells that are not cached, as {key: CachedForecast or
+        the exception that cell failed with}. One failing cell does not
+        fail the others.
+        """
+        if self._fetch_many is None:
+            # MET: one (rate-limited) request per cell, through the cache so
+            # expired cells are revalidated with If-Modified-Since
+            def fetch(key):
+                try:
+                    return self.cache.forecast(*self.cache.cell_center(key))
+                except Exception as e:
+                    return e
+            return dict(zip(keys, self._met_pool.map(fetch, keys)))
+
+        return self._fetch_split(keys)
+
+    def _fetch_split(self, keys: list) -> dict:
+        """
+        Open-Meteo: all cells in one multi-location request. If the request
+        is rejected (e.g. one bad location or an unexpected body), the batch
+        is split in halves and retried, down to single cells, so only the
+        failing cells go without a forecast. Connection errors, timeouts
+        and server errors are not location-specific and are not split.
+        """
+        centers = [self.cache.cell_center(key) for key in keys]
+        try:
+            forecasts = self._fetch_many(centers)
+        except Exception as e:
+            if len(keys) > 1 and _location_specific(e):
+                half = len(keys) // 2
+                return {**self._fetch_split(keys[:half]), **self._fetch_split(keys[half:])}
+            # Fall back to expired forecasts where there are any
+            result = {}
+            for key in keys:
+                stale = self.cache.peek(key, fresh_only=False)
+                result[key] = e if stale is None else stale
+            return result
+        for key, forecast in zip(keys, forecasts):
+            self.cache.put(key, forecast)
+        return dict(zip(keys, forecasts))
+
+    def get_many(self, positions: list, at=None, interpolate: bool = False) -> list:
+        """
+        {"temp", "humidity"} for every (lat, lon) or (lat, lon, altitude)
+        position, in input order, with one lookup per distinct cell.
+        Raises the error of the first position whose weather could not be
+        fetched; _lookup_many returns the errors per position instead.
+        """
+        results = self._lookup_many(positions, at, interpolate)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def _lookup_many(self, positions: list, at=None, interpolate: bool = False) -> list:
+        keys = [self.cache.cell_key(p[0], p[1], p[2] if len(p) > 2 else None) for p in positions]
+        forecasts = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            forecast = self.cache.peek(key)
+            if forecast is None:
+                missing.append(key)
+            else:
+                forecasts[key] = forecast
+        if missing:
+            forecasts.update(self._fetch_missing(missing))
+
+        with self._lock:
+            self.positions += len(keys)
+            self.cells += len(forecasts)
+            self.fetched_cells += len(missing)
+
+        results = []
+        for key in keys:
+            forecast = forecasts[key]
+            results.append(forecast if isinstance(forecast, Exception) else forecast.temp_humid(at, interpolate))
+        return results
+
+    # ------------------------------------------------------------------
+    # Per-vehicle calls, coalesced
+    # ------------------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="fleet-weather", daemon=True)
+                    self._thread.start()
+
+    def submit(self, lat: float, lon: float, altitude: Optional[float] = None) -> Future:
+        self._ensure_thread()
+        future = Future()
+        self._queue.put(((lat, lon, altitude), future))
+        return future
+
+    def get(self, lat: float, lon: float, altitude: Optional[float] = None, timeout: Optional[float] = None) -> dict:
+        """Weather for one position; blocks until the batch it joined is looked up."""
+        return self.submit(lat, lon, altitude).result(timeout=timeout)
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_s
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                results = self._lookup_many([position for position, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "source": self.source,
+                "positions": self.positions,
+                "cells": self.cells,
+                "fetched_cells": self.fetched_cells,
+                "cached_cells": len(self.cache),
+            }
@@ -1,30 +1,87 @@
 ﻿from pathlib import Path
 import io
 import json
+import os
+import threading
 import time
+from contextlib import contextmanager
 
 from flask import Flask, request, jsonify, send_from_directory
 import numpy as np
 from PIL import Image
-import onnxruntime as ort
+
+from batching import MicroBatcher
+from temporal import StreamRegistry, TemporalEngine
+from worker_pool import WorkerPool
+from inference import (
+    create_session,
+    decode_resized,
+    input_is_uint8,
+    input_shape,
+    normalize_into,
+    softmax,
+)
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
+sock = Sock(app) if Sock is not None else None
 
 ROOT = Path(__file__).resolve().parent.parent
 DATA_ROOT = ROOT / "data" / "RSCD dataset-1million"
-TRAIN_DIR = DATA_ROOT / "train"
-MODEL_PATH = ROOT / "rscd_resnet18.onnx"
-
-IMAGE_SIZE = 224
+# Model variants produced by export_for_web.ipynb and optimize_model.py
+MODEL_VARIANTS = {
+    "fp32": ROOT / "rscd_resnet18.onnx",
+    "optimized": ROOT / "rscd_resnet18.opt.onnx",
+    "int8": ROOT / "rscd_resnet18.int8.onnx",
+}
+MODEL_VARIANT = os.environ.get("RSCD_MODEL_VARIANT", "fp32")
+if MODEL_VARIANT not in MODEL_VARIANTS:
+    raise ValueError(
+        f"Unknown RSCD_MODEL_VARIANT={MODEL_VARIANT!r}; valid variants: {', '.join(MODEL_VARIANTS)}"
+    )
+MODEL_PATH = Path(os.environ.get("RSCD_MODEL_PATH", MODEL_VARIANTS[MODEL_VARIANT]))
+# Class list and group mapping written by export_for_web.ipynb
+CLASSES_PATH = Path(os.environ.get("RSCD_CLASSES_PATH", ROOT / "rscd_resnet18.classes.json"))
+
+# onnxruntime thread pools; 0 keeps the onnxruntime default
+INTRA_OP_THREADS = int(os.environ.get("RSCD_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("RSCD_INTER_OP_THREADS", "0"))
+
+MAX_BATCH_SIZE = 32
+# Model input arrays kept for reuse between requests (see input_buffer)
+MAX_POOLED_BUFFERS = 16
+
+# Coalesce concurrent /predict calls into batched ONNX runs
+MICROBATCH_ENABLED = os.environ.get("RSCD_MICROBATCH", "1") != "0"
+MICROBATCH_MAX_SIZE = int(os.environ.get("RSCD_MICROBATCH_MAX_SIZE", "8"))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("RSCD_MICROBATCH_MAX_WAIT_MS", "5"))
+
+# Per-stream temporal smoothing and inference skipping (see temporal.py) for
+# /stream, and for /predict calls that pass a stream_id
+TEMPORAL_ENABLED = os.environ.get("RSCD_TEMPORAL", "1") != "0"
+TEMPORAL_SETTINGS = {
+    "mode": os.environ.get("RSCD_TEMPORAL_MODE", "ema"),
+    "alpha": float(os.environ.get("RSCD_TEMPORAL_ALPHA", "0.3")),
+    "change_threshold": float(os.environ.get("RSCD_TEMPORAL_CHANGE_THRESHOLD", "8")),
+    "min_interval_s": float(os.environ.get("RSCD_TEMPORAL_MIN_INTERVAL_S", "0.25")),
+    "max_interval_s": float(os.environ.get("RSCD_TEMPORAL_MAX_INTERVAL_S", "3")),
+}
+
+# Inference worker processes for production serving (python app.py --workers N);
+# 0 runs inference in this process
+WORKERS = int(os.environ.get("RSCD_WORKERS", "0"))
+# Seconds a request waits for the workers before failing
+WORKER_TIMEOUT_S = float(os.environ.get("RSCD_WORKER_TIMEOUT_S", "30"))
 
 FRICTION_CLASSES = ["dry", "wet", "water"]
 SURFACE_CLASSES = ["asphalt", "concrete", "gravel", "mud"]
 WINTER_CLASSES = ["fresh_snow", "melted_snow", "ice"]
 UNEVEN_CLASSES = ["smooth", "slight", "severe"]
 
-MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
-STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
-
 CLASS_NAMES_FALLBACK = [
     "dry_asphalt_severe",
     "dry_asphalt_slight",
@@ -55,14 +112,6 @@ CLASS_NAMES_FALLBACK = [
     "wet_mud",
 ]
 
-def get_class_names():
-    if not TRAIN_DIR.exists():
-        print(f"Missing train dir: {TRAIN_DIR}. Using fallback class list.")
-        return CLASS_NAMES_FALLBACK
-    class_names = sorted([p.name for p in TRAIN_DIR.iterdir() if p.is_dir()])
-    return class_names
-
-
 def parse_groups(label_name: str):
     parts = label_name.split("_")
     friction = None
@@ -86,64 +135,363 @@ def parse_groups(label_name: str):
     return friction, surface, uneven, winter
 
 
-CLASS_NAMES = get_class_names()
-IDX_TO_CLASS = {i: name for i, name in enumerate(CLASS_NAMES)}
-INDEX_GROUPS = {i: parse_groups(name) for i, name in IDX_TO_CLASS.items()}
-
-if not MODEL_PATH.exists():
-    raise FileNotFoundError(
-        f"Missing ONNX model at {MODEL_PATH}. "
-        "Run export_for_web.ipynb to create rscd_resnet18.onnx."
-    )
-
-SESSION = ort.InferenceSession(str(MODEL_PATH), providers=["CPUExecutionProvider"])
-INPUT_NAME = SESSION.get_inputs()[0].name
+GROUP_NAMES = ("friction", "surface", "uneven", "winter")  # same order as parse_groups
+GROUP_LABELS = {
+    "friction": FRICTION_CLASSES,
+    "surface": SURFACE_CLASSES,
+    "uneven": UNEVEN_CLASSES,
+    "winter": WINTER_CLASSES,
+}
+
+
+def build_aggregation_matrix(index_groups, num_classes):
+    """
+    0/1 matrix of shape (classes, all group labels) so that probs @ matrix
+    gives every group score at once, plus the column slice of each group.
+    """
+    slices = {}
+    blocks = []
+    col = 0
+    for g, group in enumerate(GROUP_NAMES):
+        labels = GROUP_LABELS[group]
+        block = np.zeros((num_classes, len(labels)), dtype=np.float32)
+        for idx, groups in index_groups.items():
+            if groups[g] is not None:
+                block[idx, labels.index(groups[g])] = 1.0
+        blocks.append(block)
+        slices[group] = slice(col, col + len(labels))
+        col += len(labels)
+    return np.concatenate(blocks, axis=1), slices
+
+
+def load_class_info(session=None):
+    """
+    (class names, {class index: groups}) from the sidecar file written by
+    export_for_web.ipynb, else from the model metadata, else the fallback list.
+    """
+    info = None
+    if CLASSES_PATH.exists():
+        info = json.loads(CLASSES_PATH.read_text())
+    elif session is not None:
+        meta = session.get_modelmeta().custom_metadata_map
+        if "class_names" in meta:
+            info = {"class_names": json.loads(meta["class_names"])}
+            if "class_groups" in meta:
+                info["groups"] = json.loads(meta["class_groups"])
+    if info is None:
+        print(f"Missing {CLASSES_PATH.name} and no class names in the model. Using fallback class list.")
+        info = {"class_names": CLASS_NAMES_FALLBACK}
+
+    class_names = info["class_names"]
+    groups = info.get("groups") or {}
+    index_groups = {}
+    for i, name in enumerate(class_names):
+        if name in groups:
+            index_groups[i] = tuple(groups[name].get(group) for group in GROUP_NAMES)
+        else:
+            index_groups[i] = parse_groups(name)
+    return class_names, index_groups
+
+
+# Filled in by load_model(), which runs in the background at startup so the
+# server accepts connections (and health checks) while the model loads.
+CLASS_NAMES = None
+IDX_TO_CLASS = None
+INDEX_GROUPS = None
+AGGREGATION_MATRIX = None
+GROUP_SLICES = None
+SESSION = None
+INPUT_NAME = None
+INPUT_IS_UINT8 = False
+INPUT_DTYPE = np.float32
+BATCHER = None
+POOL = None
+
+MODEL_READY = threading.Event()
+MODEL_ERROR = None
+MODEL_LOAD_SECONDS = None
+_load_lock = threading.Lock()
+
+# Werkzeug serves every request on a new thread, so the input arrays are
+# pooled across threads rather than kept per thread
+_free_buffers = []
+_buffers_lock = threading.Lock()
+
+
+@contextmanager
+def input_buffer(n: int):
+    """Model input array with room for n frames, borrowed from the pool for the with block."""
+    shape = input_shape(n, INPUT_IS_UINT8)
+    with _buffers_lock:
+        buf = _free_buffers.pop() if _free_buffers else None
+    if buf is None or len(buf) < n or buf.shape[1:] != shape[1:] or buf.dtype != INPUT_DTYPE:
+        buf = np.empty(shape, dtype=INPUT_DTYPE)
+    try:
+        yield buf[:n]
+    finally:
+        with _buffers_lock:
+            if len(_free_buffers) < MAX_POOLED_BUFFERS:
+                _free_buffers.append(buf)
+
+
+def preprocess_into(image: Image.Image, out: np.ndarray) -> np.ndarray:
+    """Write one frame into `out` (CHW float32, or HWC uint8 for uint8 models)."""
+    return normalize_into(decode_resized(image), out, INPUT_IS_UINT8)
 
 
 def preprocess(image: Image.Image) -> np.ndarray:
-    image = image.convert("RGB")
-    image = image.resize((IMAGE_SIZE, IMAGE_SIZE))
-    arr = np.asarray(image).astype(np.float32) / 255.0
-    arr = (arr - MEAN) / STD
-    arr = np.transpose(arr, (2, 0, 1))
-    arr = np.expand_dims(arr, axis=0)
-    return arr
-
-
-def topk(scores, k=3):
-    return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
-
-
-def predict_grouped(image: Image.Image):
-    x = preprocess(image)
-    logits = SESSION.run(None, {INPUT_NAME: x})[0]
-    probs = np.exp(logits - np.max(logits, axis=1, keepdims=True))
-    probs = probs / probs.sum(axis=1, keepdims=True)
-    probs = probs[0]
-
-    friction_scores = {k: 0.0 for k in FRICTION_CLASSES}
-    surface_scores = {k: 0.0 for k in SURFACE_CLASSES}
-    winter_scores = {k: 0.0 for k in WINTER_CLASSES}
-    uneven_scores = {k: 0.0 for k in UNEVEN_CLASSES}
-
-    for idx, p in enumerate(probs):
-        friction, surface, uneven, winter = INDEX_GROUPS[idx]
-        if friction is not None:
-            friction_scores[friction] += float(p)
-        if surface is not None:
-            surface_scores[surface] += float(p)
-        if uneven is not None:
-            uneven_scores[uneven] += float(p)
-        if winter is not None:
-            winter_scores[winter] += float(p)
-
-    return {
-        "friction": topk(friction_scores),
-        "surface": topk(surface_scores),
-        "uneven": topk(uneven_scores),
-        "winter": topk(winter_scores),
-        "raw_top": topk({IDX_TO_CLASS[i]: float(p) for i, p in enumerate(probs)}, k=5),
+    """Model input for one frame, shape (1, ...)."""
+    x = np.empty(input_shape(1, INPUT_IS_UINT8), dtype=INPUT_DTYPE)
+    preprocess_into(image, x[0])
+    return x
+
+
+def topk_indices(scores: np.ndarray, k=3) -> np.ndarray:
+    """Column indices of the k highest scores per row, highest first."""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def _labelled_topk(scores: np.ndarray, labels, k):
+    idx = topk_indices(scores, k)
+    values = np.take_along_axis(scores, idx, axis=1).tolist()
+    return [
+        [(labels[i], v) for i, v in zip(row_idx, row_values)]
+        for row_idx, row_values in zip(idx.tolist(), values)
+    ]
+
+
+def group_probabilities_batch(probs: np.ndarray):
+    """Grouped top-k results for a (N, classes) batch of probability rows."""
+    scores = probs @ AGGREGATION_MATRIX
+    per_group = {
+        group: _labelled_topk(scores[:, GROUP_SLICES[group]], GROUP_LABELS[group], 3)
+        for group in GROUP_NAMES
     }
+    raw_top = _labelled_topk(probs, CLASS_NAMES, 5)
+    return [
+        {
+            "friction": per_group["friction"][i],
+            "surface": per_group["surface"][i],
+            "uneven": per_group["uneven"][i],
+            "winter": per_group["winter"][i],
+            "raw_top": raw_top[i],
+        }
+        for i in range(len(probs))
+    ]
+
+
+def group_probabilities(probs: np.ndarray):
+    return group_probabilities_batch(probs[np.newaxis, :])[0]
+
+
+def predict_probs_batch(images, timing=None) -> np.ndarray:
+    """Class probabilities (N, classes) for N images, run as a single batch.
+
+    A single image goes through the micro-batcher, if enabled, so concurrent
+    requests share model runs. If `timing` is a dict, preprocess and
+    inference times in milliseconds are added to it.
+    """
+    t0 = time.perf_counter()
+    with input_buffer(len(images)) as x:
+        for i, image in enumerate(images):
+            preprocess_into(image, x[i])
+        t1 = time.perf_counter()
+        if BATCHER is not None and len(images) == 1:
+            # The batcher copies x into its own batch before run() returns
+            probs = BATCHER.run(x)[np.newaxis, :]
+        else:
+            probs = softmax(SESSION.run(None, {INPUT_NAME: x})[0])
+    t2 = time.perf_counter()
+    if timing is not None:
+        timing["preprocess_ms"] = round(timing.get("preprocess_ms", 0.0) + 1000.0 * (t1 - t0), 3)
+        timing["inference_ms"] = round(timing.get("inference_ms", 0.0) + 1000.0 * (t2 - t1), 3)
+    return probs
+
+
+def predict_grouped_batch(images, timing=None):
+    """Run N images through the model in a single batch; one grouped result per image.
+
+    If `timing` is a dict it is filled with preprocess/inference/postprocess
+    times in milliseconds for the whole batch.
+    """
+    if not images:
+        return []
+    probs = predict_probs_batch(images, timing=timing)
+    t0 = time.perf_counter()
+    results = group_probabilities_batch(probs)
+    if timing is not None:
+        timing["postprocess_ms"] = round(1000.0 * (time.perf_counter() - t0), 3)
+    return results
+
+
+def run_probs_batch(inputs):
+    """Batch runner for the micro-batcher: list of (1, ...) inputs -> list of probability rows."""
+    with input_buffer(len(inputs)) as x:
+        np.concatenate(inputs, axis=0, out=x)
+        logits = SESSION.run(None, {INPUT_NAME: x})[0]
+    return list(softmax(logits))
+
+
+def predict_grouped(image: Image.Image, timing=None):
+    return predict_grouped_batch([image], timing=timing)[0]
+
+
+def load_model(workers=0):
+    """
+    Load class names and the model; a no-op once loaded.
+
+    With workers > 0 the model is only loaded in the worker processes (see
+    worker_pool.py) and this process keeps no session of its own, so class
+    names then come from the sidecar file or the fallback list.
+    """
+    global CLASS_NAMES, IDX_TO_CLASS, INDEX_GROUPS, AGGREGATION_MATRIX, GROUP_SLICES
+    global SESSION, INPUT_NAME, INPUT_IS_UINT8, INPUT_DTYPE, BATCHER, POOL, MODEL_ERROR, MODEL_LOAD_SECONDS
+
+    with _load_lock:
+        if MODEL_READY.is_set():
+            return
+        start = time.perf_counter()
+        if not MODEL_PATH.exists():
+            raise FileNotFoundError(
+                f"Missing ONNX model at {MODEL_PATH}. "
+                "Run export_for_web.ipynb to create rscd_resnet18.onnx"
+                " (and optimize_model.py for the optimized/int8 variants)."
+            )
+
+        session = create_session(MODEL_PATH, INTRA_OP_THREADS, INTER_OP_THREADS) if workers <= 0 else None
+        class_names, index_groups = load_class_info(session)
+        CLASS_NAMES = class_names
+        IDX_TO_CLASS = dict(enumerate(class_names))
+        INDEX_GROUPS = index_groups
+        AGGREGATION_MATRIX, GROUP_SLICES = build_aggregation_matrix(index_groups, len(class_names))
+
+        if session is None:
+            POOL = WorkerPool(MODEL_PATH, len(class_names), n_workers=workers,
+                              intra_op_threads=INTRA_OP_THREADS or 1).start()
+        else:
+            SESSION = session
+            INPUT_NAME = session.get_inputs()[0].name
+            INPUT_IS_UINT8 = input_is_uint8(session)
+            INPUT_DTYPE = np.uint8 if INPUT_IS_UINT8 else np.float32
+            if MICROBATCH_ENABLED:
+                BATCHER = MicroBatcher(run_probs_batch, max_batch_size=MICROBATCH_MAX_SIZE,
+                                       max_wait_ms=MICROBATCH_MAX_WAIT_MS)
+
+        MODEL_ERROR = None
+        MODEL_LOAD_SECONDS = time.perf_counter() - start
+        MODEL_READY.set()
+
+
+def _load_in_background(workers):
+    global MODEL_ERROR
+    try:
+        load_model(workers)
+    except Exception as e:
+        MODEL_ERROR = f"{type(e).__name__}: {e}"
+        print(f"Model failed to load: {MODEL_ERROR}")
+
+
+def start_model_loading(workers=0):
+    thread = threading.Thread(target=_load_in_background, args=(workers,), name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def frame_probabilities(frames, timing=None) -> np.ndarray:
+    """Class probabilities (N, classes) for encoded image frames (bytes).
+
+    With a worker pool the frames are decoded and run in the workers, all in
+    flight at once; otherwise they go through the in-process model in
+    batches of up to MAX_BATCH_SIZE. Timing sums preprocess/inference times.
+    """
+    if POOL is None:
+        images = [Image.open(io.BytesIO(frame)) for frame in frames]
+        return np.concatenate([
+            predict_probs_batch(images[start:start + MAX_BATCH_SIZE], timing=timing)
+            for start in range(0, len(images), MAX_BATCH_SIZE)
+        ])
+
+    t0 = time.perf_counter()
+    deadline = time.monotonic() + WORKER_TIMEOUT_S
+    futures = [POOL.submit(frame, timeout=max(0.0, deadline - time.monotonic())) for frame in frames]
+    outputs = [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+    if timing is not None:
+        timing["preprocess_ms"] = round(sum(t["preprocess_ms"] for _, t in outputs), 3)
+        timing["inference_ms"] = round(sum(t["inference_ms"] for _, t in outputs), 3)
+        timing["worker_wall_ms"] = round(1000.0 * (time.perf_counter() - t0), 3)
+    return np.stack([probs for probs, _ in outputs])
+
+
+def predict_grouped_frames(frames, timing=None):
+    """Grouped results for encoded image frames (bytes), one per frame."""
+    probs = frame_probabilities(frames, timing=timing)
+    t0 = time.perf_counter()
+    results = group_probabilities_batch(probs)
+    if timing is not None:
+        timing["postprocess_ms"] = round(1000.0 * (time.perf_counter() - t0), 3)
+    return results
+
+
+def condition_confidence(probs: np.ndarray) -> float:
+    """Top score of the road condition: friction and winter labels together cover every class."""
+    scores = probs @ AGGREGATION_MATRIX
+    return float(max(scores[GROUP_SLICES["friction"]].max(), scores[GROUP_SLICES["winter"]].max()))
+
+
+def new_temporal_engine():
+    return TemporalEngine(confidence=condition_confidence, **TEMPORAL_SETTINGS)
+
+
+STREAMS = StreamRegistry(new_temporal_engine)
+
+
+def predict_temporal(frame: bytes, engine: TemporalEngine, timing=None):
+    """Smoothed grouped result for the next frame of a stream.
+
+    The model only runs when the engine's change detector or adaptive rate
+    asks for it; otherwise the current smoothed state is returned as is.
+    """
+    inferred = engine.should_infer(frame)
+    if inferred:
+        engine.update(frame_probabilities([frame], timing=timing)[0])
+    t0 = time.perf_counter()
+    result = group_probabilities(engine.probs)
+    if timing is not None:
+        timing["postprocess_ms"] = round(1000.0 * (time.perf_counter() - t0), 3)
+    result["temporal"] = dict(engine.status(), inferred=inferred)
+    return result
+
+
+# Endpoints that need the model; they answer 503 until it has loaded
+MODEL_ENDPOINTS = {"predict", "predict_batch", "stream"}
+
+
+@app.before_request
+def require_model():
+    if request.endpoint in MODEL_ENDPOINTS and not MODEL_READY.is_set():
+        body = {"error": "model not ready" if MODEL_ERROR is None else MODEL_ERROR}
+        return jsonify(body), 503, {"Retry-After": "1"}
+
+
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    if MODEL_READY.is_set():
+        return jsonify({"status": "ready", "load_seconds": round(MODEL_LOAD_SECONDS, 3)})
+    if MODEL_ERROR is not None:
+        return jsonify({"status": "error", "error": MODEL_ERROR}), 503
+    return jsonify({"status": "loading"}), 503
 
 
 @app.route("/")
@@ -156,10 +504,135 @@ def predict():
     if "image" not in request.files:
         return jsonify({"error": "missing image"}), 400
     file = request.files["image"]
-    image = Image.open(io.BytesIO(file.read()))
-    result = predict_grouped(image)
+    stream_id = request.form.get("stream_id")
+    timing = {}
+    if stream_id and TEMPORAL_ENABLED:
+        result = predict_temporal(file.read(), STREAMS.get(stream_id), timing=timing)
+    else:
+        result = predict_grouped_frames([file.read()], timing=timing)[0]
+    result["timing"] = timing
     return jsonify(result)
 
 
+@app.route("/predict_batch", methods=["POST"])
+def predict_batch():
+    files = request.files.getlist("images")
+    if not files:
+        return jsonify({"error": "missing images"}), 400
+    timing = {}
+    results = predict_grouped_frames([f.read() for f in files], timing=timing)
+    return jsonify({"results": results, "timing": timing})
+
+
+def stream_predictions(ws, engine=None):
+    """Serve one streaming connection: binary JPEG frames in, JSON predictions out.
+
+    A reader thread keeps only the newest received frame. If frames arrive
+    faster than inference runs, older unprocessed frames are dropped rather
+    than queued, so each reply is for the most recent frame available.
+    With a TemporalEngine, replies are smoothed and unchanged frames skip inference.
+    """
+    cond = threading.Condition()
+    state = {"frame": None, "seq": 0, "dropped": 0, "closed": False}
+
+    def reader():
+        try:
+            while True:
+                data = ws.receive()
+                if data is None:
+                    break
+                if not isinstance(data, (bytes, bytearray)):
+                    continue
+                with cond:
+                    if state["frame"] is not None:
+                        state["dropped"] += 1
+                    state["frame"] = data
+                    state["seq"] += 1
+                    cond.notify()
+        except Exception:
+            pass
+        finally:
+            with cond:
+                state["closed"] = True
+                cond.notify()
+
+    threading.Thread(target=reader, name="stream-reader", daemon=True).start()
+
+    while True:
+        with cond:
+            while state["frame"] is None and not state["closed"]:
+                cond.wait()
+            if state["frame"] is None:
+                return
+            frame, seq, dropped = state["frame"], state["seq"], state["dropped"]
+            state["frame"] = None
+
+        timing = {}
+        try:
+            if engine is not None:
+                result = predict_temporal(frame, engine, timing=timing)
+            else:
+                result = predict_grouped_frames([frame], timing=timing)[0]
+        except Exception as e:
+            result = {"error": str(e)}
+        result["timing"] = timing
+        result["seq"] = seq
+        result["dropped"] = dropped
+        try:
+            ws.send(json.dumps(result))
+        except Exception:
+            return
+
+
+if sock is not None:
+    @sock.route("/stream")
+    def stream(ws):
+        # ?stream_id=... keeps the temporal state across reconnects; ?temporal=0 disables it
+        engine = None
+        if TEMPORAL_ENABLED and request.args.get("temporal", "1") != "0":
+            stream_id = request.args.get("stream_id")
+            engine = STREAMS.get(stream_id) if stream_id else new_temporal_engine()
+        stream_predictions(ws, engine)
+
+
+@app.route("/metrics")
+def metrics():
+    return jsonify({
+        "model": {
+            "ready": MODEL_READY.is_set(),
+            "variant": MODEL_VARIANT,
+            "path": str(MODEL_PATH),
+            "intra_op_threads": INTRA_OP_THREADS,
+            "inter_op_threads": INTER_OP_THREADS,
+        },
+        "microbatch": BATCHER.metrics() if BATCHER is not None else None,
+        "workers": POOL.metrics() if POOL is not None else None,
+        "temporal": dict(TEMPORAL_SETTINGS, enabled=TEMPORAL_ENABLED, streams=len(STREAMS)),
+    })
+
+
+if __name__ not in ("__main__", "__mp_main__"):
+    # Imported by a WSGI server (or optimize_model.py): load in the background
+    start_model_loading(WORKERS)
+
+
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=8000, debug=False)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="RSCD road-condition web demo")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="inference worker processes pinned to cores (0 = in-process)")
+    args = parser.parse_args()
+
+    start_model_loading(args.workers)
+    if args.workers <= 0:
+        app.run(host=args.host, port=args.port, debug=False)
+    else:
+        try:
+            from waitress import serve
+        except ImportError:
+            app.run(host=args.host, port=args.port, debug=False, threaded=True)
+        else:
+            serve(app, host=args.host, port=args.port, threads=max(8, 2 * args.workers))
@@ -0,0 +1,121 @@
+"""Request-coalescing inference queue for the web demo.
+
+Concurrent requests submit single inputs; one worker thread collects them
+into batches of up to `max_batch_size`, runs them through `run_batch` in a
+single call and hands each caller its own output.
+
+When only one request is waiting the batch is run immediately, so a lightly
+loaded server sees no added latency. The `max_wait_ms` window only applies
+once several requests are queued at the same time.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, name="micro-batcher"):
+        """
+        run_batch: callable taking a list of inputs and returning a sequence
+                   of outputs of the same length and order.
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = {}
+        self._run_seconds = 0.0
+        self._last_batch_size = 0
+
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        return future
+
+    def run(self, item, timeout=None):
+        """Submit one input and block until its output is ready."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+
+        # Take everything that is already waiting, without blocking
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        # Requests are arriving concurrently: give stragglers a short window
+        if 1 < len(batch) < self.max_batch_size:
+            deadline = time.monotonic() + self.max_wait_s
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+
+            start = time.perf_counter()
+            try:
+                outputs = self.run_batch(items)
+                if len(outputs) != len(futures):
+                    # zip() would leave the callers past the shorter side waiting forever
+                    raise RuntimeError(
+                        f"run_batch returned {len(outputs)} outputs for a batch of {len(futures)} inputs"
+                    )
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    n = len(batch)
+                    self._batches += 1
+                    self._items += n
+                    self._batch_sizes[n] = self._batch_sizes.get(n, 0) + 1
+                    self._run_seconds += elapsed
+                    self._last_batch_size = n
+
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            batches = self._batches
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": batches,
+                "items": self._items,
+                "mean_batch_size": self._items / batches if batches else 0.0,
+                "last_batch_size": self._last_batch_size,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "mean_batch_run_ms": 1000.0 * self._run_seconds / batches if batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": 1000.0 * self.max_wait_s,
+            }
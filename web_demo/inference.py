@@ -0,0 +1,75 @@
+"""Model-runtime helpers shared by the Flask app, the worker pool and optimize_model.py.
+
+Nothing here touches Flask or loads a model at import time, and onnxruntime
+is only imported when the first session is created, so importing this module
+(and app.py) stays cheap.
+"""
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = 224
+
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# (x / 255 - MEAN) / STD folded into a single multiply-add on the CHW array
+NORM_SCALE = (1.0 / (255.0 * STD)).astype(np.float32).reshape(3, 1, 1)
+NORM_BIAS = (-MEAN / STD).astype(np.float32).reshape(3, 1, 1)
+
+
+def create_session(model, intra_op_threads=0, inter_op_threads=0):
+    """InferenceSession for a model path or serialized model bytes."""
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        opts.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        opts.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    if not isinstance(model, (bytes, bytearray)):
+        model = str(model)
+    return ort.InferenceSession(model, sess_options=opts, providers=["CPUExecutionProvider"])
+
+
+def input_is_uint8(session) -> bool:
+    """Models exported with the normalization inside the graph (see
+    export_for_web.ipynb) take uint8 NHWC frames straight from the decoder."""
+    return session.get_inputs()[0].type == "tensor(uint8)"
+
+
+def input_shape(n: int, uint8: bool):
+    return (n, IMAGE_SIZE, IMAGE_SIZE, 3) if uint8 else (n, 3, IMAGE_SIZE, IMAGE_SIZE)
+
+
+def decode_resized(image: Image.Image) -> np.ndarray:
+    """Decode to a uint8 HWC array at model resolution.
+
+    JPEGs are decoded in draft mode, i.e. straight at the smallest DCT scale
+    that is still at least IMAGE_SIZE, instead of at full resolution.
+    Bilinear resize matches torchvision's Resize used in training.
+    """
+    image.draft("RGB", (IMAGE_SIZE, IMAGE_SIZE))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size != (IMAGE_SIZE, IMAGE_SIZE):
+        image = image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+    return np.asarray(image)
+
+
+def normalize_into(hwc: np.ndarray, out: np.ndarray, uint8: bool) -> np.ndarray:
+    """Write a decoded uint8 HWC frame into `out` (CHW float32, or HWC uint8 for uint8 models)."""
+    if uint8:
+        out[...] = hwc
+    else:
+        np.multiply(hwc.transpose(2, 0, 1), NORM_SCALE, out=out)
+        out += NORM_BIAS
+    return out
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    probs = np.exp(logits - np.max(logits, axis=1, keepdims=True))
+    return probs / probs.sum(axis=1, keepdims=True)
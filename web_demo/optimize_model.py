@@ -0,0 +1,203 @@
+"""Build and check optimized variants of the exported RSCD model.
+
+Variants (written next to rscd_resnet18.onnx, selected in app.py with
+RSCD_MODEL_VARIANT):
+
+    optimized  offline graph optimization (constant folding, fusions), saved
+               so the server does not redo it at every start
+    int8       static INT8 quantization (QDQ, per-channel weights), calibrated
+               on images from the RSCD validation split
+
+`compare` runs every available variant on validation images and checks that
+the grouped friction/surface probabilities stay within tolerance of the fp32
+model, alongside the per-frame latency of each variant.
+
+Usage:
+    python optimize_model.py all
+    python optimize_model.py quantize --calibration-images 300
+    python optimize_model.py compare --images 200 --tolerance 0.02
+
+Quantization needs the `onnx` package in addition to requirements.txt.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+import app
+from inference import create_session, decode_resized, input_is_uint8, input_shape, normalize_into, softmax
+
+VALI_DIR = app.DATA_ROOT / "vali_20k"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def list_images(image_dir, limit):
+    """Up to `limit` images spread evenly over the (sorted) directory tree."""
+    image_dir = Path(image_dir)
+    if not image_dir.exists():
+        raise SystemExit(f"Missing image dir {image_dir}. Pass --image-dir with RSCD validation images.")
+    paths = sorted(p for p in image_dir.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        raise SystemExit(f"No images found in {image_dir}.")
+    step = max(1, len(paths) // limit)
+    return paths[::step][:limit]
+
+
+def model_input(session, path):
+    """Input array for one image, in the layout/dtype the session expects."""
+    uint8 = input_is_uint8(session)
+    x = np.empty(input_shape(1, uint8), dtype=np.uint8 if uint8 else np.float32)
+    normalize_into(decode_resized(Image.open(path)), x[0], uint8)
+    return x
+
+
+def optimize(src, dst):
+    opts = ort.SessionOptions()
+    # EXTENDED rather than ALL: the layout optimizations of ALL are specific
+    # to the machine that runs them, and the saved model should be portable.
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    opts.optimized_model_filepath = str(dst)
+    ort.InferenceSession(str(src), sess_options=opts, providers=["CPUExecutionProvider"])
+    print(f"Wrote {dst}")
+
+
+def quantize(src, dst, image_dir, n_images):
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    session = ort.InferenceSession(str(src), providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    paths = list_images(image_dir, n_images)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(paths)
+
+        def get_next(self):
+            path = next(self._paths, None)
+            if path is None:
+                return None
+            return {input_name: model_input(session, path)}
+
+    pre = Path(dst).with_suffix(".pre.onnx")
+    quant_pre_process(str(src), str(pre), skip_symbolic_shape=True)
+    try:
+        quantize_static(
+            str(pre),
+            str(dst),
+            Reader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    finally:
+        pre.unlink(missing_ok=True)
+    print(f"Wrote {dst} (calibrated on {len(paths)} images)")
+
+
+def run_variant(path, paths, intra_op_threads=0):
+    session = create_session(path, intra_op_threads=intra_op_threads)
+    input_name = session.get_inputs()[0].name
+    inputs = [model_input(session, p) for p in paths]
+
+    session.run(None, {input_name: inputs[0]})  # warm-up
+    latencies = []
+    probs = []
+    for x in inputs:
+        start = time.perf_counter()
+        logits = session.run(None, {input_name: x})[0]
+        latencies.append(time.perf_counter() - start)
+        probs.append(softmax(logits)[0])
+    return np.stack(probs), np.asarray(latencies) * 1000.0
+
+
+def compare(image_dir, n_images, tolerance, min_agreement, intra_op_threads=0):
+    """Accuracy/latency table for every available variant, checked against fp32."""
+    paths = list_images(image_dir, n_images)
+    reference = None
+    report = {}
+    ok = True
+
+    for variant, path in app.MODEL_VARIANTS.items():
+        if not path.exists():
+            continue
+        probs, latency = run_variant(path, paths, intra_op_threads)
+        scores = probs @ app.AGGREGATION_MATRIX
+        if reference is None:
+            if variant != "fp32":
+                raise SystemExit("compare needs the fp32 model as reference.")
+            reference = scores
+
+        entry = {
+            "p50_ms": float(np.percentile(latency, 50)),
+            "p95_ms": float(np.percentile(latency, 95)),
+        }
+        for group in ("friction", "surface"):
+            cols = app.GROUP_SLICES[group]
+            diff = np.abs(scores[:, cols] - reference[:, cols])
+            agree = np.mean(scores[:, cols].argmax(axis=1) == reference[:, cols].argmax(axis=1))
+            entry[f"{group}_mean_abs_diff"] = float(diff.mean())
+            entry[f"{group}_max_abs_diff"] = float(diff.max())
+            entry[f"{group}_top1_agreement"] = float(agree)
+            if diff.mean() > tolerance or agree < min_agreement:
+                entry["within_tolerance"] = False
+        entry.setdefault("within_tolerance", True)
+        ok = ok and entry["within_tolerance"]
+        report[variant] = entry
+
+    print(f"{'VARIANT':<10} | {'p50 ms':>7} | {'p95 ms':>7} | {'friction diff/agree':>18} | {'surface diff/agree':>18} | OK")
+    for variant, e in report.items():
+        print(
+            f"{variant:<10} | {e['p50_ms']:7.2f} | {e['p95_ms']:7.2f} | "
+            f"{e['friction_mean_abs_diff']:9.4f} / {e['friction_top1_agreement']:6.1%} | "
+            f"{e['surface_mean_abs_diff']:9.4f} / {e['surface_top1_agreement']:6.1%} | "
+            f"{'yes' if e['within_tolerance'] else 'NO'}"
+        )
+    return report, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["optimize", "quantize", "compare", "all"])
+    parser.add_argument("--image-dir", default=str(VALI_DIR), help="RSCD validation images")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--images", type=int, default=200, help="images used by compare")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="max mean abs diff of grouped friction/surface probabilities")
+    parser.add_argument("--min-agreement", type=float, default=0.97,
+                        help="min top-1 agreement with fp32 for friction and surface")
+    parser.add_argument("--intra-op-threads", type=int, default=0)
+    parser.add_argument("--json", help="also write the compare report to this file")
+    args = parser.parse_args()
+
+    src = app.MODEL_VARIANTS["fp32"]
+    if args.command in ("compare", "all"):
+        app.load_model()  # class names and grouping matrix
+    if args.command in ("optimize", "all"):
+        optimize(src, app.MODEL_VARIANTS["optimized"])
+    if args.command in ("quantize", "all"):
+        quantize(src, app.MODEL_VARIANTS["int8"], args.image_dir, args.calibration_images)
+    if args.command in ("compare", "all"):
+        report, ok = compare(args.image_dir, args.images, args.tolerance, args.min_agreement, args.intra_op_threads)
+        if args.json:
+            Path(args.json).write_text(json.dumps(report, indent=2))
+        if not ok:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,15 @@ let timerId = null;
 let cameraReady = false;
 let currentSource = 'camera'; // 'camera' or 'file'
 
+// Streaming channel: frames go over a WebSocket when the server supports it,
+// otherwise we fall back to one POST /predict per frame.
+let socket = null;
+let socketReady = false;
+let frameInFlight = false;
+// Identifies this page's stream, so the server keeps one temporal state
+// (smoothing, skipped inference) for it across reconnects and POST fallback.
+const streamId = Math.random().toString(36).slice(2);
+
 function renderList(el, items) {
   el.innerHTML = '';
   items.forEach(([label, score]) => {
@@ -29,27 +38,58 @@ function renderList(el, items) {
   });
 }
 
+function renderPrediction(data) {
+  renderList(frictionEl, data.friction || []);
+  renderList(surfaceEl, data.surface || []);
+  renderList(unevenEl, data.uneven || []);
+  renderList(winterEl, data.winter || []);
+  renderList(rawEl, data.raw_top || []);
+}
+
+function openSocket() {
+  if (socket || !('WebSocket' in window)) return;
+  const proto = location.protocol === 'https:' ? 'wss:' : 'ws:';
+  socket = new WebSocket(`${proto}//${location.host}/stream?stream_id=${streamId}`);
+  socket.binaryType = 'arraybuffer';
+  socket.onopen = () => { socketReady = true; };
+  socket.onmessage = (event) => {
+    frameInFlight = false;
+    const data = JSON.parse(event.data);
+    if (!data.error) renderPrediction(data);
+  };
+  socket.onclose = () => {
+    // Server without streaming support (or connection lost): use POST instead
+    socket = null;
+    socketReady = false;
+    frameInFlight = false;
+  };
+}
+
 async function captureAndSend() {
   // Only process if video is playing and has valid data
   if (video.paused || video.ended || video.readyState < 2) return;
-
-  const ctx = canvas.getContext('2d');
-  ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
-  const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.9));
-  const form = new FormData();
-  form.append('image', blob, 'frame.jpg');
+  // Backpressure: skip this tick while the previous frame is still being processed
+  if (frameInFlight) return;
+  frameInFlight = true;
 
   try {
+    const ctx = canvas.getContext('2d');
+    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+    const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.9));
+
+    if (socketReady) {
+      socket.send(await blob.arrayBuffer());
+      return; // frameInFlight is cleared when the reply arrives
+    }
+
+    const form = new FormData();
+    form.append('image', blob, 'frame.jpg');
+    form.append('stream_id', streamId);
     const res = await fetch('/predict', { method: 'POST', body: form });
-    if (!res.ok) return;
-    const data = await res.json();
-
-    renderList(frictionEl, data.friction || []);
-    renderList(surfaceEl, data.surface || []);
-    renderList(unevenEl, data.uneven || []);
-    renderList(winterEl, data.winter || []);
-    renderList(rawEl, data.raw_top || []);
+    if (res.ok) renderPrediction(await res.json());
+    frameInFlight = false;
   } catch (err) {
+    frameInFlight = false;
     console.error("Prediction error:", err);
   }
 }
@@ -116,6 +156,7 @@ function stopProcessing() {
 
 function startProcessing() {
   stopProcessing();
+  openSocket();
   const interval = Math.max(100, parseInt(intervalInput.value || '500', 10));
   timerId = setInterval(captureAndSend, interval);
 }
@@ -0,0 +1,167 @@
+"""Per-stream temporal filtering of road-condition predictions.
+
+The road surface changes over seconds, while a camera delivers many frames
+per second. A TemporalEngine sits in front of the model for one stream and
+
+  - smooths the class probabilities over time (exponential moving average,
+    or an HMM forward filter with a "sticky" transition matrix),
+  - skips inference when a cheap change detector (mean absolute difference
+    of a tiny grayscale thumbnail) says the scene has not changed,
+  - adapts the inference interval to the confidence of the smoothed output:
+    confident and steady -> run rarely, uncertain -> run often.
+
+Usage:
+    engine = TemporalEngine(confidence=...)
+    if engine.should_infer(jpeg_bytes):
+        engine.update(model_probs)
+    engine.probs   # smoothed class probabilities
+"""
+
+import io
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+THUMB_SIZE = 16
+
+
+def frame_thumbnail(frame: bytes, size=THUMB_SIZE) -> np.ndarray:
+    """Tiny grayscale version of an encoded frame, for change detection.
+
+    JPEGs are decoded in draft mode at 1/8 scale, so this costs a small
+    fraction of a full decode.
+    """
+    image = Image.open(io.BytesIO(frame))
+    image.draft("L", (size * 4, size * 4))
+    image = image.convert("L").resize((size, size), Image.BOX)
+    return np.asarray(image, dtype=np.float32)
+
+
+class TemporalEngine:
+    def __init__(self, mode="ema", alpha=0.3, hmm_stay=0.95, change_threshold=8.0,
+                 min_interval_s=0.25, max_interval_s=3.0, low_confidence=0.5, high_confidence=0.9,
+                 confidence=None):
+        """
+        mode:             "ema" or "hmm".
+        alpha:            EMA weight of a new observation.
+        hmm_stay:         HMM probability of staying in the same class between inferences.
+        change_threshold: mean abs thumbnail difference (0-255) that counts as a new scene.
+        min/max_interval_s: bounds of the adaptive inference interval.
+        low/high_confidence: confidence at which the interval is min / max.
+        confidence:       callable(probs) -> [0, 1]; defaults to the top class probability.
+        """
+        if mode not in ("ema", "hmm"):
+            raise ValueError(f"Unknown smoothing mode: {mode}")
+        self.mode = mode
+        self.alpha = alpha
+        self.hmm_stay = hmm_stay
+        self.change_threshold = change_threshold
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max_interval_s
+        self.low_confidence = low_confidence
+        self.high_confidence = high_confidence
+        self.confidence_fn = confidence or (lambda probs: float(probs.max()))
+
+        self.probs = None
+        self.confidence = 0.0
+        self.interval_s = min_interval_s
+        self.last_reason = None
+        self.last_change = 0.0
+        self.frames = 0
+        self.inferences = 0
+        self.last_used = time.monotonic()
+
+        self._lock = threading.Lock()
+        self._reference = None   # thumbnail of the last inferred frame
+        self._candidate = None   # thumbnail of the frame waiting for update()
+        self._last_inference = None
+
+    def should_infer(self, frame: bytes, now=None) -> bool:
+        """Decide whether this frame needs a model run; if so, call update() with its output."""
+        now = time.monotonic() if now is None else now
+        thumb = frame_thumbnail(frame)
+        with self._lock:
+            self.frames += 1
+            self.last_used = now
+            self._candidate = thumb
+            if self.probs is None:
+                self.last_reason = "first"
+                return True
+
+            self.last_change = float(np.abs(thumb - self._reference).mean())
+            elapsed = now - self._last_inference
+            if elapsed < self.min_interval_s:
+                self.last_reason = "rate"
+                return False
+            if self.last_change >= self.change_threshold:
+                self.last_reason = "change"
+                return True
+            if elapsed >= self.interval_s:
+                self.last_reason = "interval"
+                return True
+            self.last_reason = "unchanged"
+            return False
+
+    def update(self, probs: np.ndarray, now=None) -> np.ndarray:
+        """Fold one model output (class probabilities) into the smoothed state."""
+        now = time.monotonic() if now is None else now
+        probs = np.asarray(probs, dtype=np.float64)
+        with self._lock:
+            if self.probs is None:
+                smoothed = probs
+            elif self.mode == "ema":
+                smoothed = self.alpha * probs + (1.0 - self.alpha) * self.probs
+            else:
+                # Forward step: sticky transition, then the model output as emission likelihood
+                prior = self.hmm_stay * self.probs + (1.0 - self.hmm_stay) / len(probs)
+                smoothed = prior * probs
+            self.probs = smoothed / smoothed.sum()
+
+            self.confidence = float(self.confidence_fn(self.probs))
+            span = self.high_confidence - self.low_confidence
+            frac = min(1.0, max(0.0, (self.confidence - self.low_confidence) / span)) if span > 0 else 1.0
+            self.interval_s = self.min_interval_s + frac * (self.max_interval_s - self.min_interval_s)
+
+            if self._candidate is not None:
+                self._reference = self._candidate
+            self._last_inference = now
+            self.inferences += 1
+            return self.probs
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "reason": self.last_reason,
+                "change": round(self.last_change, 2),
+                "confidence": round(self.confidence, 4),
+                "interval_s": round(self.interval_s, 3),
+                "frames": self.frames,
+                "inferences": self.inferences,
+            }
+
+
+class StreamRegistry:
+    """TemporalEngines by stream id, dropping streams idle for more than idle_s."""
+
+    def __init__(self, factory, idle_s=300.0):
+        self.factory = factory
+        self.idle_s = idle_s
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def get(self, stream_id) -> TemporalEngine:
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, e in self._engines.items() if now - e.last_used > self.idle_s]:
+                del self._engines[key]
+            engine = self._engines.get(stream_id)
+            if engine is None:
+                engine = self._engines[stream_id] = self.factory()
+            engine.last_used = now
+            return engine
+
+    def __len__(self):
+        return len(self._engines)
@@ -0,0 +1,291 @@
+"""Multi-process inference workers for production serving.
+
+Each worker process pins itself to one CPU core, builds its own onnxruntime
+session from the model bytes the parent read once, runs a warm-up inference and then handles decode, preprocessing
+and inference for the frames it is given. The parent only dispatches frames
+and groups the returned probabilities, so its GIL is no longer the
+bottleneck.
+
+Frames travel through shared-memory slots: the parent copies the encoded
+image into a free slot and sends just (slot, nbytes) over the task queue of
+the least busy worker; the worker writes the class probabilities back into the same slot.
+
+Workers are started with the "spawn" method: forking a parent that already
+runs Flask, onnxruntime and the micro-batcher threads can copy held locks
+into the child and deadlock it. If a worker dies, the frames it was working
+on fail with RuntimeError and their slots are freed.
+"""
+
+import atexit
+import io
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+# Default seconds run() waits for a free slot and for the result
+DEFAULT_TIMEOUT_S = 30.0
+# How often the result collector checks that the workers are alive
+LIVENESS_INTERVAL_S = 0.5
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _pin_to_core(core):
+    if core is None or not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        os.sched_setaffinity(0, {core})
+    except OSError:
+        pass
+
+
+def _worker_main(core, model_bytes, intra_op_threads, slot_names, max_frame_bytes, num_classes,
+                 tasks, results, ready):
+    _pin_to_core(core)
+
+    from PIL import Image
+    from inference import create_session, decode_resized, input_is_uint8, input_shape, normalize_into, softmax
+
+    session = create_session(model_bytes, intra_op_threads=intra_op_threads)
+    del model_bytes
+    input_name = session.get_inputs()[0].name
+    uint8 = input_is_uint8(session)
+    x = np.zeros(input_shape(1, uint8), dtype=np.uint8 if uint8 else np.float32)
+    session.run(None, {input_name: x})  # warm-up: first run allocates and plans
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    outputs = [
+        np.ndarray((num_classes,), dtype=np.float32, buffer=shm.buf, offset=max_frame_bytes)
+        for shm in slots
+    ]
+    ready.set()
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, nbytes = task
+            try:
+                t0 = time.perf_counter()
+                image = Image.open(io.BytesIO(slots[slot].buf[:nbytes]))
+                normalize_into(decode_resized(image), x[0], uint8)
+                t1 = time.perf_counter()
+                logits = session.run(None, {input_name: x})[0]
+                t2 = time.perf_counter()
+                outputs[slot][:] = softmax(logits)[0]
+                results.put((slot, None, 1000.0 * (t1 - t0), 1000.0 * (t2 - t1)))
+            except Exception as e:
+                results.put((slot, str(e), 0.0, 0.0))
+    finally:
+        del outputs
+        for shm in slots:
+            shm.close()
+
+
+class WorkerPool:
+    def __init__(self, model_path, num_classes, n_workers=None, intra_op_threads=1,
+                 slots_per_worker=2, max_frame_bytes=MAX_FRAME_BYTES, pin=True):
+        cores = _available_cores()
+        self.model_path = Path(model_path)
+        self.num_classes = num_classes
+        self.n_workers = n_workers or len(cores)
+        self.intra_op_threads = intra_op_threads
+        self.max_frame_bytes = max_frame_bytes
+        self.n_slots = self.n_workers * slots_per_worker
+        self.cores = [cores[i % len(cores)] for i in range(self.n_workers)] if pin else [None] * self.n_workers
+
+        self._processes = []
+        self._slots = []
+        self._outputs = []
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # Worker index each pending slot was sent to, and frames per worker
+        self._assigned = {}
+        self._load = []
+        self._task_queues = []
+        self._dead = set()
+        self._free = queue.Queue()
+        self._collector = None
+        self._completed = 0
+
+    def start(self, timeout=120.0):
+        """Start the workers and block until every one has finished its warm-up."""
+        ctx = mp.get_context("spawn")
+        model_bytes = self.model_path.read_bytes()
+
+        slot_size = self.max_frame_bytes + 4 * self.num_classes
+        for i in range(self.n_slots):
+            shm = shared_memory.SharedMemory(create=True, size=slot_size)
+            self._slots.append(shm)
+            self._outputs.append(
+                np.ndarray((self.num_classes,), dtype=np.float32, buffer=shm.buf, offset=self.max_frame_bytes)
+            )
+            self._free.put(i)
+
+        # One task queue per worker: a worker killed while waiting on a
+        # shared queue would take the queue's lock with it
+        self._results = ctx.Queue()
+        slot_names = [shm.name for shm in self._slots]
+        ready_events = []
+        for core in self.cores:
+            ready = ctx.Event()
+            tasks = ctx.Queue()
+            proc = ctx.Process(
+                target=_worker_main,
+                args=(core, model_bytes, self.intra_op_threads, slot_names, self.max_frame_bytes,
+                      self.num_classes, tasks, self._results, ready),
+                daemon=True,
+            )
+            proc.start()
+            self._processes.append(proc)
+            self._task_queues.append(tasks)
+            self._load.append(0)
+            ready_events.append(ready)
+
+        deadline = time.monotonic() + timeout
+        for proc, ready in zip(self._processes, ready_events):
+            if not ready.wait(max(0.0, deadline - time.monotonic())):
+                self.close()
+                raise RuntimeError(f"Inference worker {proc.pid} did not finish warm-up in {timeout} s")
+
+        self._collector = threading.Thread(target=self._collect, name="worker-pool-results", daemon=True)
+        self._collector.start()
+        atexit.register(self.close)
+        return self
+
+    def submit(self, frame: bytes, timeout=None) -> Future:
+        """
+        Queue one encoded frame; the future resolves to (probs, timing).
+        Waits at most `timeout` seconds for a free slot (TimeoutError).
+        """
+        if len(frame) > self.max_frame_bytes:
+            raise ValueError(f"Frame of {len(frame)} bytes exceeds max_frame_bytes={self.max_frame_bytes}")
+        if len(self._dead) == len(self._processes):
+            raise RuntimeError("All inference workers have died")
+        try:
+            slot = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free worker slot within {timeout} s") from None
+        self._slots[slot].buf[:len(frame)] = frame
+        future = Future()
+        with self._pending_lock:
+            live = [i for i in range(len(self._processes)) if i not in self._dead]
+            if not live:
+                self._free.put(slot)
+                raise RuntimeError("All inference workers have died")
+            worker = min(live, key=self._load.__getitem__)
+            self._pending[slot] = future
+            self._assigned[slot] = worker
+            self._load[worker] += 1
+        self._task_queues[worker].put((slot, len(frame)))
+        return future
+
+    def run(self, frame: bytes, timeout=DEFAULT_TIMEOUT_S):
+        """Probabilities and timing for one frame, waiting at most `timeout` seconds in total."""
+        deadline = time.monotonic() + timeout
+        future = self.submit(frame, timeout=timeout)
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+
+    def _collect(self):
+        next_check = time.monotonic() + LIVENESS_INTERVAL_S
+        while True:
+            try:
+                msg = self._results.get(timeout=LIVENESS_INTERVAL_S)
+            except queue.Empty:
+                msg = False
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + LIVENESS_INTERVAL_S
+            if msg is False:
+                continue
+            if msg is None:
+                return
+            slot, error, preprocess_ms, inference_ms = msg
+            with self._pending_lock:
+                future = self._pending.pop(slot, None)
+                if future is not None:
+                    self._load[self._assigned.pop(slot)] -= 1
+            if future is None:
+                # Already failed by _check_workers
+                continue
+            if error is not None:
+                probs = None
+            else:
+                probs = self._outputs[slot].copy()
+            self._free.put(slot)
+            self._completed += 1
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result((probs, {
+                    "preprocess_ms": round(preprocess_ms, 3),
+                    "inference_ms": round(inference_ms, 3),
+                }))
+
+    def _check_workers(self):
+        """Fail the frames of workers that died and free their slots."""
+        failed = []
+        with self._pending_lock:
+            dead = {i for i, proc in enumerate(self._processes) if i not in self._dead and not proc.is_alive()}
+            if not dead:
+                return
+            self._dead |= dead
+            for slot, worker in list(self._assigned.items()):
+                if worker in dead:
+                    del self._assigned[slot]
+                    self._load[worker] -= 1
+                    failed.append((slot, worker, self._pending.pop(slot)))
+        for slot, worker, future in failed:
+            self._free.put(slot)
+            future.set_exception(RuntimeError(
+                f"Inference worker {worker} exited (code {self._processes[worker].exitcode}) before finishing the frame"
+            ))
+
+    def metrics(self) -> dict:
+        self._check_workers()
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "workers": self.n_workers,
+            "alive": sum(p.is_alive() for p in self._processes),
+            "dead": sorted(self._dead),
+            "pending": pending,
+            "cores": self.cores,
+            "slots": self.n_slots,
+            "in_flight": self.n_slots - self._free.qsize(),
+            "completed": self._completed,
+        }
+
+    def close(self):
+        for tasks in self._task_queues:
+            tasks.put(None)
+        for proc in self._processes:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        if self._collector is not None:
+            self._results.put(None)
+            self._collector.join(timeout=5)
+            self._collector = None
+        self._outputs.clear()
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots.clear()
+        self._processes.clear()
+        self._task_queues.clear()
+        self._load.clear()
+        self._dead.clear()